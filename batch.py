@@ -0,0 +1,256 @@
+# Batch compressor: many images in one run, spread over a process pool, one .jpc per input in an output dir.
+#
+#    python3 batch.py frames/ "shots/**/*.png" one.bmp -o out/ [-q 50] [--sampling 4:2:0] [-j 8]
+#
+# directories are walked recursively and mirrored under the output dir, glob matches are mirrored below the
+# part of the pattern in front of the first wildcard ("shots/**/*.png" keeps the folders under shots/), single
+# files land at its top level. two inputs that would write the same .jpc (x.png and x.bmp, or the same name
+# given twice from different places) are a failure for the second one, nothing is overwritten.
+# files that are already up to date are skipped: by default when the .jpc is newer than the source
+# (--skip mtime), with --skip hash when the source sha256 and the settings match the manifest kept in the
+# output dir (survives copies and touches), --skip none recompresses everything.
+# --target-bytes / --target-psnr pick the quality per image (see rateControl.py) instead of one fixed -q.
+# --metrics results.jsonl measures every file against its decode (PSNR / SSIM per channel, see metrics.py) and
+# appends one JSON line per file, for size vs quality over a whole corpus; the report shows the means.
+
+import argparse
+import concurrent.futures
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+
+from codec import get_image, compress_image, compressed_to_bytes
+from chromaSubsampling import SAMPLING_FACTORS
+from jpcOptions import DEFAULT_QUALITY, DEFAULT_SAMPLING, DEFAULT_TILE_SIZE
+from parallel import make_executor, default_workers
+from main import print_size_comparison
+from rateControl import encode_to_target
+import metrics
+
+IMAGE_EXTENSIONS = (".bmp", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".ppm", ".gif", ".webp")
+MANIFEST_NAME = ".jpc-manifest.json"
+
+# the directories of a glob pattern in front of its first wildcard
+def _glob_root(pattern: str) -> str:
+   root = pattern
+   while any(c in root for c in "*?["):
+      root = os.path.dirname(root)
+   return root or "."
+
+# (source path, output path relative to the output dir) for every input, in order, each source once
+def collect_inputs(inputs, extensions=IMAGE_EXTENSIONS):
+   seen = set()
+   for item in inputs:
+      if os.path.isdir(item):
+         found = []
+         for root, dirs, files in os.walk(item):
+            dirs.sort()
+            found += [os.path.join(root, name) for name in sorted(files) if name.lower().endswith(extensions)]
+         pairs = [(path, os.path.relpath(path, item)) for path in found]
+      elif any(c in item for c in "*?["):
+         root = _glob_root(item)
+         pairs = [(path, os.path.relpath(path, root)) for path in sorted(glob.glob(item, recursive=True))
+                  if os.path.isfile(path)]
+      else:
+         pairs = [(item, os.path.basename(item))]
+
+      for path, relative in pairs:
+         key = os.path.abspath(path)
+         if key not in seen:
+            seen.add(key)
+            yield path, os.path.splitext(relative)[0] + ".jpc"
+
+def file_sha256(path: str) -> str:
+   digest = hashlib.sha256()
+   with open(path, "rb") as f:
+      for chunk in iter(lambda: f.read(1 << 20), b""):
+         digest.update(chunk)
+   return digest.hexdigest()
+
+# one file, runs in a pool worker; returns a small dict of sizes and timings for the report
+# known_hash is the manifest hash in hash mode ("" if there is none yet), None in the other modes
+# rate is None for a fixed quality, else the encode_to_target keywords ({"target_bytes": ..} or {"target_psnr": ..})
+# with_metrics adds the metrics.evaluate result of the decode under "metrics"
+def compress_file(source: str, target: str, quality: int, sampling: str, tile_size, known_hash=None,
+                  rate=None, with_metrics: bool = False) -> dict:
+   start = time.perf_counter()
+   result = {"source": source, "target": target, "source_bytes": os.path.getsize(source), "hash": None}
+   if known_hash is not None:
+      result["hash"] = file_sha256(source)
+      if result["hash"] == known_hash and os.path.exists(target):
+         result["status"] = "skipped"
+         return result
+
+   img = get_image(source)
+   if rate:
+      data, report = encode_to_target(img, sampling=sampling, tile_size=tile_size, **rate)
+      result["quality"] = report["quality"]
+      if with_metrics:
+         result["metrics"] = report["metrics"]
+   else:
+      compressed = compress_image(img, quality, sampling=sampling)
+      data = bytes(compressed_to_bytes(compressed, tile_size))
+      if with_metrics: # on the coefficients still in memory, nothing read back
+         result["metrics"] = metrics.evaluate(img, compressed)
+
+   # write next to the target and rename, so an interrupted run never leaves half a file behind
+   os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+   partial = target + ".partial"
+   with open(partial, "wb") as f:
+      f.write(data)
+   os.replace(partial, target)
+
+   width, height = img.size
+   result.update(status="compressed", pixels=width * height, raw_bytes=width * height * 3, jpc_bytes=len(data),
+                 seconds=time.perf_counter() - start)
+   return result
+
+def _load_manifest(path: str) -> dict:
+   try:
+      with open(path) as f:
+         return json.load(f)
+   except (OSError, ValueError):
+      return {}
+
+def _save_manifest(path: str, manifest: dict) -> None:
+   os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+   with open(path + ".partial", "w") as f:
+      json.dump(manifest, f)
+   os.replace(path + ".partial", path)
+
+# compress every input into output_dir; returns the totals dict that print_report shows
+def run_batch(inputs, output_dir: str, quality: int = DEFAULT_QUALITY, sampling: str = DEFAULT_SAMPLING,
+              tile_size=DEFAULT_TILE_SIZE, workers=None, skip: str = "mtime", verbose: bool = False,
+              rate=None, metrics_path=None) -> dict:
+   workers = workers or default_workers()
+   settings = [quality, sampling, tile_size] + ([rate] if rate else [])
+   manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+   manifest = _load_manifest(manifest_path) if skip == "hash" else {}
+
+   totals = {"compressed": 0, "skipped": 0, "failed": 0, "pixels": 0, "source_bytes": 0, "raw_bytes": 0,
+             "jpc_bytes": 0, "errors": [], "measured": 0, "psnr_y": 0.0, "psnr": 0.0, "ssim": 0.0}
+   metrics_file = open(metrics_path, "a") if metrics_path else None
+   start = time.perf_counter()
+
+   def finish(future, source, relative):
+      try:
+         result = future.result()
+      except Exception as error: # one bad file shouldnt stop a nightly run
+         totals["failed"] += 1
+         totals["errors"].append((source, repr(error)))
+         print(f"failed: {source}: {error}", file=sys.stderr)
+         return
+      if result["hash"] is not None:
+         manifest[relative] = {"sha256": result["hash"], "settings": settings}
+      if result["status"] == "skipped":
+         totals["skipped"] += 1
+         return
+      totals["compressed"] += 1
+      for key in ("pixels", "source_bytes", "raw_bytes", "jpc_bytes"):
+         totals[key] += result[key]
+      if "metrics" in result:
+         quality_metrics = result["metrics"]
+         totals["measured"] += 1
+         totals["psnr_y"] += quality_metrics["y"]["psnr"]
+         totals["psnr"] += quality_metrics["combined"]["psnr"]
+         totals["ssim"] += quality_metrics["combined"]["ssim"]
+         metrics_file.write(json.dumps({
+            "source": source, "jpc_bytes": result["jpc_bytes"], "pixels": result["pixels"],
+            "bpp": result["jpc_bytes"] * 8 / result["pixels"], "quality": result.get("quality", quality),
+            "sampling": sampling, **quality_metrics,
+         }) + "\n")
+      if verbose:
+         chosen = f", q{result['quality']}" if "quality" in result else ""
+         print(f"{result['source']} -> {result['target']} ({result['source_bytes']} -> {result['jpc_bytes']} bytes"
+               f"{chosen}, {result['seconds']:.2f}s)")
+      if totals["compressed"] % 1000 == 0:
+         print(f"{totals['compressed']} compressed, {totals['skipped']} skipped, {totals['failed']} failed")
+         if skip == "hash":
+            _save_manifest(manifest_path, manifest)
+
+   # only a few jobs in flight at a time, so millions of inputs never sit in memory as futures
+   pending = {}
+   written_by = {} # output path -> the source that owns it
+   with make_executor(workers, use_threads=False) as pool:
+      for source, relative in collect_inputs(inputs):
+         target = os.path.join(output_dir, relative)
+         owner = written_by.setdefault(os.path.normcase(os.path.abspath(target)), source)
+         if owner != source:
+            totals["failed"] += 1
+            totals["errors"].append((source, f"same output as {owner}"))
+            print(f"failed: {source}: would overwrite {target} from {owner}", file=sys.stderr)
+            continue
+         known_hash = None
+         if skip == "mtime":
+            if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+               totals["skipped"] += 1
+               continue
+         elif skip == "hash":
+            entry = manifest.get(relative, {})
+            known_hash = entry.get("sha256", "") if entry.get("settings") == settings else ""
+
+         future = pool.submit(compress_file, source, target, quality, sampling, tile_size, known_hash, rate,
+                              metrics_file is not None)
+         pending[future] = (source, relative)
+         if len(pending) >= workers * 4:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+               finish(future, *pending.pop(future))
+      for future in concurrent.futures.as_completed(list(pending)):
+         finish(future, *pending.pop(future))
+
+   if skip == "hash":
+      _save_manifest(manifest_path, manifest)
+   if metrics_file is not None:
+      metrics_file.close()
+   totals["seconds"] = time.perf_counter() - start
+   return totals
+
+# throughput and the same size comparison main.py prints for a single file, over everything compressed
+def print_report(totals: dict) -> None:
+   seconds = max(totals["seconds"], 1e-9)
+   print(f"\n{totals['compressed']} compressed, {totals['skipped']} up to date, {totals['failed']} failed "
+         f"in {totals['seconds']:.2f}s")
+   if not totals["compressed"]:
+      return
+   print("\nThroughput:")
+   print(f"  Images / s          : {totals['compressed'] / seconds:.2f}")
+   print(f"  Input MB / s        : {totals['source_bytes'] / seconds / 1e6:.2f}")
+   print(f"  Raw RGB MB / s      : {totals['raw_bytes'] / seconds / 1e6:.2f}")
+   print(f"  Megapixels / s      : {totals['pixels'] / seconds / 1e6:.2f}")
+   print_size_comparison(totals["raw_bytes"], totals["source_bytes"], totals["jpc_bytes"])
+   if totals["measured"]:
+      measured = totals["measured"]
+      print(f"\nQuality (mean over {measured} files):")
+      print(f"  PSNR Y / combined   : {totals['psnr_y'] / measured:.2f} / {totals['psnr'] / measured:.2f} dB")
+      print(f"  SSIM combined       : {totals['ssim'] / measured:.4f}")
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Compress many images to .jpc files on a process pool.")
+   parser.add_argument("inputs", nargs="+", help="image files, directories or glob patterns (quote them)")
+   parser.add_argument("-o", "--output", required=True, help="output directory")
+   parser.add_argument("-q", "--quality", type=int, default=DEFAULT_QUALITY, help="1 to 100 (default %(default)s)")
+   target = parser.add_mutually_exclusive_group()
+   target.add_argument("--target-bytes", type=int, help="largest quality whose .jpc fits in this many bytes")
+   target.add_argument("--target-psnr", type=float, help="smallest quality reaching this luma PSNR in dB")
+   parser.add_argument("--sampling", default=DEFAULT_SAMPLING, choices=list(SAMPLING_FACTORS))
+   parser.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE, help="tile edge in pixels, 0 for one tile")
+   parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default one per core)")
+   parser.add_argument("--skip", choices=("mtime", "hash", "none"), default="mtime",
+                       help="how to tell a file is up to date (default %(default)s)")
+   parser.add_argument("--metrics", metavar="JSONL", help="measure PSNR / SSIM of every file, one JSON line each")
+   parser.add_argument("-v", "--verbose", action="store_true", help="print every file")
+   args = parser.parse_args(argv)
+
+   rate = {"target_bytes": args.target_bytes} if args.target_bytes else \
+          {"target_psnr": args.target_psnr} if args.target_psnr else None
+   totals = run_batch(args.inputs, args.output, args.quality, args.sampling, args.tile_size or None,
+                      args.workers, args.skip, args.verbose, rate, args.metrics)
+   print_report(totals)
+   return 1 if totals["failed"] else 0
+
+if __name__ == "__main__":
+   sys.exit(main())
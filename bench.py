@@ -0,0 +1,369 @@
+# Benchmark harness: times every pipeline stage on its own, on synthetic and sample images from 256 x 256 up
+# to 8K, and reports MPix/s per stage plus memory. Results can be saved as a JSON baseline and later runs
+# compared against it; any stage that got slower than the threshold fails the run (exit code 1).
+#
+#    python3 bench.py                                    # 256, 512, 1024, 2048 squares
+#    python3 bench.py --sizes 1024,4k,8k --save baseline.json
+#    python3 bench.py --compare baseline.json --threshold 0.15
+#    python3 bench.py --reference                        # old per pixel / per block functions vs the batched ones
+#    python3 bench.py --rd 10,30,50,75,90                # size vs quality (bits per pixel, PSNR, SSIM) per image
+#    python3 bench.py --startup                          # ms from process start to exit for cli.py commands
+#
+# every stage runs on the previous stage's real output (luma plane for the per channel stages) and is
+# timed best of several runs. peak MB is what the stage allocates (tracemalloc, measured in a separate
+# run so it doesnt slow the timings), peak RSS is the whole process high water mark so far.
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from PIL import Image
+
+from colorConversion import rgb_to_ycbcr_array, ycbcr_to_rgb_array, rgb_to_ycbcr_pixel
+from twoDDCT import blockify_view, unblockify_view, dct_2d_blocks, idct_2d_blocks, dct_2d
+from quantization import quantize_blocks, dequantize_blocks, quantize_block, quality_tables
+from jpcOptions import DEFAULT_QUALITY
+from entropyEncoding import (
+   zigzag_scan_blocks,
+   inverse_zigzag_scan_blocks,
+   rle_encode_blocks,
+   rle_decode_blocks,
+   rle_encode,
+   zigzag_scan,
+)
+from codec import (
+   block_size,
+   compress_image,
+   compressed_to_bytes,
+   save_compressed,
+   read_JPC_file,
+   encode,
+   decode,
+   transform_channel,
+   decompress_zigzag,
+)
+import metrics
+
+DEFAULT_SIZES = "256,512,1024,2048"
+NAMED_SIZES = {"4k": (3840, 2160), "8k": (7680, 4320)}
+DEFAULT_THRESHOLD = 0.10 # 10% slower than the baseline fails
+# sample photo; the input.bmp main.py compresses if there is one, else the png that ships with the repo
+SAMPLE_PATHS = [os.path.join(os.path.dirname(os.path.abspath(__file__)), name) for name in ("input.bmp", "color_form_jpc.png")]
+
+# "256" -> 256 x 256, "4k" / "8k", or "1920x1080"
+def parse_size(text: str):
+   text = text.strip().lower()
+   if text in NAMED_SIZES:
+      return NAMED_SIZES[text]
+   if "x" in text:
+      width, height = text.split("x")
+      return int(width), int(height)
+   return int(text), int(text)
+
+# smooth gradients, a few edges and some noise; the same pixels every run
+def synthetic_image(width: int, height: int) -> np.ndarray:
+   rng = np.random.default_rng(width * 10007 + height)
+   y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+   r = 128 + 100 * np.sin(x / 37) * np.cos(y / 53)
+   g = 255 * x / max(width - 1, 1)
+   b = np.where((x // 64 + y // 64) % 2 == 0, 60, 190).astype(np.float32)
+   rgb = np.stack([r, g, b], axis=-1) + rng.normal(0, 6, (height, width, 3))
+   return np.clip(np.rint(rgb), 0, 255).astype(np.uint8)
+
+# the sample photo scaled to the size, None if there isnt one
+def sample_image(width: int, height: int):
+   for path in SAMPLE_PATHS:
+      if os.path.exists(path):
+         with Image.open(path) as img:
+            return np.asarray(img.convert("RGB").resize((width, height), Image.BICUBIC))
+   return None
+
+# (name, function) for every stage; the inputs each one needs are prepared up front
+def pipeline_stages(rgb: np.ndarray, quality: int, path: str):
+   height, width = rgb.shape[:2]
+   luma_q, _ = quality_tables(quality)
+   ycbcr = rgb_to_ycbcr_array(rgb)
+   y_plane = np.ascontiguousarray(ycbcr[..., 0], dtype=np.float32)
+   blocks = blockify_view(y_plane, block_size, pad_mode="edge")
+   coefficients = dct_2d_blocks(blocks).reshape(-1, block_size, block_size)
+   quantized = quantize_blocks(coefficients, luma_q)
+   zz = zigzag_scan_blocks(quantized)
+   rle = rle_encode_blocks(zz)
+   dequantized = dequantize_blocks(quantized, luma_q)
+   pixels = idct_2d_blocks(dequantized)
+   decoded_ycbcr = ycbcr.astype(np.float32)
+   compressed = compress_image(rgb, quality)
+   save_compressed(compressed, path)
+   with open(path, "rb") as f:
+      jpc = f.read()
+
+   return [
+      ("colour_convert", lambda: rgb_to_ycbcr_array(rgb)),
+      ("blockify", lambda: np.ascontiguousarray(blockify_view(y_plane, block_size, pad_mode="edge"))),
+      ("dct", lambda: dct_2d_blocks(blocks)),
+      ("quantize", lambda: quantize_blocks(coefficients, luma_q)),
+      ("zigzag_rle", lambda: rle_encode_blocks(zigzag_scan_blocks(quantized))),
+      ("save_compressed", lambda: save_compressed(compressed, path)),
+      ("read_JPC_file", lambda: read_JPC_file(path)),
+      ("rle_unzigzag", lambda: inverse_zigzag_scan_blocks(rle_decode_blocks(*rle))),
+      ("dequantize", lambda: dequantize_blocks(quantized, luma_q)),
+      ("idct", lambda: idct_2d_blocks(dequantized)),
+      ("unblockify", lambda: np.ascontiguousarray(unblockify_view(pixels, height, width))),
+      ("ycbcr_to_rgb", lambda: ycbcr_to_rgb_array(decoded_ycbcr)),
+      # whole lossy step of one plane, float matrix DCT vs integer AAN (integerDCT.py)
+      ("transform_float", lambda: transform_channel(y_plane, luma_q)),
+      ("transform_int", lambda: transform_channel(y_plane, luma_q, "int")),
+      ("inverse_float", lambda: decompress_zigzag(zz, luma_q, width, height, block_size)),
+      ("inverse_int", lambda: decompress_zigzag(zz, luma_q, width, height, block_size, "int")),
+      ("encode", lambda: encode(rgb, quality)),
+      ("decode", lambda: decode(jpc)),
+      ("encode_int", lambda: encode(rgb, quality, transform="int")),
+      ("decode_int", lambda: decode(jpc, transform="int")),
+   ]
+
+# best of at least `repeat` runs (more for fast stages, until min_time has passed)
+def time_stage(function, repeat: int = 3, min_time: float = 0.2) -> float:
+   best = float("inf")
+   runs = 0
+   started = time.perf_counter()
+   while runs < repeat or (time.perf_counter() - started < min_time and runs < 1000):
+      start = time.perf_counter()
+      function()
+      best = min(best, time.perf_counter() - start)
+      runs += 1
+   return best
+
+# bytes the stage allocates at its peak
+def stage_peak_bytes(function) -> int:
+   tracemalloc.start()
+   try:
+      function()
+      return tracemalloc.get_traced_memory()[1]
+   finally:
+      tracemalloc.stop()
+
+# process high water mark in MB (linux reports kB, macOS bytes)
+def peak_rss_mb() -> float:
+   peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+   return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+def run_benchmarks(sizes, images=("synthetic", "sample"), quality: int = DEFAULT_QUALITY, repeat: int = 3,
+                   min_time: float = 0.2, stages=None) -> list:
+   results = []
+   with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, "bench.jpc")
+      for width, height in sizes:
+         for kind in images:
+            rgb = synthetic_image(width, height) if kind == "synthetic" else sample_image(width, height)
+            if rgb is None:
+               continue
+            megapixels = width * height / 1e6
+            for name, function in pipeline_stages(rgb, quality, path):
+               if stages and name not in stages:
+                  continue
+               seconds = time_stage(function, repeat, min_time)
+               result = {
+                  "image": kind,
+                  "size": f"{width}x{height}",
+                  "stage": name,
+                  "seconds": seconds,
+                  "mpix_s": megapixels / seconds,
+                  "peak_mb": stage_peak_bytes(function) / 1e6,
+                  "rss_mb": peak_rss_mb(),
+               }
+               results.append(result)
+               print(f"{kind:9} {result['size']:>10} {name:16} {seconds * 1000:10.2f} ms {result['mpix_s']:10.2f} MPix/s "
+                     f"{result['peak_mb']:9.1f} MB peak {result['rss_mb']:9.1f} MB rss", flush=True)
+   return results
+
+# the old per pixel / per block python functions against the batched ones on a small image:
+# speedup and largest difference, so the fast paths can be checked against what they replaced
+def run_reference(size: int = 64, quality: int = DEFAULT_QUALITY) -> list:
+   rgb = synthetic_image(size, size)
+   luma_q, _ = quality_tables(quality)
+   ycbcr = rgb_to_ycbcr_array(rgb)
+   blocks = blockify_view(ycbcr[..., 0].astype(np.float32), block_size, pad_mode="edge").reshape(-1, block_size, block_size)
+   coefficients = dct_2d_blocks(blocks)
+   quantized = quantize_blocks(coefficients, luma_q)
+   zz = zigzag_scan_blocks(quantized)
+
+   def reference_colour():
+      return np.array([[rgb_to_ycbcr_pixel(*map(int, pixel)) for pixel in row] for row in rgb])
+
+   def reference_dct():
+      return np.array([dct_2d(block) for block in blocks])
+
+   def reference_quantize():
+      return np.array([quantize_block(block.tolist(), luma_q.tolist()) for block in coefficients])
+
+   def reference_rle():
+      return [rle_encode(zigzag_scan(block.tolist())) for block in quantized]
+
+   checks = [
+      ("colour_convert", reference_colour, lambda: rgb_to_ycbcr_array(rgb)),
+      ("dct", reference_dct, lambda: dct_2d_blocks(blocks)),
+      ("quantize", reference_quantize, lambda: quantize_blocks(coefficients, luma_q)),
+      ("zigzag_rle", reference_rle, lambda: rle_encode_blocks(zz)),
+   ]
+   results = []
+   for name, slow, fast in checks:
+      slow_seconds = time_stage(slow, 1, 0)
+      fast_seconds = time_stage(fast)
+      slow_out, fast_out = slow(), fast()
+      if name == "zigzag_rle":
+         difference = 0 if [list(map(tuple, b)) for b in slow_out] == _rle_pairs(fast_out) else 1
+      else:
+         difference = float(np.max(np.abs(np.asarray(slow_out, dtype=np.float64) - fast_out)))
+      results.append({"stage": name, "reference_s": slow_seconds, "batched_s": fast_seconds,
+                      "speedup": slow_seconds / fast_seconds, "max_difference": difference})
+      print(f"reference {name:16} {slow_seconds * 1000:10.2f} ms -> {fast_seconds * 1000:8.3f} ms "
+            f"({slow_seconds / fast_seconds:8.0f}x)  max difference {difference:g}")
+   return results
+
+# rate / distortion: bytes, bits per pixel and decoded quality of every image at every quality
+def run_rate_distortion(sizes, images=("synthetic", "sample"), qualities=(10, 30, 50, 75, 90),
+                        sampling: str = "4:4:4") -> list:
+   rows = []
+   print(f"\n{'image':9} {'size':>10} {'q':>4} {'bytes':>10} {'bpp':>7} {'PSNR Y':>8} {'PSNR':>8} {'SSIM':>7}")
+   for width, height in sizes:
+      for kind in images:
+         rgb = synthetic_image(width, height) if kind == "synthetic" else sample_image(width, height)
+         if rgb is None:
+            continue
+         for quality in qualities:
+            compressed = compress_image(rgb, quality, sampling=sampling)
+            size = len(compressed_to_bytes(compressed))
+            result = metrics.evaluate(rgb, compressed)
+            row = {
+               "image": kind,
+               "size": f"{width}x{height}",
+               "quality": quality,
+               "sampling": sampling,
+               "bytes": size,
+               "bpp": size * 8 / (width * height),
+               "psnr_y": result["y"]["psnr"],
+               "psnr": result["combined"]["psnr"],
+               "ssim": result["combined"]["ssim"],
+            }
+            rows.append(row)
+            print(f"{kind:9} {row['size']:>10} {quality:4} {size:10} {row['bpp']:7.3f} {row['psnr_y']:8.2f} "
+                  f"{row['psnr']:8.2f} {row['ssim']:7.4f}", flush=True)
+   return rows
+
+# wall time of fresh processes, best of repeat: the bare interpreter, then cli.py info / decode on a small file,
+# so what the imports cost stays visible (info should stay close to the bare interpreter)
+def run_startup(repeat: int = 5) -> list:
+   cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+   rows = []
+   with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, "startup.jpc")
+      with open(path, "wb") as f:
+         f.write(encode(synthetic_image(64, 64)))
+      commands = {
+         "python": [sys.executable, "-c", "pass"],
+         "cli_info": [sys.executable, cli, "info", path],
+         "cli_decode": [sys.executable, cli, "decode", path, "-o", os.path.join(tmp, "startup.png")],
+      }
+      print(f"\n{'command':12} {'ms':>9}")
+      for name, command in commands.items():
+         best = float("inf")
+         for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            best = min(best, time.perf_counter() - start)
+         rows.append({"command": name, "ms": best * 1000})
+         print(f"{name:12} {best * 1000:9.1f}")
+   return rows
+
+def _rle_pairs(rle):
+   runs, values, offsets = (a.tolist() for a in rle)
+   pairs = list(zip(runs, values))
+   return [pairs[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+def save_baseline(path: str, results: list, args, rate_distortion=None, startup=None) -> None:
+   with open(path, "w") as f:
+      json.dump({
+         "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+         "machine": platform.machine(),
+         "processor": platform.processor(),
+         "cpus": os.cpu_count(),
+         "python": platform.python_version(),
+         "numpy": np.__version__,
+         "quality": args.quality,
+         "results": results,
+         "rate_distortion": rate_distortion or [],
+         "startup": startup or [],
+      }, f, indent=1)
+
+# start ups that got more than threshold slower than the baseline; [(command, baseline ms, now ms)]
+def find_startup_regressions(baseline: dict, startup: list, threshold: float = DEFAULT_THRESHOLD) -> list:
+   before = {r["command"]: r["ms"] for r in baseline.get("startup", [])}
+   return [(r["command"], before[r["command"]], r["ms"]) for r in startup
+           if r["command"] in before and r["ms"] > before[r["command"]] * (1 + threshold)]
+
+# stages that lost more than threshold of their baseline throughput; [(key, baseline, now)]
+def find_regressions(baseline: dict, results: list, threshold: float = DEFAULT_THRESHOLD) -> list:
+   before = {(r["image"], r["size"], r["stage"]): r["mpix_s"] for r in baseline["results"]}
+   regressions = []
+   for r in results:
+      key = (r["image"], r["size"], r["stage"])
+      if key in before and r["mpix_s"] < before[key] * (1 - threshold):
+         regressions.append((key, before[key], r["mpix_s"]))
+   return regressions
+
+def main(argv=None) -> int:
+   parser = argparse.ArgumentParser(description="Time every .jpc pipeline stage.")
+   parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma list: 256, 1920x1080, 4k, 8k (default %(default)s)")
+   parser.add_argument("--images", default="synthetic,sample", help="synthetic and / or sample")
+   parser.add_argument("--stages", default=None, help="comma list of stage names to run (default all)")
+   parser.add_argument("-q", "--quality", type=int, default=DEFAULT_QUALITY)
+   parser.add_argument("--repeat", type=int, default=3, help="runs per stage, best one counts")
+   parser.add_argument("--min-time", type=float, default=0.2, help="keep repeating fast stages for this long")
+   parser.add_argument("--save", metavar="JSON", help="write the results as a baseline")
+   parser.add_argument("--compare", metavar="JSON", help="fail if a stage is slower than this baseline")
+   parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                       help="allowed slowdown as a fraction (default %(default)s)")
+   parser.add_argument("--reference", action="store_true", help="also time the per pixel / per block reference code")
+   parser.add_argument("--rd", metavar="QUALITIES", help="comma list of qualities: bytes, bpp, PSNR and SSIM at each")
+   parser.add_argument("--sampling", default="4:4:4", help="chroma sampling for --rd (default %(default)s)")
+   parser.add_argument("--startup", action="store_true", help="also time cli.py start up in fresh processes")
+   args = parser.parse_args(argv)
+
+   sizes = [parse_size(s) for s in args.sizes.split(",")]
+   stages = set(args.stages.split(",")) if args.stages else None
+   results = run_benchmarks(sizes, args.images.split(","), args.quality, args.repeat, args.min_time, stages)
+   if args.reference:
+      run_reference(quality=args.quality)
+   rate_distortion = None
+   if args.rd:
+      rate_distortion = run_rate_distortion(sizes, args.images.split(","), [int(q) for q in args.rd.split(",")],
+                                            args.sampling)
+   startup = run_startup(args.repeat) if args.startup else None
+   print(f"\npeak RSS {peak_rss_mb():.1f} MB")
+
+   if args.save:
+      save_baseline(args.save, results, args, rate_distortion, startup)
+      print("saved baseline to", args.save)
+   if args.compare:
+      with open(args.compare) as f:
+         baseline = json.load(f)
+      regressions = find_regressions(baseline, results, args.threshold)
+      for (image, size, stage), before, now in regressions:
+         print(f"REGRESSION {image} {size} {stage}: {before:.2f} -> {now:.2f} MPix/s ({now / before - 1:+.0%})")
+      startup_regressions = find_startup_regressions(baseline, startup or [], args.threshold)
+      for command, before, now in startup_regressions:
+         print(f"REGRESSION start up {command}: {before:.1f} -> {now:.1f} ms ({now / before - 1:+.0%})")
+      if regressions or startup_regressions:
+         return 1
+      print(f"no stage regressed more than {args.threshold:.0%} against {args.compare}")
+   return 0
+
+if __name__ == "__main__":
+   sys.exit(main())
@@ -0,0 +1,77 @@
+# Chroma subsampling; Cb and Cr carry much less visible detail than Y, so they can be stored at half
+# the width (4:2:2) or half the width and height (4:2:0) and scaled back up before YCbCr -> RGB.
+# Everything works on whole planes with numpy slicing, no per pixel loops.
+
+from typing import Tuple
+import numpy as np
+
+# (horizontal, vertical) chroma reduction factor for each mode
+SAMPLING_FACTORS = {
+   "4:4:4": (1, 1),
+   "4:2:2": (2, 1),
+   "4:2:0": (2, 2),
+}
+# byte stored in the .jpc header for each mode
+SAMPLING_CODES = {"4:4:4": 0, "4:2:2": 1, "4:2:0": 2}
+SAMPLING_NAMES = {code: name for name, code in SAMPLING_CODES.items()}
+
+def sampling_factors(mode: str) -> Tuple[int, int]:
+   if mode not in SAMPLING_FACTORS:
+      raise ValueError(f"Unknown chroma sampling {mode!r}, expected one of {', '.join(SAMPLING_FACTORS)}")
+   return SAMPLING_FACTORS[mode]
+
+# size of the chroma planes for an image of width x height
+def chroma_size(width: int, height: int, mode: str) -> Tuple[int, int]:
+   fx, fy = sampling_factors(mode)
+   return -(-width // fx), -(-height // fy)
+
+# halve one axis; "box" averages each pair, "triangle" is the 4 tap (1, 3, 3, 1) / 8 filter centred on the pair
+def _halve(plane: np.ndarray, axis: int, filter: str) -> np.ndarray:
+   plane = np.moveaxis(plane, axis, 0)
+   if plane.shape[0] % 2: # odd length, repeat the last line
+      plane = np.concatenate([plane, plane[-1:]])
+   even, odd = plane[0::2], plane[1::2]
+   if filter == "box":
+      out = (even + odd) * 0.5
+   elif filter == "triangle":
+      before = np.concatenate([even[:1], odd[:-1]]) # pixel left of each pair (edge repeated)
+      after = np.concatenate([even[1:], odd[-1:]]) # pixel right of each pair (edge repeated)
+      out = (before + 3 * even + 3 * odd + after) * 0.125
+   else:
+      raise ValueError(f"Unknown filter {filter!r}")
+   return np.moveaxis(out, 0, axis)
+
+# double one axis; "box" repeats every sample, "triangle" interpolates 3/4 nearest + 1/4 next (libjpeg fancy upsampling)
+def _double(plane: np.ndarray, axis: int, filter: str) -> np.ndarray:
+   plane = np.moveaxis(plane, axis, 0)
+   if filter == "box":
+      out = np.repeat(plane, 2, axis=0)
+   elif filter == "triangle":
+      before = np.concatenate([plane[:1], plane[:-1]])
+      after = np.concatenate([plane[1:], plane[-1:]])
+      out = np.empty((plane.shape[0] * 2,) + plane.shape[1:], dtype=plane.dtype)
+      out[0::2] = 0.75 * plane + 0.25 * before
+      out[1::2] = 0.75 * plane + 0.25 * after
+   else:
+      raise ValueError(f"Unknown filter {filter!r}")
+   return np.moveaxis(out, 0, axis)
+
+# shrink a full resolution chroma plane for the given mode; returns float32
+def downsample(plane, mode: str, filter: str = "box") -> np.ndarray:
+   fx, fy = sampling_factors(mode)
+   plane = np.asarray(plane, dtype=np.float32)
+   if fx == 2:
+      plane = _halve(plane, 1, filter)
+   if fy == 2:
+      plane = _halve(plane, 0, filter)
+   return plane
+
+# grow a chroma plane back to width x height; returns float32
+def upsample(plane, mode: str, width: int, height: int, filter: str = "triangle") -> np.ndarray:
+   fx, fy = sampling_factors(mode)
+   plane = np.asarray(plane, dtype=np.float32)
+   if fy == 2:
+      plane = _double(plane, 0, filter)
+   if fx == 2:
+      plane = _double(plane, 1, filter)
+   return plane[:height, :width]
@@ -0,0 +1,116 @@
+# One command line for the codec, quick to start: only argparse and the standard library load up front, and
+# every subcommand imports what it needs when it runs (info reads the 26 byte fixed header and never imports
+# numpy or Pillow). nothing pops up a window unless asked with --show.
+#
+#    python3 cli.py encode input.bmp [-o out.jpc] [-q 50] [--sampling 4:2:0] [--transform int] [--progressive]
+#    python3 cli.py decode out.jpc [-o view.png] [--scale 2|4|8] [--transform int] [--show]
+#    python3 cli.py info a.jpc [b.jpc ...]
+#    python3 cli.py bench [bench.py options]
+#    python3 cli.py serve [server.py options]          # HTTP encode / decode service
+#
+# python3 bench.py --startup times these start ups (bare interpreter, info, decode) so they can be tracked
+
+import argparse
+import os
+import sys
+
+# option values and defaults without numpy, so --help doesnt have to import the codec
+from jpcOptions import DEFAULT_QUALITY, SAMPLINGS, TRANSFORMS, SCALES, DEFAULT_TILE_SIZE
+
+def encode_command(args) -> int:
+   import codec
+
+   output = args.output or os.path.splitext(args.input)[0] + ".jpc"
+   with open(output, "wb") as f:
+      written = codec.encode_to(args.input, f, args.quality, args.workers, sampling=args.sampling,
+                                tile_size=args.tile_size or None, transform=args.transform,
+                                progressive=args.progressive)
+   print(f"{args.input} -> {output}: {written} bytes ({os.path.getsize(args.input) / written:.2f}:1)")
+   return 0
+
+def decode_command(args) -> int:
+   import codec
+   from PIL import Image
+
+   output = args.output or os.path.splitext(args.input)[0] + ".png"
+   image = Image.fromarray(codec.decode(args.input, args.workers, scale=args.scale, transform=args.transform))
+   image.save(output)
+   print(f"{args.input} -> {output}: {image.width} x {image.height}")
+   if args.show: # opt in; can start an external viewer
+      image.show()
+   return 0
+
+def info_command(args) -> int:
+   from jpcHeader import header_struct, read_fixed_header
+
+   status = 0
+   for path in args.files:
+      try:
+         with open(path, "rb") as f:
+            header = read_fixed_header(f.read(header_struct.size))
+      except (OSError, ValueError) as error:
+         print(f"{path}: {error}", file=sys.stderr)
+         status = 1
+         continue
+      y_count, cb_count, cr_count = header["block_counts"]
+      print(f"{path}: JPCS v{header['version']}, {header['width']} x {header['height']}, "
+            f"{header['block_size']} x {header['block_size']} blocks (Y {y_count}, Cb {cb_count}, Cr {cr_count}), "
+            f"{os.path.getsize(path)} bytes")
+   return status
+
+def bench_command(args) -> int:
+   import bench
+
+   return bench.main(args.passthrough)
+
+def serve_command(args) -> int:
+   import server
+
+   return server.main(args.passthrough)
+
+def build_parser() -> argparse.ArgumentParser:
+   parser = argparse.ArgumentParser(prog="cli.py", description="Encode, decode and inspect .jpc files.")
+   commands = parser.add_subparsers(dest="command", required=True)
+
+   encode = commands.add_parser("encode", help="compress an image to .jpc")
+   encode.add_argument("input", help="any image Pillow can open")
+   encode.add_argument("-o", "--output", help="output .jpc (default: input name with .jpc)")
+   encode.add_argument("-q", "--quality", type=int, default=DEFAULT_QUALITY, help="1 to 100 (default %(default)s)")
+   encode.add_argument("--sampling", default=SAMPLINGS[0], choices=SAMPLINGS)
+   encode.add_argument("--transform", default=TRANSFORMS[0], choices=TRANSFORMS)
+   encode.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE, help="tile edge in pixels, 0 for one tile")
+   encode.add_argument("--progressive", action="store_true", help="DC first, then AC bands (decodes from a prefix)")
+   encode.add_argument("-j", "--workers", type=int, default=1, help="worker processes")
+   encode.set_defaults(run=encode_command)
+
+   decode = commands.add_parser("decode", help="decompress a .jpc to an image file")
+   decode.add_argument("input", help=".jpc file")
+   decode.add_argument("-o", "--output", help="output image (default: input name with .png)")
+   decode.add_argument("--scale", type=int, default=1, choices=SCALES, help="decode at 1/scale size")
+   decode.add_argument("--transform", default=TRANSFORMS[0], choices=TRANSFORMS)
+   decode.add_argument("--show", action="store_true", help="also open the result in the system image viewer")
+   decode.add_argument("-j", "--workers", type=int, default=1, help="worker processes")
+   decode.set_defaults(run=decode_command)
+
+   info = commands.add_parser("info", help="print the fixed header of .jpc files (no decoding)")
+   info.add_argument("files", nargs="+")
+   info.set_defaults(run=info_command)
+
+   bench = commands.add_parser("bench", help="run bench.py with the remaining arguments", add_help=False)
+   bench.set_defaults(run=bench_command)
+
+   serve = commands.add_parser("serve", help="run server.py with the remaining arguments", add_help=False)
+   serve.set_defaults(run=serve_command)
+   return parser
+
+def main(argv=None) -> int:
+   parser = build_parser()
+   args, extra = parser.parse_known_args(argv)
+   if args.run in (bench_command, serve_command): # everything after bench / serve is bench.py's / server.py's
+      args.passthrough = extra
+   elif extra:
+      parser.error(f"unrecognized arguments: {' '.join(extra)}")
+   return args.run(args)
+
+if __name__ == "__main__":
+   sys.exit(main())
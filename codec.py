@@ -0,0 +1,1000 @@
+# The codec itself: the .jpc format plus the compress / decompress pipeline, shared by main.py (compressor),
+# viewer.py (decompressor) and anything that wants to embed the codec as a library.
+#
+#    encode(array | Image | path) -> bytes         decode(bytes | path) -> H x W x 3 uint8 array
+#    encode_to(source, file)                        decode_from(file)
+#                                                   decode_region(bytes | path, x, y, w, h)
+#    encode(..., progressive=True)                  decode_preview(first bytes of a progressive file)
+#
+# wrap any of these in instrumentation.collect() to get per stage timings and per channel counters
+#
+# every entry point takes workers: 1 runs serially, more (or None for one per core) splits the work into
+# channel x block row stripes on a process pool (or threads with use_threads=True), see parallel.py
+# and transform: "float" (matrix DCT, twoDDCT.py) or "int" (fixed point AAN, bit exact everywhere, integerDCT.py);
+# the coefficients mean the same either way, so files decode with either one
+
+# imports
+import mmap
+import os
+import struct # for packing and unpacking binary data in .jpc files
+from typing import BinaryIO, Union
+import numpy as np # numpy; arrays and math
+from PIL import Image # pillow image library
+
+# the compressed image type (metadata + flat rle arrays per channel)
+from compressedImage import CompressedImage
+
+# color space functions
+from colorConversion import rgb_to_ycbcr_array, ycbcr_to_rgb_array, ycbcr_to_rgb_image
+
+# chroma subsampling
+from chromaSubsampling import (
+   downsample,
+   upsample,
+   chroma_size,
+   sampling_factors,
+   SAMPLING_CODES,
+   SAMPLING_NAMES,
+)
+
+# entropy encoding functions
+from entropyEncoding import (
+   zigzag_scan_blocks,
+   rle_encode_blocks,
+   rle_decode_blocks,
+   as_rle_arrays,
+   zigzag_corner_length,
+   inverse_zigzag_corner_blocks,
+   optimized_huffman_tables,
+   huffman_encode_channel,
+   huffman_decode_channel,
+   huffman_table_bytes,
+   read_huffman_table,
+   build_huffman_table,
+   scan_frequencies,
+   huffman_encode_scan,
+   huffman_decode_scan,
+)
+
+from twoDDCT import ( # functions from the DCT file
+   pad_channel,
+   blockify_view,
+   unblockify_view,
+   dct_2d_blocks,
+   idct_2d_reduced,
+   idct_zigzag_blocks,
+   classify_blocks,
+   BLOCK_CLASSES,
+)
+
+from quantization import ( # functions from quantization
+   quantize_blocks,
+   dequantize_blocks,
+   quality_tables,
+   STANDARD_LUMA_Q,
+)
+
+# integer AAN transform with the (de)quantizer folded in
+from integerDCT import fdct_quantize_plane, zigzag_dequantize_idct
+
+# parallel stripe workers
+from parallel import encode_channels, decode_channels, huffman_decode_channels
+
+# opt-in stage timers and counters; no-ops unless instrumentation.collect() is active
+import instrumentation
+
+# signature and fixed header (jpcHeader.py, importable without numpy)
+from jpcHeader import file_signature, header_struct, read_fixed_header
+
+# option values and defaults (jpcOptions.py, importable without numpy)
+from jpcOptions import DEFAULT_QUALITY, DEFAULT_SAMPLING, TRANSFORMS, DEFAULT_TRANSFORM, SCALES, DEFAULT_TILE_SIZE
+
+# JPEG constants
+block_size = 8                     # DCT blocks are always 8 by 8
+header_version = 7                 # version bump whenever format changes
+# v2: no tables in the header, every channel used STANDARD_LUMA_Q
+# v3: quality byte + luma and chroma quantization tables (64 uint16 each, row order) after the block counts
+# v4: huffman coded channels; 4 huffman tables (luma DC, luma AC, chroma DC, chroma AC) after the
+#     quantization tables, then per channel a 4 byte length + the entropy coded bytes
+# v5: banded; a 4 byte band height (pixel rows, multiple of the block size) follows the huffman tables, then
+#     for every band the y, cb, cr payloads (4 byte length + bytes each). DC prediction restarts in every band,
+#     so bands can be written as they are produced (streaming.py) and decoded on their own
+# v6: chroma subsampling; a sampling byte (0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0) follows the band height. cb / cr
+#     are stored at their reduced size with their own block counts, and the band height is a multiple of the
+#     MCU height (16 rows for 4:2:0) so every band holds whole chroma blocks
+# v7: tiled; the huffman tables are followed by tile width, tile height (pixels, 4 bytes each, multiples of the
+#     MCU size) and the sampling byte, then an index of tile count + 1 byte offsets (4 bytes each, counted from
+#     the end of the index) so any tile can be found without reading the ones in front of it. tiles are stored
+#     in raster order, each one the y, cb, cr payloads (4 byte length + bytes) of its blocks in raster order,
+#     and DC prediction restarts in every tile. v5 / v6 bands are read as full width tiles without an index
+# v8: progressive (spectral selection), written only when asked for; untiled. the quantization tables are followed
+#     by the sampling byte and a scan count byte, then per scan its first and last zigzag position (1 byte each)
+#     and its luma and chroma huffman tables, then the scans in that order, each one the y, cb, cr payloads
+#     (4 byte length + bytes) of the whole image. the DC scan comes first, so any prefix that gets past the
+#     header decodes to a preview (decode_preview), and every later scan adds detail
+progressive_version = 8
+
+# v3+ quantization section: quality byte + luma and chroma tables
+tables_struct = struct.Struct(">B64H64H")
+# v7 tile section: tile width, tile height, sampling
+tiles_struct = struct.Struct(">IIB")
+# v8 scan section: sampling, scan count, then per scan its first and last zigzag position
+scans_struct = struct.Struct(">BB")
+scan_struct = struct.Struct(">BB")
+
+# default progressive scans (first, last zigzag position): DC, then low to high frequency AC bands
+PROGRESSIVE_SCANS = ((0, 0), (1, 5), (6, 20), (21, 63))
+
+# everything in front of the tile data: fixed header, quantization tables, huffman tables, tile size,
+# chroma sampling and the tile index; offsets can be all zeros to reserve the index and fill it in later
+def header_bytes(width: int, height: int, block_size: int, block_counts, quality: int, luma_q, chroma_q,
+                 huffman_tables, tile_width: int, tile_height: int, sampling: str, offsets) -> bytearray:
+   huffman_section = b"".join(huffman_table_bytes(t) for t in huffman_tables)
+   index = np.asarray(offsets, dtype=">u4").tobytes()
+   buffer = bytearray(header_struct.size + tables_struct.size + len(huffman_section) + tiles_struct.size + len(index))
+   header_struct.pack_into(buffer, 0, file_signature, header_version, width, height, block_size, *block_counts)
+   pos = header_struct.size
+   tables_struct.pack_into(buffer, pos, quality, *np.asarray(luma_q).ravel().tolist(),
+                           *np.asarray(chroma_q).ravel().tolist()) # so the decoder doesnt have to guess them
+   pos += tables_struct.size
+   buffer[pos:pos + len(huffman_section)] = huffman_section
+   pos += len(huffman_section)
+   tiles_struct.pack_into(buffer, pos, tile_width, tile_height, SAMPLING_CODES[sampling])
+   buffer[pos + tiles_struct.size:] = index
+   return buffer
+
+# pixel (columns, rows) of one MCU (minimum coded unit); tiles and bands have to be a multiple of this
+def mcu_size(sampling: str, block_size: int = block_size):
+   fx, fy = sampling_factors(sampling)
+   return block_size * fx, block_size * fy
+
+# (block rows, block cols, horizontal factor, vertical factor) of the y, cb and cr block grids
+def channel_grids(width: int, height: int, sampling: str, block_size: int = block_size):
+   chroma_width, chroma_height = chroma_size(width, height, sampling)
+   fx, fy = sampling_factors(sampling)
+   luma = (-(-height // block_size), -(-width // block_size), 1, 1)
+   chroma = (-(-chroma_height // block_size), -(-chroma_width // block_size), fx, fy)
+   return [luma, chroma, chroma]
+
+# tile width and height in pixels for a tile_size (None = one tile for the whole image)
+def tile_shape(width: int, height: int, sampling: str, tile_size=DEFAULT_TILE_SIZE, block_size: int = block_size):
+   mcu_width, mcu_height = mcu_size(sampling, block_size)
+   if tile_size is None:
+      return -(-width // mcu_width) * mcu_width, -(-height // mcu_height) * mcu_height
+   if tile_size <= 0 or tile_size % mcu_width or tile_size % mcu_height:
+      raise ValueError(f"tile_size must be a multiple of {max(mcu_width, mcu_height)} for {sampling}")
+   return tile_size, tile_size
+
+# block rows and cols a tile covers in one channel's grid
+def tile_blocks(grid, tile_width: int, tile_height: int, block_size: int = block_size):
+   _, _, fx, fy = grid
+   return tile_height // (block_size * fy), tile_width // (block_size * fx)
+
+# cut an (N, 64) raster channel with `cols` block columns into tiles (raster order), each (n, 64) in raster order
+def split_tiles(zz, cols: int, tile_rows: int, tile_cols: int):
+   grid = zz.reshape(-1, cols, zz.shape[-1])
+   return [grid[r:r + tile_rows, c:c + tile_cols].reshape(-1, zz.shape[-1])
+           for r in range(0, grid.shape[0], tile_rows) for c in range(0, cols, tile_cols)]
+
+# scans have to be the DC scan on its own and then AC bands covering 1..63 in order
+def _check_scans(scans) -> None:
+   scans = [tuple(scan) for scan in scans]
+   if (not scans or scans[0] != (0, 0) or scans[-1][1] != 63
+         or any(start != previous_end + 1 or start > end for (_, previous_end), (start, end) in zip(scans, scans[1:]))):
+      raise ValueError(f"scans must be (0, 0) then consecutive bands ending at 63, got {scans}")
+
+# serialize compressed data to the custom .jpc binary format
+# the whole file is assembled in one preallocated buffer; tile_size=None writes the image as a single tile
+# progressive=True writes a v8 file of scans instead (tile_size is ignored, see progressive_to_bytes)
+# compressed is a CompressedImage or an old style dict (converted, pair lists included)
+def compressed_to_bytes(compressed: Union[CompressedImage, dict], tile_size=DEFAULT_TILE_SIZE,
+                        progressive: bool = False) -> bytearray:
+   if progressive:
+      return progressive_to_bytes(compressed)
+
+   # get the metadata and the channel data
+   compressed = CompressedImage.from_dict(compressed)
+   width = compressed.width
+   height = compressed.height
+   block_size = compressed.block_size
+   quality = compressed.quality
+   luma_q = compressed.luma_q
+   chroma_q = compressed.chroma_q
+   sampling = compressed.sampling
+   tile_width, tile_height = tile_shape(width, height, sampling, tile_size, block_size)
+
+   # rle arrays for y, cb, and cr back to (N, 64) zigzag coefficients, cut into tiles
+   channel_tiles = []
+   with instrumentation.stage("rle_decode"):
+      for channel, grid in zip(compressed.channels, channel_grids(width, height, sampling, block_size)):
+         zz = channel.decode()
+         channel_tiles.append(split_tiles(zz, grid[1], *tile_blocks(grid, tile_width, tile_height, block_size)))
+   y_tiles, cb_tiles, cr_tiles = channel_tiles
+
+   # first pass: count symbols and build optimal tables (cb and cr share theirs); DC restarts per tile
+   with instrumentation.stage("huffman_tables"):
+      luma_dc, luma_ac = optimized_huffman_tables(y_tiles)
+      chroma_dc, chroma_ac = optimized_huffman_tables(cb_tiles + cr_tiles)
+
+   # second pass: entropy code every tile (y, cb, cr in this order)
+   payloads = []
+   offsets = [0]
+   with instrumentation.stage("huffman_encode"):
+      for y_zz, cb_zz, cr_zz in zip(y_tiles, cb_tiles, cr_tiles):
+         tile = [
+            huffman_encode_channel(y_zz, luma_dc, luma_ac),
+            huffman_encode_channel(cb_zz, chroma_dc, chroma_ac),
+            huffman_encode_channel(cr_zz, chroma_dc, chroma_ac),
+         ]
+         payloads += tile
+         offsets.append(offsets[-1] + sum(4 + len(p) for p in tile))
+
+   # lay everything out in one buffer
+   with instrumentation.stage("pack"):
+      block_counts = [sum(len(t) for t in tiles) for tiles in channel_tiles]
+      header = header_bytes(width, height, block_size, block_counts, quality, luma_q, chroma_q,
+                            (luma_dc, luma_ac, chroma_dc, chroma_ac), tile_width, tile_height, sampling, offsets)
+      buffer = bytearray(len(header) + offsets[-1])
+      buffer[:len(header)] = header
+      pos = len(header)
+      for payload in payloads:
+         struct.pack_into(">I", buffer, pos, len(payload)) # channel length, then the entropy coded bytes
+         buffer[pos + 4:pos + 4 + len(payload)] = payload
+         pos += 4 + len(payload)
+
+   if instrumentation.enabled():
+      for c, channel in enumerate(("y", "cb", "cr")):
+         instrumentation.count("entropy_bytes", sum(len(p) for p in payloads[c::3]), channel)
+      instrumentation.count("header_bytes", len(header))
+   return buffer
+
+# serialize compressed data to a progressive v8 .jpc: every scan (a band of zigzag positions) of every block
+# before the next scan, each with its own optimized tables (cb and cr share theirs)
+def progressive_to_bytes(compressed: Union[CompressedImage, dict], scans=PROGRESSIVE_SCANS) -> bytearray:
+   _check_scans(scans)
+   compressed = CompressedImage.from_dict(compressed)
+   with instrumentation.stage("rle_decode"):
+      channels = [channel.decode() for channel in compressed.channels]
+
+   with instrumentation.stage("huffman_tables"):
+      scan_tables = [(build_huffman_table(scan_frequencies(channels[0], start, end)),
+                      build_huffman_table(scan_frequencies(channels[1], start, end) + scan_frequencies(channels[2], start, end)))
+                     for start, end in scans]
+
+   with instrumentation.stage("huffman_encode"):
+      payloads = [huffman_encode_scan(zz, start, end, tables[min(c, 1)])
+                  for (start, end), tables in zip(scans, scan_tables) for c, zz in enumerate(channels)]
+
+   with instrumentation.stage("pack"):
+      header = bytearray(header_struct.pack(file_signature, progressive_version, compressed.width, compressed.height,
+                                            compressed.block_size, *[len(zz) for zz in channels]))
+      header += tables_struct.pack(compressed.quality, *np.asarray(compressed.luma_q).ravel().tolist(),
+                                   *np.asarray(compressed.chroma_q).ravel().tolist())
+      header += scans_struct.pack(SAMPLING_CODES[compressed.sampling], len(scans))
+      for (start, end), (luma_table, chroma_table) in zip(scans, scan_tables):
+         header += scan_struct.pack(start, end) + huffman_table_bytes(luma_table) + huffman_table_bytes(chroma_table)
+      buffer = bytearray(len(header) + sum(4 + len(p) for p in payloads))
+      buffer[:len(header)] = header
+      pos = len(header)
+      for payload in payloads:
+         struct.pack_into(">I", buffer, pos, len(payload))
+         buffer[pos + 4:pos + 4 + len(payload)] = payload
+         pos += 4 + len(payload)
+
+   if instrumentation.enabled():
+      for c, channel in enumerate(("y", "cb", "cr")):
+         instrumentation.count("entropy_bytes", sum(len(p) for p in payloads[c::3]), channel)
+      instrumentation.count("header_bytes", len(header))
+   return buffer
+
+# write compressed data to custom .jpc binary file with a single write call
+def save_compressed(compressed: Union[CompressedImage, dict], path: str, tile_size=DEFAULT_TILE_SIZE,
+                    progressive: bool = False) -> None:
+   buffer = compressed_to_bytes(compressed, tile_size, progressive)
+   # wb = write binary 
+   with instrumentation.stage("file_write"), open(path, "wb") as file:
+      file.write(buffer)
+   instrumentation.count("bytes_written", len(buffer))
+
+# parse a v2 / v3 channel of fixed size records (2 byte pair count per block, then 3 byte (zeros, value) pairs)
+# only the block counts need a loop, every pair is gathered from the buffer in one go
+def _read_record_channel(data, pos: int, block_count: int):
+   if 2 * block_count > len(data) - pos:
+      raise ValueError("Truncated JPCS file")
+   counts = np.zeros(block_count, dtype=np.int64)
+   starts = np.zeros(block_count, dtype=np.int64)
+   for i in range(block_count):
+      if pos + 2 > len(data):
+         raise ValueError("Truncated JPCS file")
+      count = struct.unpack_from(">H", data, pos)[0]
+      counts[i] = count
+      starts[i] = pos + 2
+      pos += 2 + 3 * count
+   if pos > len(data):
+      raise ValueError("Truncated JPCS file")
+
+   offsets = np.zeros(block_count + 1, dtype=np.int32)
+   np.cumsum(counts, out=offsets[1:])
+
+   # byte position of every pair record
+   records = np.repeat(starts - 3 * offsets[:-1], counts) + 3 * np.arange(offsets[-1])
+   raw = np.frombuffer(data, dtype=np.uint8)
+   runs = raw[records]
+   values = ((raw[records + 1].astype(np.uint16) << 8) | raw[records + 2]).view(np.int16)
+   return (runs, values, offsets), pos
+
+# locate one huffman coded v4+ channel; returns its payload and the position after it
+# pos can come from a tile index, so it is checked against the data like the length is
+def _read_coded_channel(data, pos: int):
+   if pos < 0 or pos + 4 > len(data):
+      raise ValueError("Truncated JPCS file")
+   length = struct.unpack_from(">I", data, pos)[0]
+   pos += 4
+   if pos + length > len(data):
+      raise ValueError("Truncated JPCS file")
+   return data[pos:pos + length], pos + length
+
+# parse everything in front of the channel data; returns a dict with the image metadata, tables, tile layout
+# ("data_pos" where the tiles start, "offsets" the v7 tile index or None) and for v2 / v3 files no huffman tables
+# v8 files have "scans" ((first, last) zigzag position each) and "scan_tables" ((luma, chroma) each) instead
+def read_header(data) -> dict:
+   data = memoryview(data)
+
+   # validate file signature and the version
+   fixed = read_fixed_header(data)
+   version, width, height, block_size = fixed["version"], fixed["width"], fixed["height"], fixed["block_size"]
+   y_count, cb_count, cr_count = fixed["block_counts"]
+   if version not in (2, 3, 4, 5, 6, header_version, progressive_version):
+      raise ValueError(f"Unsupported version: {version}")
+   if block_size != 8: # every table, zigzag and transform here is 8 x 8
+      raise ValueError(f"Unsupported block size: {block_size}")
+   pos = header_struct.size
+   if version >= 3 and len(data) < pos + tables_struct.size:
+      raise ValueError("Truncated JPCS file")
+
+   # quantization tables; v2 files used the luma table for every channel
+   if version >= 3:
+      fields = tables_struct.unpack_from(data, pos)
+      pos += tables_struct.size
+      quality = fields[0]
+      luma_q = np.array(fields[1:65]).reshape(8, 8)
+      chroma_q = np.array(fields[65:]).reshape(8, 8)
+   else:
+      quality = DEFAULT_QUALITY
+      luma_q = chroma_q = np.array(STANDARD_LUMA_Q)
+
+   header = {
+      "version": version,
+      "width": width,
+      "height": height,
+      "block_size": block_size,
+      "block_counts": (y_count, cb_count, cr_count),
+      "quality": quality,
+      "luma_q": luma_q,
+      "chroma_q": chroma_q,
+      "sampling": DEFAULT_SAMPLING,
+      "huffman_tables": None,
+      "offsets": None,
+      "scans": None,
+      "data_pos": pos,
+   }
+   if version < 4:
+      # v2 / v3 blocks are all 4:4:4 and every record takes at least its 2 byte count, so a header claiming more
+      # blocks than the grid or the file holds is turned away before anything is allocated for them
+      grids = channel_grids(width, height, DEFAULT_SAMPLING, block_size)
+      if [y_count, cb_count, cr_count] != [rows * cols for rows, cols, _, _ in grids]:
+         raise ValueError("Corrupt JPCS header")
+      if 2 * (y_count + cb_count + cr_count) > len(data) - pos:
+         raise ValueError("Truncated JPCS file")
+      return header
+   if version == progressive_version:
+      return _read_scans_header(data, header, pos)
+
+   huffman_tables = []
+   for _ in range(4): # luma DC, luma AC, chroma DC, chroma AC
+      table, pos = read_huffman_table(data, pos)
+      huffman_tables.append(table)
+   if pos > len(data): # read_huffman_table just slices, a short file gives short tables
+      raise ValueError("Truncated JPCS file")
+   header["huffman_tables"] = huffman_tables
+
+   # older layouts as tiles: v4 is one tile covering the whole image, v5 / v6 full width bands
+   tile_width = -(-width // block_size) * block_size
+   tile_height = -(-height // block_size) * block_size
+   layout_size = {5: 4, 6: 5}.get(version, tiles_struct.size if version >= 7 else 0)
+   if pos + layout_size > len(data):
+      raise ValueError("Truncated JPCS file")
+   if version == 5:
+      tile_height = struct.unpack_from(">I", data, pos)[0]
+      pos += 4
+   elif version == 6:
+      tile_height, sampling_code = struct.unpack_from(">IB", data, pos)
+      pos += 5
+      header["sampling"] = SAMPLING_NAMES.get(sampling_code)
+   elif version >= 7:
+      tile_width, tile_height, sampling_code = tiles_struct.unpack_from(data, pos)
+      pos += tiles_struct.size
+      header["sampling"] = SAMPLING_NAMES.get(sampling_code)
+   if header["sampling"] is None:
+      raise ValueError("Corrupt JPCS header")
+   mcu_width, mcu_height = mcu_size(header["sampling"], block_size)
+   if version == 6: # bands span the whole (MCU padded) width
+      tile_width = -(-width // mcu_width) * mcu_width
+
+   grids = channel_grids(width, height, header["sampling"], block_size)
+   if ([y_count, cb_count, cr_count] != [rows * cols for rows, cols, _, _ in grids] or tile_width <= 0
+         or tile_height <= 0 or tile_width % mcu_width or tile_height % mcu_height):
+      raise ValueError("Corrupt JPCS header")
+   header["tile_width"] = tile_width
+   header["tile_height"] = tile_height
+
+   if version >= 7:
+      tile_count = -(-width // tile_width) * -(-height // tile_height)
+      if pos + 4 * (tile_count + 1) > len(data):
+         raise ValueError("Truncated JPCS file")
+      header["offsets"] = np.frombuffer(data, dtype=">u4", count=tile_count + 1, offset=pos).astype(np.int64)
+      pos += 4 * (tile_count + 1)
+      # the index starts at 0, never goes backwards and the last entry is the end of the tile data
+      if header["offsets"][0] != 0 or np.any(np.diff(header["offsets"]) < 0):
+         raise ValueError("Corrupt JPCS header")
+      if pos + header["offsets"][-1] > len(data):
+         raise ValueError("Truncated JPCS file")
+   header["data_pos"] = pos
+   return header
+
+# rest of a v8 header: sampling and the scan list with every scan's tables
+def _read_scans_header(data, header: dict, pos: int) -> dict:
+   if len(data) < pos + scans_struct.size:
+      raise ValueError("Truncated JPCS file")
+   sampling_code, scan_count = scans_struct.unpack_from(data, pos)
+   pos += scans_struct.size
+   scans = []
+   scan_tables = []
+   for _ in range(scan_count):
+      if len(data) < pos + scan_struct.size:
+         raise ValueError("Truncated JPCS file")
+      scans.append(scan_struct.unpack_from(data, pos))
+      pos += scan_struct.size
+      luma_table, pos = read_huffman_table(data, pos)
+      chroma_table, pos = read_huffman_table(data, pos)
+      scan_tables.append((luma_table, chroma_table))
+   if pos > len(data):
+      raise ValueError("Truncated JPCS file")
+
+   header["sampling"] = SAMPLING_NAMES.get(sampling_code)
+   if header["sampling"] is None:
+      raise ValueError("Corrupt JPCS header")
+   try:
+      _check_scans(scans)
+   except ValueError:
+      raise ValueError("Corrupt JPCS header") from None
+   grids = channel_grids(header["width"], header["height"], header["sampling"], header["block_size"])
+   if list(header["block_counts"]) != [rows * cols for rows, cols, _, _ in grids]:
+      raise ValueError("Corrupt JPCS header")
+
+   # one tile covering the whole (MCU padded) image, so region decodes still know the layout
+   mcu_width, mcu_height = mcu_size(header["sampling"], header["block_size"])
+   header["tile_width"] = -(-header["width"] // mcu_width) * mcu_width
+   header["tile_height"] = -(-header["height"] // mcu_height) * mcu_height
+   header["scans"] = scans
+   header["scan_tables"] = scan_tables
+   header["data_pos"] = pos
+   return header
+
+# huffman decode the scans of a v8 file into one (N, 64) zigzag tensor per channel; returns them and how many
+# scans were complete. partial=True accepts a cut off file and keeps whatever the data got to (a cut scan
+# fills in the blocks in front of the cut), otherwise a short file is an error
+# scans that start at or past total_length arent read at all (scaled decodes only need the low coefficients)
+def _decode_scans(data, header: dict, partial: bool = False, total_length: int = 64):
+   channels = [np.zeros((count, 64), dtype=np.int32) for count in header["block_counts"]]
+   pos = header["data_pos"]
+   complete = 0
+   dc_read = [0] * len(channels) # blocks of every channel the DC scan got to
+   for (start, end), (luma_table, chroma_table) in zip(header["scans"], header["scan_tables"]):
+      if start >= total_length:
+         break
+      for c, (zz, table) in enumerate(zip(channels, (luma_table, chroma_table, chroma_table))):
+         if pos + 4 > len(data):
+            if not partial:
+               raise ValueError("Truncated JPCS file")
+            read = 0
+         else:
+            length = struct.unpack_from(">I", data, pos)[0]
+            payload = data[pos + 4:pos + 4 + length]
+            if len(payload) < length and not partial:
+               raise ValueError("Truncated JPCS file")
+            read = huffman_decode_scan(payload, zz, start, end, table, partial)
+            pos += 4 + length
+         if start == 0:
+            dc_read[c] = read
+         if read < len(zz):
+            break
+      else:
+         complete += 1
+         continue
+      break
+
+   # blocks the DC scan never got to would decode as 0, which is black luma and saturated green chroma;
+   # they get the DC of a flat mid grey (128) block instead, so a short prefix already looks like something
+   for zz, read, q in zip(channels, dc_read, (header["luma_q"], header["chroma_q"], header["chroma_q"])):
+      if read < len(zz):
+         zz[read:, 0] = int(np.rint(128 * header["block_size"] / np.asarray(q)[0, 0]))
+   return channels, complete
+
+# the y, cb, cr payloads of the given tiles (ids in raster tile order); v7 jumps straight to every tile
+# through the index, older banded files have to step over the length fields of the bands in front
+def _tile_payloads(data, header: dict, tile_ids) -> dict:
+   payloads = {}
+   offsets = header["offsets"]
+   if offsets is not None:
+      for tile in tile_ids:
+         pos = header["data_pos"] + int(offsets[tile])
+         channels = []
+         for _ in range(3):
+            payload, pos = _read_coded_channel(data, pos)
+            channels.append(payload)
+         payloads[tile] = channels
+      return payloads
+
+   wanted = set(tile_ids)
+   pos = header["data_pos"]
+   for tile in range(max(wanted) + 1):
+      channels = []
+      for _ in range(3):
+         payload, pos = _read_coded_channel(data, pos)
+         channels.append(payload)
+      if tile in wanted:
+         payloads[tile] = channels
+   return payloads
+
+# huffman decode a rectangle of tiles (tile columns tx0..tx1, rows ty0..ty1, end exclusive)
+# returns one (block rows, block cols, 64) zigzag grid per channel covering exactly those tiles
+# with workers != 1 every tile channel is its own job on the pool
+# total_length < 64 keeps only that many zigzag coefficients per block (see huffman_decode_channel)
+def _decode_tiles(data, header: dict, tx0: int, tx1: int, ty0: int, ty1: int, workers: int = 1,
+                  use_threads: bool = False, total_length: int = 64):
+   width, height, block_size = header["width"], header["height"], header["block_size"]
+   tile_width, tile_height = header["tile_width"], header["tile_height"]
+   tiles_x = -(-width // tile_width)
+   luma_dc, luma_ac, chroma_dc, chroma_ac = header["huffman_tables"]
+   channel_tables = ((luma_dc, luma_ac), (chroma_dc, chroma_ac), (chroma_dc, chroma_ac))
+   grids = channel_grids(width, height, header["sampling"], block_size)
+
+   tile_ids = [ty * tiles_x + tx for ty in range(ty0, ty1) for tx in range(tx0, tx1)]
+   payloads = _tile_payloads(data, header, tile_ids)
+
+   # output grids, and where every decoded tile goes in them
+   outputs = []
+   origins = []
+   for grid in grids:
+      rows, cols = grid[0], grid[1]
+      tile_rows, tile_cols = tile_blocks(grid, tile_width, tile_height, block_size)
+      row0, col0 = ty0 * tile_rows, tx0 * tile_cols
+      outputs.append(np.zeros((min(ty1 * tile_rows, rows) - row0, min(tx1 * tile_cols, cols) - col0, 64), dtype=np.int32))
+      origins.append((row0, col0, tile_rows, tile_cols))
+
+   jobs = []
+   places = []
+   for tile in tile_ids:
+      ty, tx = divmod(tile, tiles_x)
+      for c, (tables, output, (row0, col0, tile_rows, tile_cols)) in enumerate(zip(channel_tables, outputs, origins)):
+         r0, c0 = ty * tile_rows - row0, tx * tile_cols - col0
+         r1, c1 = min(r0 + tile_rows, output.shape[0]), min(c0 + tile_cols, output.shape[1])
+         jobs.append((payloads[tile][c], (r1 - r0) * (c1 - c0), *tables, total_length))
+         places.append((output, r0, r1, c0, c1))
+
+   if workers == 1:
+      decoded = [huffman_decode_channel(*job) for job in jobs]
+   else:
+      decoded = huffman_decode_channels(jobs, workers, use_threads)
+   for (output, r0, r1, c0, c1), zz in zip(places, decoded):
+      output[r0:r1, c0:c1] = zz.reshape(r1 - r0, c1 - c0, 64)
+   return outputs
+
+# parse the bytes of a .jpc file back into a CompressedImage
+# parsed straight from a memoryview; channels come back as flat (runs, values, offsets) arrays
+# with workers != 1 the tiles are huffman decoded in parallel
+# total_length < 64 only keeps the first total_length zigzag coefficients of every block and skips decoding the
+# rest; that is all a scaled decode reads (zigzag_corner_length), the result is no good for anything else
+def parse_JPC(data, workers: int = 1, use_threads: bool = False, total_length: int = 64) -> CompressedImage:
+   data = memoryview(data)
+   header = read_header(data)
+   width, height = header["width"], header["height"]
+   y_count, cb_count, cr_count = header["block_counts"]
+
+   # read all y, cb, cr blocks
+   if header["scans"] is not None:
+      with instrumentation.stage("huffman_decode"):
+         channels, _ = _decode_scans(data, header, total_length=total_length)
+      with instrumentation.stage("rle"):
+         y_blocks, cb_blocks, cr_blocks = [rle_encode_blocks(zz) for zz in channels]
+   elif header["huffman_tables"] is not None:
+      tiles_x = -(-width // header["tile_width"])
+      tiles_y = -(-height // header["tile_height"])
+      with instrumentation.stage("huffman_decode"):
+         grids = _decode_tiles(data, header, 0, tiles_x, 0, tiles_y, workers, use_threads, total_length)
+      with instrumentation.stage("rle"):
+         y_blocks, cb_blocks, cr_blocks = [rle_encode_blocks(grid.reshape(-1, 64)) for grid in grids]
+   else:
+      with instrumentation.stage("record_parse"):
+         pos = header["data_pos"]
+         y_blocks, pos = _read_record_channel(data, pos, y_count)
+         cb_blocks, pos = _read_record_channel(data, pos, cb_count)
+         cr_blocks, pos = _read_record_channel(data, pos, cr_count)
+
+   return _compressed_image(header, y_blocks, cb_blocks, cr_blocks)
+
+# same thing compress_image makes, from a parsed header and the three channels' rle arrays
+def _compressed_image(header: dict, y_blocks, cb_blocks, cr_blocks) -> CompressedImage:
+   return CompressedImage(header["width"], header["height"], header["block_size"], y_blocks, cb_blocks, cr_blocks,
+                          quality=header["quality"], luma_q=header["luma_q"], chroma_q=header["chroma_q"],
+                          sampling=header["sampling"])
+
+# read a .jpc file back into a CompressedImage; the file is read once
+def read_JPC_file(path: str, workers: int = 1, use_threads: bool = False, total_length: int = 64) -> CompressedImage:
+   with instrumentation.stage("file_read"), open(path, "rb") as f:
+      data = f.read()
+   instrumentation.count("bytes_read", len(data))
+   return parse_JPC(data, workers, use_threads, total_length)
+
+# compress a single Y, Cb, or Cr channel
+def compress_channel(channel, q_matrix, transform: str = DEFAULT_TRANSFORM):
+   # channel compression pipeline: Y/Cb/Cr array then 8×8 blocks then DCT then quantize then zigzag then RLE
+   # compress zero runs for the whole channel; flat (runs, values, offsets) arrays
+   zz = transform_channel(channel, q_matrix, transform)
+   with instrumentation.stage("rle"):
+      return rle_encode_blocks(zz)
+
+# the lossy part of compress_channel: blocks, DCT, quantize, zigzag; returns (N, 64) int32 coefficients
+def transform_channel(channel, q_matrix, transform: str = DEFAULT_TRANSFORM):
+   if transform == "int": # integer AAN, quantizing is part of the transform and zigzag comes out of it too
+      with instrumentation.stage("blockify"):
+         plane = pad_channel(np.asarray(channel), block_size, pad_mode="edge")
+      with instrumentation.stage("int_dct_quantize"):
+         return fdct_quantize_plane(plane, q_matrix)
+
+   # make sure we have a float32 NumPy array
+   channel = np.asarray(channel, dtype=np.float32)
+
+   # view the full 2D channel as a (rows, cols, 8, 8) block tensor; edge padding so partial blocks dont ring
+   with instrumentation.stage("blockify"):
+      blocks = blockify_view(channel, block_size, pad_mode="edge")
+   # frequency transform, all blocks in one batch, flattened to raster block order
+   with instrumentation.stage("dct"):
+      dct_blocks = dct_2d_blocks(blocks).reshape(-1, block_size, block_size)
+   with instrumentation.stage("quantize"):
+      q_blocks = quantize_blocks(dct_blocks, q_matrix) # lossy quantization, whole tensor at once
+   with instrumentation.stage("zigzag"):
+      return zigzag_scan_blocks(q_blocks) # reorder for RLE, (N, 64)
+
+# compress the entire RGB image (really YCbCr)
+# img can be a pillow image or an H x W x 3 rgb array
+# quality is the libjpeg style 1 (smallest) to 100 (best) knob
+# sampling is "4:4:4", "4:2:2" or "4:2:0"; chroma_filter picks the downsampler ("box" or "triangle")
+# transform is "float" or "int" (see integerDCT.py)
+def compress_image(img, quality: int = DEFAULT_QUALITY, workers: int = 1, use_threads: bool = False,
+                   sampling: str = DEFAULT_SAMPLING, chroma_filter: str = "box", transform: str = DEFAULT_TRANSFORM) -> CompressedImage:
+   _check_transform(transform)
+   rgb = to_rgb_array(img)
+   height, width = rgb.shape[:2]
+   luma_q, chroma_q = quality_tables(quality) # scaled tables, cached per quality
+
+   # convert RGB to Y, Cb, Cr (luminance + two chromanance channels)
+   with instrumentation.stage("colour_convert"):
+      ycbcr = rgb_to_ycbcr_array(rgb)
+   y_channel, cb_channel, cr_channel = ycbcr[..., 0], ycbcr[..., 1], ycbcr[..., 2]
+   if sampling != "4:4:4": # shrink the chroma planes before they go through the DCT
+      with instrumentation.stage("downsample"):
+         cb_channel = downsample(cb_channel, sampling, chroma_filter)
+         cr_channel = downsample(cr_channel, sampling, chroma_filter)
+
+   # compress each channel with its appropriate quantization table
+   if workers == 1:
+      y_blocks = compress_channel(y_channel, luma_q, transform)
+      cb_blocks = compress_channel(cb_channel, chroma_q, transform)
+      cr_blocks = compress_channel(cr_channel, chroma_q, transform)
+   else:
+      with instrumentation.stage("transform_pool"): # blockify + dct + quantize + zigzag on the pool
+         zz_channels = encode_channels([y_channel, cb_channel, cr_channel], [luma_q, chroma_q, chroma_q],
+                                       block_size, workers, use_threads, transform=transform)
+      with instrumentation.stage("rle"):
+         y_blocks, cb_blocks, cr_blocks = [rle_encode_blocks(zz) for zz in zz_channels]
+
+   if instrumentation.enabled():
+      for channel, rle in (("y", y_blocks), ("cb", cb_blocks), ("cr", cr_blocks)):
+         _count_blocks(channel, rle)
+
+   # metadata and compressed channel data into one CompressedImage- you know the drill
+   return CompressedImage(width, height, block_size, y_blocks, cb_blocks, cr_blocks, quality=quality,
+                          luma_q=luma_q, chroma_q=chroma_q, sampling=sampling)
+
+def _check_transform(transform: str) -> None:
+   if transform not in TRANSFORMS:
+      raise ValueError(f"transform must be one of {TRANSFORMS}, got {transform!r}")
+
+# block, all zero block and rle pair counters of one channel
+def _count_blocks(channel: str, rle) -> None:
+   runs, values, offsets = as_rle_arrays(rle)
+   offsets = np.asarray(offsets)
+   empty = (np.diff(offsets) == 1) & (np.asarray(values)[offsets[:-1]] == 0) # just the (0, 0) pair
+   instrumentation.count("blocks", len(offsets) - 1, channel)
+   instrumentation.count("zero_blocks", np.count_nonzero(empty), channel)
+   instrumentation.count("rle_pairs", offsets[-1], channel)
+
+# decoded blocks per class (all zero, DC only, sparse, dense; see twoDDCT.classify_blocks) of one channel
+def _count_block_classes(channel: str, zz) -> None:
+   counts = np.bincount(classify_blocks(zz), minlength=len(BLOCK_CLASSES))
+   for name, value in zip(BLOCK_CLASSES, counts):
+      instrumentation.count(f"decoded_{name}", value, channel)
+
+# reverse channel compression
+def decompress_channel(blocks_rle, q_matrix, width, height, block_size, transform: str = DEFAULT_TRANSFORM,
+                       channel: str = ""):
+   with instrumentation.stage("rle_decode"):
+      zz = rle_decode_blocks(*as_rle_arrays(blocks_rle), total_length=64) # undo RLE, (N, 64)
+   return decompress_zigzag(zz, q_matrix, width, height, block_size, transform, channel)
+
+# (N, 64) zigzag coefficients of a width x height plane back to pixels
+# blocks take the cheapest exact route their last nonzero coefficient allows (flat fill, reduced or full IDCT)
+def decompress_zigzag(zz, q_matrix, width, height, block_size, transform: str = DEFAULT_TRANSFORM,
+                      channel: str = ""):
+   if instrumentation.enabled():
+      _count_block_classes(channel, zz)
+   if transform == "int": # unzigzag, dequantize and integer AAN in one go
+      with instrumentation.stage("int_idct"):
+         plane = zigzag_dequantize_idct(zz, q_matrix, -(-height // block_size), -(-width // block_size))
+      return plane[:height, :width]
+
+   # unzigzag, dequantize and inverse DCT straight from zigzag order (float32)
+   with instrumentation.stage("idct"):
+      reconstructed_blocks = idct_zigzag_blocks(zz, q_matrix)
+
+   # blocks back into 2D image
+   return unblockify_view(reconstructed_blocks, height, width)
+
+# reverse channel compression at 1 / scale size (ceil(width / scale) x ceil(height / scale))
+# only the low k x k coefficients of every block are expanded from the rle data (k = block_size / scale) and
+# they go through a k point IDCT; 1/8 is DC only
+def decompress_channel_scaled(blocks_rle, q_matrix, width, height, block_size, scale: int):
+   k = block_size // scale
+   with instrumentation.stage("rle_decode"):
+      zz = rle_decode_blocks(*as_rle_arrays(blocks_rle), total_length=zigzag_corner_length(k))
+   with instrumentation.stage("scaled_idct"):
+      corner = dequantize_blocks(inverse_zigzag_corner_blocks(zz, k), np.asarray(q_matrix)[:k, :k])
+      return unblockify_view(idct_2d_reduced(corner, k, block_size), -(-height // scale), -(-width // scale))
+
+# decompress all three channels; returns float32 Y, Cb, Cr planes
+# scale 2, 4 or 8 returns planes 1/scale the size (rounded up) from a reduced IDCT (always float, whatever transform says)
+# compressed is a CompressedImage or an old style dict (converted first)
+def decompress_planes(compressed: Union[CompressedImage, dict], workers: int = 1, use_threads: bool = False,
+                      scale: int = 1, transform: str = DEFAULT_TRANSFORM):
+   compressed = CompressedImage.from_dict(compressed) # old dicts without chroma_q get the luma table, as before
+   width = compressed.width
+   height = compressed.height
+   block_size = compressed.block_size
+   luma_q = compressed.luma_q
+   chroma_q = compressed.chroma_q
+   sampling = compressed.sampling
+   y_blocks, cb_blocks, cr_blocks = compressed.channels
+   chroma_width, chroma_height = chroma_size(width, height, sampling)
+
+   if scale not in SCALES:
+      raise ValueError(f"scale must be one of {SCALES}, got {scale}")
+   _check_transform(transform)
+   if scale != 1:
+      # small enough that the pool isnt worth it
+      y_chan = decompress_channel_scaled(y_blocks, luma_q, width, height, block_size, scale)
+      cb_chan, cr_chan = [decompress_channel_scaled(blocks, chroma_q, chroma_width, chroma_height, block_size, scale)
+                          for blocks in (cb_blocks, cr_blocks)]
+      if sampling != "4:4:4":
+         with instrumentation.stage("upsample"):
+            cb_chan = upsample(cb_chan, sampling, y_chan.shape[1], y_chan.shape[0])
+            cr_chan = upsample(cr_chan, sampling, y_chan.shape[1], y_chan.shape[0])
+      return y_chan, cb_chan, cr_chan
+
+   if workers != 1:
+      with instrumentation.stage("rle_decode"):
+         zz_channels = [channel.decode() for channel in compressed.channels]
+      sizes = [(height, width), (chroma_height, chroma_width), (chroma_height, chroma_width)]
+      if instrumentation.enabled():
+         for channel, zz in zip(("y", "cb", "cr"), zz_channels):
+            _count_block_classes(channel, zz)
+      with instrumentation.stage("inverse_transform_pool"): # unzigzag + dequantize + idct on the pool
+         y_chan, cb_chan, cr_chan = decode_channels(zz_channels, [luma_q, chroma_q, chroma_q], sizes,
+                                                    block_size, workers, use_threads, transform=transform)
+   else:
+      y_chan = decompress_channel(y_blocks, luma_q, width, height, block_size, transform, "y")
+      cb_chan = decompress_channel(cb_blocks, chroma_q, chroma_width, chroma_height, block_size,
+                                   transform, "cb")
+      cr_chan = decompress_channel(cr_blocks, chroma_q, chroma_width, chroma_height, block_size,
+                                   transform, "cr")
+
+   if sampling != "4:4:4": # chroma back to full size before the colour conversion
+      with instrumentation.stage("upsample"):
+         cb_chan = upsample(cb_chan, sampling, width, height)
+         cr_chan = upsample(cr_chan, sampling, width, height)
+
+   return y_chan, cb_chan, cr_chan
+
+# decode only the tiles covering the x, y, w, h pixel rectangle; returns an h x w x 3 uint8 rgb array equal to
+# the same crop of a full decode. paths are memory mapped, so only the header, the index and the covering tiles
+# are read from disk. v2 / v3 and progressive v8 files have no tiles and are decoded whole, then cropped
+def decode_region(source: Union[bytes, bytearray, memoryview, str, os.PathLike], x: int, y: int, w: int, h: int,
+                  workers: int = 1, use_threads: bool = False, transform: str = DEFAULT_TRANSFORM) -> np.ndarray:
+   _check_transform(transform)
+   if isinstance(source, (str, os.PathLike)):
+      with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+         view = memoryview(mapped)
+         try:
+            return _decode_region(view, x, y, w, h, workers, use_threads, transform)
+         finally:
+            view.release()
+   return _decode_region(memoryview(source), x, y, w, h, workers, use_threads, transform)
+
+def _decode_region(data, x: int, y: int, w: int, h: int, workers: int, use_threads: bool,
+                   transform: str = DEFAULT_TRANSFORM) -> np.ndarray:
+   header = read_header(data)
+   _check_region(header["width"], header["height"], x, y, w, h)
+   if header["huffman_tables"] is None: # v2 / v3 records and v8 scans arent split into tiles
+      return decompress_array(parse_JPC(data, workers, use_threads), workers, use_threads, transform=transform)[y:y + h, x:x + w]
+
+   tile_width, tile_height = header["tile_width"], header["tile_height"]
+   x0, x1, y0, y1 = _region_margin(header["width"], header["height"], header["sampling"], x, y, w, h)
+   tx0, tx1 = x0 // tile_width, -(-x1 // tile_width)
+   ty0, ty1 = y0 // tile_height, -(-y1 // tile_height)
+   grids = _decode_tiles(data, header, tx0, tx1, ty0, ty1, workers, use_threads)
+   return _region_pixels(grids, header, tx0 * tile_width, ty0 * tile_height, tx1 * tile_width, ty1 * tile_height,
+                         x, y, w, h, transform)
+
+def _check_region(width: int, height: int, x: int, y: int, w: int, h: int) -> None:
+   if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > width or y + h > height:
+      raise ValueError(f"Region {x}, {y}, {w}, {h} is not inside the {width} x {height} image")
+
+# upsampling reads one chroma sample past the region, so decode a slightly bigger rectangle (x0, x1, y0, y1)
+def _region_margin(width: int, height: int, sampling: str, x: int, y: int, w: int, h: int):
+   fx, fy = sampling_factors(sampling)
+   return (max(x - (fx - 1) * 2, 0), min(x + w + (fx - 1) * 2, width),
+           max(y - (fy - 1) * 2, 0), min(y + h + (fy - 1) * 2, height))
+
+# rgb of the x, y, w, h region from the (block rows, block cols, 64) y / cb / cr grids covering the MCU aligned
+# rectangle left..right x top..bottom (right / bottom can run past the image)
+def _region_pixels(grids, meta, left: int, top: int, right: int, bottom: int, x: int, y: int, w: int, h: int,
+                   transform: str = DEFAULT_TRANSFORM) -> np.ndarray:
+   width, height, sampling = meta["width"], meta["height"], meta["sampling"]
+   fx, fy = sampling_factors(sampling)
+   chroma_width, chroma_height = chroma_size(width, height, sampling)
+   chroma_right, chroma_bottom = min(right // fx, chroma_width), min(bottom // fy, chroma_height)
+   right, bottom = min(right, width), min(bottom, height)
+
+   y_plane = decompress_zigzag(grids[0].reshape(-1, 64), meta["luma_q"], right - left, bottom - top,
+                               meta["block_size"], transform, "y")
+   chroma_planes = []
+   for channel, grid in zip(("cb", "cr"), grids[1:]):
+      plane = decompress_zigzag(grid.reshape(-1, 64), meta["chroma_q"], chroma_right - left // fx,
+                                chroma_bottom - top // fy, meta["block_size"], transform, channel)
+      if sampling != "4:4:4":
+         plane = upsample(plane, sampling, right - left, bottom - top)
+      chroma_planes.append(plane)
+
+   rgb = ycbcr_to_rgb_array(np.stack([y_plane, *chroma_planes], axis=-1))
+   return rgb[y - top:y - top + h, x - left:x - left + w]
+
+# crop of an already parsed image: only the block rows under the region are rle decoded and only the MCUs
+# under it go through the idct (what decode_region does with tiles, for any v2 - v8 file once parsed)
+def decompress_region(compressed: Union[CompressedImage, dict], x: int, y: int, w: int, h: int,
+                      transform: str = DEFAULT_TRANSFORM) -> np.ndarray:
+   compressed = CompressedImage.from_dict(compressed)
+   width, height, block_size, sampling = compressed.width, compressed.height, compressed.block_size, compressed.sampling
+   _check_region(width, height, x, y, w, h)
+   _check_transform(transform)
+
+   mcu_width, mcu_height = mcu_size(sampling, block_size)
+   x0, x1, y0, y1 = _region_margin(width, height, sampling, x, y, w, h)
+   left, right = x0 // mcu_width * mcu_width, -(-x1 // mcu_width) * mcu_width
+   top, bottom = y0 // mcu_height * mcu_height, -(-y1 // mcu_height) * mcu_height
+   grids = []
+   for channel, (rows, cols, fx, fy) in zip(compressed.channels, channel_grids(width, height, sampling, block_size)):
+      r0, r1 = top // (fy * block_size), min(bottom // (fy * block_size), rows)
+      c0, c1 = left // (fx * block_size), min(right // (fx * block_size), cols)
+      zz = channel[r0 * cols:r1 * cols].decode().reshape(r1 - r0, cols, -1)
+      grids.append(zz[:, c0:c1])
+   return _region_pixels(grids, compressed, left, top, right, bottom, x, y, w, h, transform)
+
+# full decompression to a pillow rgb image
+def decompress_image(compressed: Union[CompressedImage, dict], workers: int = 1, use_threads: bool = False,
+                     scale: int = 1, transform: str = DEFAULT_TRANSFORM) -> Image.Image:
+   planes = decompress_planes(compressed, workers, use_threads, scale, transform)
+   with instrumentation.stage("colour_convert"):
+      return ycbcr_to_rgb_image(*planes)
+
+# full decompression to an H x W x 3 uint8 rgb array
+def decompress_array(compressed: Union[CompressedImage, dict], workers: int = 1, use_threads: bool = False,
+                     scale: int = 1, transform: str = DEFAULT_TRANSFORM) -> np.ndarray:
+   planes = decompress_planes(compressed, workers, use_threads, scale, transform)
+   with instrumentation.stage("colour_convert"):
+      return ycbcr_to_rgb_array(np.stack(planes, axis=-1))
+
+# ---------------------------------------------------------------------------------------------
+# library api
+# ---------------------------------------------------------------------------------------------
+
+# load an image from disk, always convert to RGB
+def get_image(path: str) -> Image.Image:
+   image = Image.open(path).convert("RGB") # open w pillow and force rgb
+   return image
+
+# anything image like (path, pillow image, array) to an H x W x 3 rgb array without per pixel copies
+def to_rgb_array(source) -> np.ndarray:
+   if isinstance(source, (str, os.PathLike)):
+      source = get_image(source)
+   if isinstance(source, Image.Image):
+      if source.mode != "RGB":
+         source = source.convert("RGB")
+      return np.asarray(source)
+
+   rgb = np.asarray(source)
+   if rgb.ndim == 2: # grayscale, same value in every channel
+      rgb = np.stack([rgb] * 3, axis=-1)
+   if rgb.ndim != 3 or rgb.shape[2] < 3:
+      raise ValueError(f"Expected an H x W x 3 rgb array, got shape {rgb.shape}")
+   return rgb[..., :3]
+
+# compress an image (array, pillow image or path) to .jpc bytes
+# progressive=True writes DC first then AC bands (v8), so a cut off download still decodes (decode_preview)
+def encode(source, quality: int = DEFAULT_QUALITY, workers: int = 1, use_threads: bool = False,
+           sampling: str = DEFAULT_SAMPLING, tile_size=DEFAULT_TILE_SIZE, transform: str = DEFAULT_TRANSFORM,
+           progressive: bool = False, chroma_filter: str = "box") -> bytes:
+   with instrumentation.stage("encode"):
+      compressed = compress_image(source, quality, workers, use_threads, sampling, chroma_filter, transform)
+      return bytes(compressed_to_bytes(compressed, tile_size, progressive))
+
+# decompress .jpc bytes (or a .jpc file path) to an H x W x 3 uint8 rgb array
+# scale 2, 4 or 8 decodes a 1/2, 1/4 or 1/8 size preview for much less work
+def decode(source: Union[bytes, bytearray, memoryview, str, os.PathLike], workers: int = 1,
+           use_threads: bool = False, scale: int = 1, transform: str = DEFAULT_TRANSFORM) -> np.ndarray:
+   if scale not in SCALES:
+      raise ValueError(f"scale must be one of {SCALES}, got {scale}")
+   # a scaled decode never looks past the k x k corner of a block, so the entropy decoder stops there too
+   total_length = zigzag_corner_length(block_size // scale) if scale != 1 else 64
+   with instrumentation.stage("decode"):
+      if isinstance(source, (str, os.PathLike)):
+         compressed = read_JPC_file(source, workers, use_threads, total_length)
+      else:
+         compressed = parse_JPC(source, workers, use_threads, total_length)
+      return decompress_array(compressed, workers, use_threads, scale, transform)
+
+# decode whatever a (possibly cut off) progressive .jpc holds: every complete scan plus the blocks a cut scan
+# got to, with the coefficients that havent arrived left at 0 (a missing DC is mid grey, not black); once the
+# DC scan is in that is a blocky full size image that sharpens scan by scan. returns the H x W x 3 uint8 array
+# and how many scans were complete
+# (a complete non progressive file decodes normally and counts as 1 scan)
+def decode_preview(prefix: Union[bytes, bytearray, memoryview], workers: int = 1, use_threads: bool = False,
+                   scale: int = 1, transform: str = DEFAULT_TRANSFORM):
+   with instrumentation.stage("decode"):
+      data = memoryview(prefix)
+      header = read_header(data)
+      if header["scans"] is None:
+         return decompress_array(parse_JPC(data, workers, use_threads), workers, use_threads, scale, transform), 1
+      with instrumentation.stage("huffman_decode"):
+         channels, complete = _decode_scans(data, header, partial=True)
+      with instrumentation.stage("rle"):
+         compressed = _compressed_image(header, *[rle_encode_blocks(zz) for zz in channels])
+      instrumentation.count("scans_decoded", complete)
+      return decompress_array(compressed, workers, use_threads, scale, transform), complete
+
+# compress an image straight into a writable binary file object
+def encode_to(source, file: BinaryIO, quality: int = DEFAULT_QUALITY, workers: int = 1,
+              use_threads: bool = False, sampling: str = DEFAULT_SAMPLING, tile_size=DEFAULT_TILE_SIZE,
+              transform: str = DEFAULT_TRANSFORM, progressive: bool = False, chroma_filter: str = "box") -> int:
+   with instrumentation.stage("encode"):
+      compressed = compress_image(source, quality, workers, use_threads, sampling, chroma_filter, transform)
+      buffer = compressed_to_bytes(compressed, tile_size, progressive)
+   with instrumentation.stage("file_write"):
+      written = file.write(buffer)
+   instrumentation.count("bytes_written", written)
+   return written
+
+# decompress a .jpc stream from a readable binary file object
+def decode_from(file: BinaryIO, workers: int = 1, use_threads: bool = False, scale: int = 1,
+                transform: str = DEFAULT_TRANSFORM) -> np.ndarray:
+   return decode(file.read(), workers, use_threads, scale, transform)
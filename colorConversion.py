@@ -35,60 +35,61 @@ def ycbcr_to_rgb_pixel(y: int, cb: int, cr: int) -> Tuple[int, int, int]:
 
    return clamp(r), clamp(g), clamp(b) # c l a m p (part 2)
 
+# BT.601 forward / inverse matrices (same coefficients as the pixel functions above)
+RGB_TO_YCBCR_MATRIX = np.array([
+   [ 0.299,     0.587,     0.114   ],
+   [-0.168736, -0.331264,  0.5     ],
+   [ 0.5,      -0.418688, -0.081312],
+])
+YCBCR_OFFSET = np.array([0.0, 128.0, 128.0])
+
+YCBCR_TO_RGB_MATRIX = np.array([
+   [1.0,  0.0,       1.402   ],
+   [1.0, -0.344136, -0.714136],
+   [1.0,  1.772,     0.0     ],
+])
+
+# multiply every pixel of an H by W by 3 buffer with a 3 by 3 matrix
+# the inner sum is accumulated column by column in the same order as the pixel functions so results are bit identical
+# (a plain matmul is allowed to reorder / fuse the adds, which moves some values across the .5 rounding boundary)
+def _apply_matrix(pixels: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+   matrix = matrix.astype(pixels.dtype)
+   out = pixels[..., 0:1] * matrix[:, 0]
+   for k in range(1, 3):
+      out += pixels[..., k:k + 1] * matrix[:, k]
+   return out
+
+# round + clamp a whole float buffer to valid 0 to 255 bytes; np.rint rounds half to even just like round()
+def _clamp_array(values: np.ndarray) -> np.ndarray:
+   return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+# convert an H by W by 3 rgb array to an H by W by 3 uint8 YCbCr array in one pass
+def rgb_to_ycbcr_array(rgb) -> np.ndarray:
+   pixels = np.asarray(rgb)[..., :3].astype(np.float64) # python ints become float64 in the pixel version too
+   return _clamp_array(_apply_matrix(pixels, RGB_TO_YCBCR_MATRIX) + YCBCR_OFFSET)
+
+# convert an H by W by 3 YCbCr array back to an H by W by 3 uint8 rgb array
+def ycbcr_to_rgb_array(ycbcr) -> np.ndarray:
+   pixels = np.asarray(ycbcr)
+   # float32 planes (what the decoder produces) stay float32, same as the pixel version does with numpy scalars
+   if not np.issubdtype(pixels.dtype, np.floating):
+      pixels = pixels.astype(np.float64)
+   shifted = pixels - np.array([0, 128, 128], dtype=pixels.dtype) # remove the 128 offset from cb and cr
+   return _clamp_array(_apply_matrix(shifted, YCBCR_TO_RGB_MATRIX))
+
 # convert pillow rgb image to 3 separate 2d numpy arrays
 def rgb_to_ycbcr_image(img: Image.Image):
-   width, height = img.size
-   pixels = img.load()  # direct pixel access for speed
-
-   # make Python lists first; convert to NumPy later
-   y_channel  = [[0] * width for _ in range(height)]
-   cb_channel = [[0] * width for _ in range(height)]
-   cr_channel = [[0] * width for _ in range(height)]
-
-   # convert each pixel independently
-   for j in range(height): # j is row index
-      for i in range(width): # i is column index
-         r, g, b = pixels[i, j] # read rgb tuple from the original img
+   ycbcr = rgb_to_ycbcr_array(np.asarray(img)) # pillow hands over its buffer, no per pixel access
 
-         # convert pixel from rgb to ycbcr
-         y_val, cb_val, cr_val = rgb_to_ycbcr_pixel(r, g, b)
-
-         # call me grocery the way I store tha shi
-         y_channel[j][i]  = y_val
-         cb_channel[j][i] = cb_val
-         cr_channel[j][i] = cr_val
-
-   # convert lists to float32 NumPy arrays for further processing (DCT, etc.)
+   # float32 planes for further processing (DCT, etc.)
    return (
-      np.array(y_channel, dtype=np.float32),
-      np.array(cb_channel, dtype=np.float32),
-      np.array(cr_channel, dtype=np.float32),
+      ycbcr[..., 0].astype(np.float32),
+      ycbcr[..., 1].astype(np.float32),
+      ycbcr[..., 2].astype(np.float32),
    )
 
 # convert the 3 2d Y Cb Cr arrays to pillow rgb 
 def ycbcr_to_rgb_image(y_channel, cb_channel, cr_channel) -> Image.Image:
-
-   # make sure inputs are numpy, convert if not
-   y_channel = np.array(y_channel)
-   cb_channel = np.array(cb_channel)
-   cr_channel = np.array(cr_channel)
-
-   # get image dimensions from y channel
-   height, width = y_channel.shape
-
-   # create a blank RGB image w same width/height
-   img = Image.new("RGB", (width, height))
-   pixels = img.load()
-
-   # convert each pixel from YCbCr to RGB
-   for j in range(height): # row
-      for i in range(width): # col
-         y_val  = y_channel[j][i]
-         cb_val = cb_channel[j][i]
-         cr_val = cr_channel[j][i]
-
-         # convert ycbcr pixel to an rgb triple
-         r, g, b = ycbcr_to_rgb_pixel(y_val, cb_val, cr_val)
-         pixels[i, j] = (r, g, b) # write rgb pixel into pillow
-
-   return img
+   # stack planes into one H by W by 3 buffer and convert it all at once
+   ycbcr = np.stack([np.asarray(y_channel), np.asarray(cb_channel), np.asarray(cr_channel)], axis=-1)
+   return Image.fromarray(ycbcr_to_rgb_array(ycbcr), "RGB")
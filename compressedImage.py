@@ -0,0 +1,106 @@
+# What compress_image returns and parse_JPC reads back: the image metadata plus one RLEChannel (flat runs uint8,
+# values int16, offsets int32 arrays, see entropyEncoding.py) per Y / Cb / Cr channel. the writer and the
+# decoder work on the arrays directly, nothing is ever expanded into per pair python tuples.
+#
+#    compressed = codec.compress_image(img)
+#    compressed.y, compressed.cb, compressed.cr        # RLEChannels; len() blocks, [i] block views, [a:b] ranges
+#    len(compressed), compressed.nbytes                # blocks and bytes of all three channels
+#    compressed["width"], compressed["y_blocks"]       # still reads like the old dict
+#    compressed.to_dict(legacy=True)                   # old dict with lists of (zeros, value) tuples
+#    CompressedImage.from_dict(old)                    # and back (pair lists or rle array tuples)
+
+import numpy as np
+
+from entropyEncoding import RLEChannel, as_rle_arrays
+from quantization import STANDARD_LUMA_Q
+from jpcOptions import DEFAULT_QUALITY, DEFAULT_SAMPLING
+
+CHANNEL_KEYS = ("y_blocks", "cb_blocks", "cr_blocks")
+FIELDS = ("width", "height", "block_size", "quality", "luma_q", "chroma_q", "sampling")
+
+class CompressedImage:
+   __slots__ = FIELDS + ("channels",)
+
+   def __init__(self, width: int, height: int, block_size: int, y, cb, cr, quality: int = DEFAULT_QUALITY,
+                luma_q=STANDARD_LUMA_Q, chroma_q=STANDARD_LUMA_Q, sampling: str = DEFAULT_SAMPLING):
+      self.width = width
+      self.height = height
+      self.block_size = block_size
+      self.quality = quality
+      self.luma_q = luma_q
+      self.chroma_q = chroma_q
+      self.sampling = sampling
+      # RLEChannels, rle array tuples or legacy pair lists
+      self.channels = tuple(blocks if isinstance(blocks, RLEChannel) else RLEChannel(*as_rle_arrays(blocks))
+                            for blocks in (y, cb, cr))
+
+   # from a compress_image style dict; missing tables / quality / sampling get the same defaults the old
+   # readers used (old dicts had the luma table for chroma too)
+   @classmethod
+   def from_dict(cls, compressed) -> "CompressedImage":
+      if isinstance(compressed, cls):
+         return compressed
+      return cls(compressed["width"], compressed["height"], compressed["block_size"],
+                 *[compressed[key] for key in CHANNEL_KEYS],
+                 quality=compressed.get("quality", DEFAULT_QUALITY),
+                 luma_q=compressed.get("luma_q", STANDARD_LUMA_Q),
+                 chroma_q=compressed.get("chroma_q", STANDARD_LUMA_Q),
+                 sampling=compressed.get("sampling", DEFAULT_SAMPLING))
+
+   # the old dict; legacy=True turns the channels into lists of [(zeros, value), ...] blocks,
+   # otherwise they stay (runs, values, offsets) array tuples
+   def to_dict(self, legacy: bool = False) -> dict:
+      result = {field: getattr(self, field) for field in FIELDS}
+      for key, channel in zip(CHANNEL_KEYS, self.channels):
+         result[key] = channel.to_pairs() if legacy else channel.arrays()
+      return result
+
+   @property
+   def y(self) -> RLEChannel:
+      return self.channels[0]
+
+   @property
+   def cb(self) -> RLEChannel:
+      return self.channels[1]
+
+   @property
+   def cr(self) -> RLEChannel:
+      return self.channels[2]
+
+   # blocks over all three channels
+   def __len__(self) -> int:
+      return sum(len(channel) for channel in self.channels)
+
+   # bytes held by the rle arrays (the metadata is a few hundred bytes on top)
+   @property
+   def nbytes(self) -> int:
+      return sum(channel.nbytes for channel in self.channels)
+
+   # read only mapping view with the old dict's keys, so code written against the dict keeps working
+   def __getitem__(self, key: str):
+      if key in CHANNEL_KEYS:
+         return self.channels[CHANNEL_KEYS.index(key)]
+      if key in FIELDS:
+         return getattr(self, key)
+      raise KeyError(key)
+
+   def get(self, key: str, default=None):
+      return self[key] if key in self else default
+
+   def __contains__(self, key) -> bool:
+      return key in FIELDS or key in CHANNEL_KEYS
+
+   def keys(self):
+      return FIELDS + CHANNEL_KEYS
+
+   def __eq__(self, other) -> bool:
+      if not isinstance(other, CompressedImage):
+         return NotImplemented
+      return (all(np.array_equal(getattr(self, field), getattr(other, field)) for field in FIELDS)
+              and self.channels == other.channels)
+
+   __hash__ = None
+
+   def __repr__(self) -> str:
+      return (f"CompressedImage({self.width} x {self.height}, quality {self.quality}, {self.sampling}, "
+              f"{len(self)} blocks, {self.nbytes} bytes)")
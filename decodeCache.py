@@ -0,0 +1,189 @@
+# In-process cache in front of codec.decode, for services that decode the same hot .jpc files over and over.
+#
+#    cache = decodeCache.DecodeCache(max_bytes=256 << 20)
+#    rgb = cache.decode("hot.jpc")                    # parse + idct + colour convert once, then a dict lookup
+#    thumb = cache.decode("hot.jpc", scale=4)         # reuses the parsed coefficients of the first call
+#    crop = cache.decode_region("hot.jpc", x, y, w, h)  # crops a cached decode, or decodes the blocks under it
+#    cache.stats()                                    # hits / misses / evictions / bytes of both levels
+#
+# two levels, each an LRU under its own byte budget:
+#    decoded       finished H x W x 3 arrays, keyed by file, scale or region and transform
+#    coefficients  the parsed file (codec.parse_JPC's CompressedImage), keyed by file only, so other scales
+#                  and full size decodes skip the file read and the huffman decode
+# files are keyed by path + mtime + size (key="stat", no read needed to check) or by a hash of the contents
+# (key="hash"); bytes sources are always hashed. so a rewritten file is a new key, and its old entries just age out.
+# returned arrays are the cached ones, read only; copy before writing to them.
+# counters also go to instrumentation (cache_hits / cache_misses / cache_evictions per level) when it collects.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Union
+
+import numpy as np
+
+import instrumentation
+from codec import parse_JPC, decompress_array, decompress_region, decode_region
+from compressedImage import CompressedImage
+from jpcOptions import SCALES, DEFAULT_TRANSFORM
+
+DEFAULT_MAX_BYTES = 256 << 20             # decoded arrays
+DEFAULT_COEFFICIENT_BYTES = 64 << 20      # parsed files
+KEYS = ("stat", "hash")
+
+# one LRU level: key -> (value, size in bytes), oldest first
+class _LRU:
+   def __init__(self, name: str, max_bytes: int):
+      self.name = name
+      self.max_bytes = max_bytes
+      self.entries = OrderedDict()
+      self.bytes = 0
+      self.hits = 0
+      self.misses = 0
+      self.evictions = 0
+
+   def get(self, key):
+      entry = self.entries.get(key)
+      if entry is None:
+         self.misses += 1
+         instrumentation.count("cache_misses", 1, self.name)
+         return None
+      self.entries.move_to_end(key)
+      self.hits += 1
+      instrumentation.count("cache_hits", 1, self.name)
+      return entry[0]
+
+   # anything bigger than the whole budget isnt kept (it would only push everything else out)
+   def put(self, key, value, size: int) -> None:
+      if size > self.max_bytes:
+         return
+      old = self.entries.pop(key, None)
+      if old is not None:
+         self.bytes -= old[1]
+      self.entries[key] = (value, size)
+      self.bytes += size
+      while self.bytes > self.max_bytes:
+         _, (_, evicted_size) = self.entries.popitem(last=False)
+         self.bytes -= evicted_size
+         self.evictions += 1
+         instrumentation.count("cache_evictions", 1, self.name)
+
+   def clear(self) -> None:
+      self.entries.clear()
+      self.bytes = 0
+
+   def stats(self) -> dict:
+      return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": len(self.entries),
+              "bytes": self.bytes, "max_bytes": self.max_bytes}
+
+# bytes of a parsed file: the rle arrays of the three channels
+def _compressed_size(compressed: CompressedImage) -> int:
+   return compressed.nbytes
+
+class DecodeCache:
+   # coefficient_bytes=0 turns the coefficient level off; workers / use_threads are passed on to the decoder
+   def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, coefficient_bytes: int = DEFAULT_COEFFICIENT_BYTES,
+                key: str = "stat", workers: int = 1, use_threads: bool = False):
+      if key not in KEYS:
+         raise ValueError(f"key must be one of {KEYS}, got {key!r}")
+      self.key = key
+      self.workers = workers
+      self.use_threads = use_threads
+      self.decoded = _LRU("decoded", max_bytes)
+      self.coefficients = _LRU("coefficients", coefficient_bytes)
+      self.lock = threading.Lock() # guards the LRUs only; decodes run outside it
+
+   # (file key, file bytes or None); stat keys dont read the file, hash keys have to and hand the bytes on
+   def _file_key(self, source):
+      if isinstance(source, (str, os.PathLike)):
+         if self.key == "stat":
+            info = os.stat(source)
+            return ("stat", os.path.abspath(source), info.st_mtime_ns, info.st_size), None
+         with open(source, "rb") as f:
+            data = f.read()
+      else:
+         data = bytes(source)
+      return ("hash", hashlib.blake2b(data, digest_size=16).digest()), data
+
+   def _lookup(self, level: _LRU, key):
+      with self.lock:
+         return level.get(key)
+
+   def _store(self, level: _LRU, key, value, size: int) -> None:
+      with self.lock:
+         level.put(key, value, size)
+
+   # parsed file from the coefficient level, read and parsed on a miss
+   def _compressed(self, source, file_key, data) -> CompressedImage:
+      compressed = self._lookup(self.coefficients, file_key)
+      if compressed is None:
+         if data is None:
+            with open(source, "rb") as f:
+               data = f.read()
+         compressed = parse_JPC(data, self.workers, self.use_threads)
+         self._store(self.coefficients, file_key, compressed, _compressed_size(compressed))
+      return compressed
+
+   @staticmethod
+   def _frozen(array: np.ndarray) -> np.ndarray:
+      array.setflags(write=False)
+      return array
+
+   # codec.decode through the cache; source is a .jpc path or .jpc bytes
+   def decode(self, source: Union[bytes, bytearray, memoryview, str, os.PathLike], scale: int = 1,
+              transform: str = DEFAULT_TRANSFORM) -> np.ndarray:
+      if scale not in SCALES:
+         raise ValueError(f"scale must be one of {SCALES}, got {scale}")
+      file_key, data = self._file_key(source)
+      key = (file_key, "scale", scale, transform)
+      rgb = self._lookup(self.decoded, key)
+      if rgb is None:
+         compressed = self._compressed(source, file_key, data)
+         rgb = self._frozen(decompress_array(compressed, self.workers, self.use_threads, scale, transform))
+         self._store(self.decoded, key, rgb, rgb.nbytes)
+      return rgb
+
+   # codec.decode_region through the cache: a cached full size decode is just cropped, cached coefficients only
+   # decode the blocks under the region, otherwise only the tiles under it are read (codec.decode_region); the
+   # crop is cached on its own either way
+   def decode_region(self, source: Union[bytes, bytearray, memoryview, str, os.PathLike], x: int, y: int, w: int,
+                     h: int, transform: str = DEFAULT_TRANSFORM) -> np.ndarray:
+      file_key, data = self._file_key(source)
+      key = (file_key, "region", x, y, w, h, transform)
+      rgb = self._lookup(self.decoded, key)
+      if rgb is not None:
+         return rgb
+      full = self._lookup(self.decoded, (file_key, "scale", 1, transform))
+      if full is not None:
+         if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > full.shape[1] or y + h > full.shape[0]:
+            raise ValueError(f"Region {x}, {y}, {w}, {h} is not inside the {full.shape[1]} x {full.shape[0]} image")
+         rgb = np.array(full[y:y + h, x:x + w])
+      else:
+         compressed = self._lookup(self.coefficients, file_key)
+         if compressed is not None:
+            rgb = decompress_region(compressed, x, y, w, h, transform)
+         else:
+            rgb = decode_region(source if data is None else data, x, y, w, h, self.workers, self.use_threads,
+                                transform)
+      rgb = self._frozen(rgb)
+      self._store(self.decoded, key, rgb, rgb.nbytes)
+      return rgb
+
+   def stats(self) -> dict:
+      with self.lock:
+         return {"decoded": self.decoded.stats(), "coefficients": self.coefficients.stats()}
+
+   def clear(self) -> None:
+      with self.lock:
+         self.decoded.clear()
+         self.coefficients.clear()
+
+# one cache for the whole process, for callers that dont want to hold their own
+default_cache = DecodeCache()
+
+def cached_decode(source, scale: int = 1, transform: str = DEFAULT_TRANSFORM) -> np.ndarray:
+   return default_cache.decode(source, scale, transform)
+
+def cached_decode_region(source, x: int, y: int, w: int, h: int, transform: str = DEFAULT_TRANSFORM) -> np.ndarray:
+   return default_cache.decode_region(source, x, y, w, h, transform)
@@ -1,5 +1,7 @@
 
+from functools import lru_cache
 from typing import List, Tuple # type hints
+import numpy as np # batch versions work on whole (N, 64) tensors
 
 
 # zigzag order for an 8 by 8 block
@@ -21,6 +23,11 @@ zigzag_indexes = [
    (7, 7),
 ]
 
+# same order as flat (row * 8 + col) indexes, so a whole stack of blocks reorders in one fancy index
+ZIGZAG_FLAT = np.array([y * 8 + x for (y, x) in zigzag_indexes], dtype=np.intp)
+# and the inverse permutation, zigzag position of every raster position
+INVERSE_ZIGZAG_FLAT = np.argsort(ZIGZAG_FLAT)
+
 # convert 8 by 8 block into 1d vector using zigzag order
 def zigzag_scan(block: List[List[int]]) -> List[int]:
    # for each row / col in the indexes, take element from block and convert to 1d list of 64 coefficients
@@ -73,3 +80,749 @@ def rle_decode(encoded: List[Tuple[int, int]], total_length: int = 64) -> List[i
       coeffs = coeffs[:total_length]
 
    return coeffs
+
+# batch zigzag; (N, 8, 8) blocks to (N, 64) zigzag vectors in one go
+def zigzag_scan_blocks(blocks) -> np.ndarray:
+   blocks = np.asarray(blocks)
+   return blocks.reshape(-1, 64)[:, ZIGZAG_FLAT]
+
+# batch zigzag backwards; (N, 64) zigzag vectors to (N, 8, 8) blocks
+def inverse_zigzag_scan_blocks(vecs) -> np.ndarray:
+   vecs = np.asarray(vecs)
+   return vecs.reshape(-1, 64)[:, INVERSE_ZIGZAG_FLAT].reshape(-1, 8, 8)
+
+# zigzag prefix length that holds the whole top left k x k corner of a block; a scaled decode only
+# has to expand the rle data this far
+def zigzag_corner_length(k: int) -> int:
+   return int(INVERSE_ZIGZAG_FLAT.reshape(8, 8)[:k, :k].max()) + 1
+
+# (N, zigzag_corner_length(k)) or longer zigzag vectors to the (N, k, k) low frequency corner of each block
+def inverse_zigzag_corner_blocks(vecs, k: int) -> np.ndarray:
+   vecs = np.asarray(vecs)
+   return vecs[:, INVERSE_ZIGZAG_FLAT.reshape(8, 8)[:k, :k].ravel()].reshape(-1, k, k)
+
+# index of the last non0 value in every row of an (N, 64) tensor, -1 for all 0 rows
+# argmax on the reversed mask finds the first True from the end
+def last_nonzero(vecs) -> np.ndarray:
+   nonzero = np.asarray(vecs) != 0
+   last = nonzero.shape[1] - 1 - np.argmax(nonzero[:, ::-1], axis=1)
+   last[~nonzero[np.arange(len(last)), last]] = -1 # argmax gives 0 when nothing is set
+   return last
+
+# batch rle_encode for a whole channel of (N, 64) zigzag vectors
+# returns flat arrays instead of lists of tuples: runs (zero count before each value), values,
+# and offsets where block i owns pairs offsets[i]:offsets[i + 1]
+# same pairs as rle_encode, including a single (0, 0) for an all zero block
+def rle_encode_blocks(vecs) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+   vecs = np.asarray(vecs)
+   if vecs.ndim != 2: # (N, 8, 8) blocks; an empty (0, 64) channel cant be reshaped with -1
+      vecs = vecs.reshape(len(vecs), -1)
+   block_count = len(vecs)
+
+   # every non0 value in block then position order; trailing 0s never show up so nothing to trim
+   block_ids, positions = np.nonzero(vecs)
+   values = vecs[block_ids, positions]
+
+   # zero run = distance to the previous non0 in the same block (or to the block start)
+   previous = np.empty_like(positions)
+   previous[1:] = positions[:-1]
+   first_in_block = np.ones(len(positions), dtype=bool)
+   first_in_block[1:] = block_ids[1:] != block_ids[:-1]
+   previous[first_in_block] = -1
+   runs = positions - previous - 1
+
+   # all 0 blocks still get their (0, 0) pair
+   empty = np.flatnonzero(last_nonzero(vecs) == -1)
+   if len(empty):
+      block_ids = np.concatenate([block_ids, empty])
+      runs = np.concatenate([runs, np.zeros(len(empty), dtype=runs.dtype)])
+      values = np.concatenate([values, np.zeros(len(empty), dtype=values.dtype)])
+      order = np.argsort(block_ids, kind="stable")
+      block_ids, runs, values = block_ids[order], runs[order], values[order]
+
+   offsets = np.zeros(block_count + 1, dtype=np.int32)
+   np.cumsum(np.bincount(block_ids, minlength=block_count), out=offsets[1:])
+   return runs.astype(np.uint8), values.astype(np.int16), offsets
+
+# batch rle_decode; scatter the flat (runs, values, offsets) arrays back into an (N, total_length) tensor
+def rle_decode_blocks(runs, values, offsets, total_length: int = 64) -> np.ndarray:
+   offsets = np.asarray(offsets, dtype=np.int64)
+   block_count = len(offsets) - 1
+   block_ids = np.repeat(np.arange(block_count), np.diff(offsets))
+
+   # each pair moves the position forward by its zeros + 1; position inside the block is that
+   # running total minus the total at the start of the block
+   steps = np.cumsum(np.asarray(runs, dtype=np.int64) + 1)
+   block_start = np.concatenate(([0], steps))[offsets[:-1]]
+   positions = steps - block_start[block_ids] - 1
+
+   out = np.zeros((block_count, total_length), dtype=np.int32)
+   keep = positions < total_length # anything past the end gets truncated, same as rle_decode
+   out[block_ids[keep], positions[keep]] = np.asarray(values)[keep]
+   return out
+
+# flat rle arrays to the legacy list of [(zeros, value), ...] blocks
+def rle_arrays_to_pairs(runs, values, offsets) -> List[List[Tuple[int, int]]]:
+   pairs = list(zip(np.asarray(runs).tolist(), np.asarray(values).tolist()))
+   bounds = np.asarray(offsets).tolist()
+   return [pairs[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+# rle channel data as flat (runs, values, offsets) arrays, whether it already is, is an RLEChannel or is a
+# legacy list of pair lists
+def as_rle_arrays(blocks) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+   if isinstance(blocks, RLEChannel):
+      return blocks.runs, blocks.values, blocks.offsets
+   if isinstance(blocks, tuple):
+      return blocks
+   return rle_pairs_to_arrays(blocks)
+
+# legacy list of [(zeros, value), ...] blocks to flat rle arrays
+def rle_pairs_to_arrays(blocks) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+   flat = np.array([pair for rle_block in blocks for pair in rle_block], dtype=np.int32).reshape(-1, 2)
+   offsets = np.zeros(len(blocks) + 1, dtype=np.int32)
+   np.cumsum([len(rle_block) for rle_block in blocks], out=offsets[1:])
+   return flat[:, 0].astype(np.uint8), flat[:, 1].astype(np.int16), offsets
+
+# one channel of rle data in the flat arrays above: runs uint8, values int16, offsets int32 (block count + 1)
+# 3 bytes a pair + 4 a block, where a list of (zeros, value) tuples costs ~70 bytes a pair in python objects
+# len() is the block count, channel[i] is block i's (runs, values) as views, channel[a:b] is an RLEChannel of
+# views with the offsets rebased to 0; iterating gives the blocks in order
+class RLEChannel:
+   __slots__ = ("runs", "values", "offsets")
+
+   def __init__(self, runs, values, offsets):
+      self.runs = np.asarray(runs, dtype=np.uint8)
+      self.values = np.asarray(values, dtype=np.int16)
+      self.offsets = np.asarray(offsets, dtype=np.int32)
+      if self.offsets.ndim != 1 or len(self.offsets) == 0 or len(self.runs) != len(self.values) \
+            or self.offsets[-1] != len(self.runs):
+         raise ValueError("rle offsets must have block count + 1 entries ending at the pair count")
+
+   @classmethod
+   def from_pairs(cls, blocks) -> "RLEChannel":
+      return cls(*rle_pairs_to_arrays(blocks))
+
+   @classmethod
+   def from_blocks(cls, vecs) -> "RLEChannel":
+      return cls(*rle_encode_blocks(vecs))
+
+   def __len__(self) -> int:
+      return len(self.offsets) - 1
+
+   def __getitem__(self, index):
+      if isinstance(index, slice):
+         start, stop, step = index.indices(len(self))
+         if step != 1:
+            raise ValueError("rle channels only slice contiguous block ranges")
+         stop = max(start, stop)
+         first, last = self.offsets[start], self.offsets[stop]
+         return RLEChannel(self.runs[first:last], self.values[first:last], self.offsets[start:stop + 1] - first)
+      if index < 0:
+         index += len(self)
+      if not 0 <= index < len(self):
+         raise IndexError("block index out of range")
+      first, last = self.offsets[index], self.offsets[index + 1]
+      return self.runs[first:last], self.values[first:last]
+
+   # (runs, values, offsets), what rle_decode_blocks and the writer take
+   def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+      return self.runs, self.values, self.offsets
+
+   # back to the (N, total_length) zigzag coefficients
+   def decode(self, total_length: int = 64) -> np.ndarray:
+      return rle_decode_blocks(self.runs, self.values, self.offsets, total_length)
+
+   # the legacy list of [(zeros, value), ...] blocks
+   def to_pairs(self) -> List[List[Tuple[int, int]]]:
+      return rle_arrays_to_pairs(self.runs, self.values, self.offsets)
+
+   @property
+   def nbytes(self) -> int:
+      return self.runs.nbytes + self.values.nbytes + self.offsets.nbytes
+
+   def __eq__(self, other) -> bool:
+      if not isinstance(other, RLEChannel):
+         return NotImplemented
+      return (np.array_equal(self.offsets, other.offsets) and np.array_equal(self.runs, other.runs)
+              and np.array_equal(self.values, other.values))
+
+   __hash__ = None
+
+   def __repr__(self) -> str:
+      return f"RLEChannel({len(self)} blocks, {len(self.runs)} pairs, {self.nbytes} bytes)"
+
+# ---------------------------------------------------------------------------------------------
+# huffman stage; JPEG style (run, size) symbols + magnitude bits, tables optimized per image
+# a table is (bits, huffval): bits[i] = how many codes of length i + 1 (16 entries), huffval = symbols in code order
+# ---------------------------------------------------------------------------------------------
+
+# special AC symbols
+EOB_SYMBOL = 0x00 # end of block, rest of the block is 0
+ZRL_SYMBOL = 0xF0 # run of 16 zeros
+
+# magnitude category (bit length of |value|) for a whole array; frexp exponent is exactly that, and 0 for 0
+def magnitude_sizes(values) -> np.ndarray:
+   return np.frexp(np.abs(np.asarray(values, dtype=np.float64)))[1].astype(np.int64)
+
+# extra bits for a value of a given size; negatives are stored as value + 2^size - 1 (leading bit 0)
+def magnitude_bits(values, sizes) -> np.ndarray:
+   values = np.asarray(values, dtype=np.int64)
+   return np.where(values < 0, values + (np.int64(1) << sizes) - 1, values)
+
+# undo magnitude_bits for one value (decoder side)
+def _extend(extra: int, size: int) -> int:
+   if extra < (1 << (size - 1)):
+      return extra - (1 << size) + 1
+   return extra
+
+# turn an (N, 64) zigzag channel into the stream of huffman symbols in write order
+# returns is_ac (which table), symbols, extra bit values and extra bit lengths, one entry per symbol
+# DC is coded as the difference to the previous block's DC, AC as (run, size) pairs with ZRL for runs
+# over 15 and EOB after the last non0 value (unless that value is the 64th coefficient)
+def huffman_symbols(zz) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+   zz = np.asarray(zz, dtype=np.int64).reshape(-1, 64)
+   block_count = len(zz)
+   blocks = np.arange(block_count, dtype=np.int64)
+
+   # DC differences
+   dc_diff = np.diff(zz[:, 0], prepend=0)
+   dc_size = magnitude_sizes(dc_diff)
+
+   # AC non0 values and the zero run in front of each
+   block_ids, positions = np.nonzero(zz[:, 1:])
+   positions = positions + 1
+   ac_values = zz[block_ids, positions]
+   previous = np.zeros_like(positions)
+   previous[1:] = positions[:-1]
+   first_in_block = np.ones(len(positions), dtype=bool)
+   first_in_block[1:] = block_ids[1:] != block_ids[:-1]
+   previous[first_in_block] = 0
+   runs = positions - previous - 1
+   ac_size = magnitude_sizes(ac_values)
+
+   # ZRLs in front of long runs; at most 3 (a run is at most 62 long)
+   zrl_count = runs // 16
+   zrl_owner = np.repeat(np.arange(len(runs)), zrl_count)
+   zrl_index = np.arange(len(zrl_owner)) - np.repeat(np.cumsum(zrl_count) - zrl_count, zrl_count)
+
+   # EOB for every block that doesnt end on a non0 64th coefficient
+   eob_blocks = blocks[zz[:, 63] == 0]
+
+   # sort keys put everything in stream order: (block, position, slot), ZRLs use slots 0-2, the symbol itself slot 3
+   def key(block, position, slot):
+      return (block * 64 + position) * 4 + slot
+
+   keys = np.concatenate([
+      key(blocks, 0, 3),
+      key(block_ids[zrl_owner], positions[zrl_owner], zrl_index),
+      key(block_ids, positions, 3),
+      key(eob_blocks, 63, 3),
+   ])
+   is_ac = np.concatenate([
+      np.zeros(block_count, dtype=bool),
+      np.ones(len(zrl_owner) + len(runs) + len(eob_blocks), dtype=bool),
+   ])
+   symbols = np.concatenate([
+      dc_size,
+      np.full(len(zrl_owner), ZRL_SYMBOL),
+      ((runs % 16) << 4) | ac_size,
+      np.full(len(eob_blocks), EOB_SYMBOL),
+   ])
+   extra_values = np.concatenate([
+      magnitude_bits(dc_diff, dc_size),
+      np.zeros(len(zrl_owner), dtype=np.int64),
+      magnitude_bits(ac_values, ac_size),
+      np.zeros(len(eob_blocks), dtype=np.int64),
+   ])
+   extra_lengths = np.concatenate([
+      dc_size,
+      np.zeros(len(zrl_owner), dtype=np.int64),
+      ac_size,
+      np.zeros(len(eob_blocks), dtype=np.int64),
+   ])
+
+   order = np.argsort(keys)
+   return is_ac[order], symbols[order].astype(np.int64), extra_values[order], extra_lengths[order]
+
+# optimal code lengths limited to 16 bits, straight from JPEG Annex K.2 / K.3
+# frequencies: 256 symbol counts; returns the (bits, huffval) table
+def build_huffman_table(frequencies) -> Tuple[List[int], List[int]]:
+   freq = [int(f) for f in frequencies] + [1] # reserved symbol 256 so no real code is all 1s
+   code_size = [0] * 257
+   others = [-1] * 257
+
+   while True:
+      # two least frequent symbols (ties go to the larger symbol value)
+      v1 = v2 = -1
+      for v in range(257):
+         if freq[v] and (v1 == -1 or freq[v] <= freq[v1]):
+            v1 = v
+      for v in range(257):
+         if freq[v] and v != v1 and (v2 == -1 or freq[v] <= freq[v2]):
+            v2 = v
+      if v2 == -1:
+         break
+
+      # merge v2 into v1 and lengthen both chains
+      freq[v1] += freq[v2]
+      freq[v2] = 0
+      code_size[v1] += 1
+      while others[v1] != -1:
+         v1 = others[v1]
+         code_size[v1] += 1
+      others[v1] = v2
+      code_size[v2] += 1
+      while others[v2] != -1:
+         v2 = others[v2]
+         code_size[v2] += 1
+
+   bits = [0] * 33
+   for size in code_size:
+      if size:
+         bits[size] += 1
+
+   # squeeze codes longer than 16 bits back in (Annex K.3)
+   for i in range(32, 16, -1):
+      while bits[i] > 0:
+         j = i - 2
+         while bits[j] == 0:
+            j -= 1
+         bits[i] -= 2
+         bits[i - 1] += 1
+         bits[j + 1] += 2
+         bits[j] -= 1
+
+   # drop the reserved symbol from the longest length
+   i = 16
+   while i > 0 and bits[i] == 0:
+      i -= 1
+   if i > 0:
+      bits[i] -= 1
+
+   huffval = [v for size in range(1, 33) for v in range(256) if code_size[v] == size]
+   return bits[1:17], huffval
+
+# canonical codes from a table (Annex C); returns codes and lengths indexed by symbol
+def huffman_codes(table) -> Tuple[np.ndarray, np.ndarray]:
+   bits, huffval = table
+   codes = np.zeros(256, dtype=np.int64)
+   lengths = np.zeros(256, dtype=np.int64)
+   code = 0
+   k = 0
+   for length in range(1, 17):
+      for _ in range(bits[length - 1]):
+         codes[huffval[k]] = code
+         lengths[huffval[k]] = length
+         code += 1
+         k += 1
+      code <<= 1
+   return codes, lengths
+
+# serialize a table; 16 count bytes then the symbols
+def huffman_table_bytes(table) -> bytes:
+   bits, huffval = table
+   return bytes(bits) + bytes(huffval)
+
+# read a table written by huffman_table_bytes from a buffer at pos; returns the table and the position after it
+def read_huffman_table(data, pos: int) -> Tuple[Tuple[List[int], List[int]], int]:
+   bits = list(data[pos:pos + 16])
+   huffval = list(data[pos + 16:pos + 16 + sum(bits)])
+   return (bits, huffval), pos + 16 + sum(bits)
+
+# pack (value, length) bit strings msb first into one preallocated byte buffer
+# items never share bits so OR is the same as ADD, and every item only touches the 5 bytes
+# starting at its first byte, so the whole stream is one bincount instead of a per symbol loop
+# the last byte is padded with 1 bits like JPEG does
+def pack_bits(values, lengths) -> bytes:
+   values = np.asarray(values, dtype=np.uint64)
+   lengths = np.asarray(lengths, dtype=np.int64)
+   starts = np.cumsum(lengths) - lengths
+   total_bits = int(lengths.sum())
+   total_bytes = (total_bits + 7) // 8
+
+   # line every item up in a 40 bit window that starts on its first byte
+   first_byte = starts >> 3
+   window = values << (40 - (starts & 7) - lengths).astype(np.uint64)
+
+   out = np.zeros(total_bytes + 5, dtype=np.float64)
+   for k in range(5):
+      byte_values = (window >> np.uint64(32 - 8 * k)) & np.uint64(0xFF)
+      out += np.bincount(first_byte + k, weights=byte_values.astype(np.float64), minlength=len(out))
+   packed = out[:total_bytes].astype(np.uint8)
+
+   if total_bits % 8:
+      packed[-1] |= (1 << (8 - total_bits % 8)) - 1
+   return packed.tobytes()
+
+# huffman encode one (N, 64) zigzag channel with the given DC and AC tables
+def huffman_encode_channel(zz, dc_table, ac_table) -> bytes:
+   is_ac, symbols, extra_values, extra_lengths = huffman_symbols(zz)
+   dc_codes, dc_lengths = huffman_codes(dc_table)
+   ac_codes, ac_lengths = huffman_codes(ac_table)
+
+   code_values = np.where(is_ac, ac_codes[symbols], dc_codes[symbols])
+   code_lengths = np.where(is_ac, ac_lengths[symbols], dc_lengths[symbols])
+   if np.any(code_lengths == 0):
+      raise ValueError("Symbol missing from huffman table")
+
+   # code followed by its extra bits, as one bit string per symbol (at most 16 + 15 bits)
+   return pack_bits((code_values << extra_lengths) | extra_values, code_lengths + extra_lengths)
+
+# 16 bit lookup tables: any 16 bits that start with a code map to that code's symbol and length
+# a tiled file decodes every tile channel with the same few tables, so they are built once per table
+def _huffman_lookup(table) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+   return _cached_lookup(tuple(table[0]), tuple(table[1]))[:2]
+
+# and the bits to step over for any 16 bit peek: the code plus the extra bits that follow it
+def _huffman_skip_lookup(table) -> Tuple[int, ...]:
+   return _cached_lookup(tuple(table[0]), tuple(table[1]))[2]
+
+@lru_cache(maxsize=64)
+def _cached_lookup(bits: tuple, huffval: tuple):
+   codes, lengths = huffman_codes((list(bits), list(huffval)))
+   lut_symbol = np.zeros(1 << 16, dtype=np.int64)
+   lut_length = np.zeros(1 << 16, dtype=np.int64) # 0 = not a valid code
+   for symbol in huffval:
+      shift = 16 - int(lengths[symbol])
+      start = int(codes[symbol]) << shift
+      lut_symbol[start:start + (1 << shift)] = symbol
+      lut_length[start:start + (1 << shift)] = lengths[symbol]
+   lut_skip = lut_length + (lut_symbol & 15)
+   return tuple(lut_symbol.tolist()), tuple(lut_length.tolist()), tuple(lut_skip.tolist())
+
+# huffman decode one channel of block_count blocks back into an (N, 64) zigzag tensor
+# total_length < 64 only keeps the first total_length zigzag coefficients of every block (scaled decodes, see
+# zigzag_corner_length); the codes after that are stepped over without decoding their values, the rest stays 0
+def huffman_decode_channel(data, block_count: int, dc_table, ac_table, total_length: int = 64) -> np.ndarray:
+   dc_symbol, dc_length = _huffman_lookup(dc_table)
+   ac_symbol, ac_length = _huffman_lookup(ac_table)
+   if total_length < 64:
+      ac_skip = _huffman_skip_lookup(ac_table)
+   data = bytes(data) + b"\xff" * 4 # padding so a 32 bit window never runs off the end
+   bit_limit = (len(data) - 4) * 8
+   from_bytes = int.from_bytes
+
+   block_ids: List[int] = []
+   positions: List[int] = []
+   values: List[int] = []
+   pos = 0 # bit position
+   dc = 0
+
+   for block in range(block_count):
+      # DC difference
+      byte = pos >> 3
+      window = from_bytes(data[byte:byte + 4], "big")
+      peek = (window >> (16 - (pos & 7))) & 0xFFFF
+      if not dc_length[peek]:
+         raise ValueError("Corrupt JPCS entropy data")
+      size = dc_symbol[peek]
+      pos += dc_length[peek]
+      if size:
+         byte = pos >> 3
+         window = from_bytes(data[byte:byte + 4], "big")
+         dc += _extend((window >> (32 - (pos & 7) - size)) & ((1 << size) - 1), size)
+         pos += size
+      if dc:
+         block_ids.append(block)
+         positions.append(0)
+         values.append(dc)
+
+      # AC (run, size) symbols until EOB or the end of the block
+      k = 1
+      while k < total_length:
+         byte = pos >> 3
+         window = from_bytes(data[byte:byte + 4], "big")
+         peek = (window >> (16 - (pos & 7))) & 0xFFFF
+         if not ac_length[peek]:
+            raise ValueError("Corrupt JPCS entropy data")
+         symbol = ac_symbol[peek]
+         pos += ac_length[peek]
+         size = symbol & 15
+         if size == 0:
+            if symbol == ZRL_SYMBOL:
+               k += 16
+               continue
+            break # EOB
+         k += symbol >> 4
+         byte = pos >> 3
+         window = from_bytes(data[byte:byte + 4], "big")
+         value = _extend((window >> (32 - (pos & 7) - size)) & ((1 << size) - 1), size)
+         pos += size
+         if k < total_length:
+            block_ids.append(block)
+            positions.append(k)
+            values.append(value)
+         k += 1
+      else:
+         # past total_length (no EOB yet): only the bit position matters. EOB is symbol 0, ZRL steps 15 + 1
+         while k < 64:
+            byte = pos >> 3
+            peek = (from_bytes(data[byte:byte + 4], "big") >> (16 - (pos & 7))) & 0xFFFF
+            if not ac_length[peek]:
+               raise ValueError("Corrupt JPCS entropy data")
+            symbol = ac_symbol[peek]
+            pos += ac_skip[peek]
+            if not symbol:
+               break
+            k += (symbol >> 4) + 1
+
+      if pos > bit_limit:
+         raise ValueError("Corrupt JPCS entropy data")
+
+   zz = np.zeros((block_count, 64), dtype=np.int32)
+   zz[block_ids, positions] = values
+   return zz
+
+# per image optimized tables for a group of channels that share them (luma, or cb + cr)
+# returns (dc_table, ac_table)
+def optimized_huffman_tables(channels) -> Tuple[Tuple[List[int], List[int]], Tuple[List[int], List[int]]]:
+   dc_freq = np.zeros(256, dtype=np.int64)
+   ac_freq = np.zeros(256, dtype=np.int64)
+   for zz in channels:
+      dc_counts, ac_counts = huffman_frequencies(zz)
+      dc_freq += dc_counts
+      ac_freq += ac_counts
+   return build_huffman_table(dc_freq), build_huffman_table(ac_freq)
+
+# the typical tables from JPEG Annex K.3; used when a single pass encoder cant collect statistics first
+# they cover every DC size up to 11 and every AC (run, size) up to size 10, which is everything 8 bit input can produce
+STANDARD_LUMA_DC = (
+   [0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0],
+   list(range(12)),
+)
+STANDARD_CHROMA_DC = (
+   [0, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0],
+   list(range(12)),
+)
+STANDARD_LUMA_AC = (
+   [0, 2, 1, 3, 3, 2, 4, 3, 5, 5, 4, 4, 0, 0, 1, 0x7D],
+   [
+      0x01, 0x02, 0x03, 0x00, 0x04, 0x11, 0x05, 0x12, 0x21, 0x31, 0x41, 0x06, 0x13, 0x51, 0x61, 0x07,
+      0x22, 0x71, 0x14, 0x32, 0x81, 0x91, 0xA1, 0x08, 0x23, 0x42, 0xB1, 0xC1, 0x15, 0x52, 0xD1, 0xF0,
+      0x24, 0x33, 0x62, 0x72, 0x82, 0x09, 0x0A, 0x16, 0x17, 0x18, 0x19, 0x1A, 0x25, 0x26, 0x27, 0x28,
+      0x29, 0x2A, 0x34, 0x35, 0x36, 0x37, 0x38, 0x39, 0x3A, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48, 0x49,
+      0x4A, 0x53, 0x54, 0x55, 0x56, 0x57, 0x58, 0x59, 0x5A, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69,
+      0x6A, 0x73, 0x74, 0x75, 0x76, 0x77, 0x78, 0x79, 0x7A, 0x83, 0x84, 0x85, 0x86, 0x87, 0x88, 0x89,
+      0x8A, 0x92, 0x93, 0x94, 0x95, 0x96, 0x97, 0x98, 0x99, 0x9A, 0xA2, 0xA3, 0xA4, 0xA5, 0xA6, 0xA7,
+      0xA8, 0xA9, 0xAA, 0xB2, 0xB3, 0xB4, 0xB5, 0xB6, 0xB7, 0xB8, 0xB9, 0xBA, 0xC2, 0xC3, 0xC4, 0xC5,
+      0xC6, 0xC7, 0xC8, 0xC9, 0xCA, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8, 0xD9, 0xDA, 0xE1, 0xE2,
+      0xE3, 0xE4, 0xE5, 0xE6, 0xE7, 0xE8, 0xE9, 0xEA, 0xF1, 0xF2, 0xF3, 0xF4, 0xF5, 0xF6, 0xF7, 0xF8,
+      0xF9, 0xFA,
+   ],
+)
+STANDARD_CHROMA_AC = (
+   [0, 2, 1, 2, 4, 4, 3, 4, 7, 5, 4, 4, 0, 1, 2, 0x77],
+   [
+      0x00, 0x01, 0x02, 0x03, 0x11, 0x04, 0x05, 0x21, 0x31, 0x06, 0x12, 0x41, 0x51, 0x07, 0x61, 0x71,
+      0x13, 0x22, 0x32, 0x81, 0x08, 0x14, 0x42, 0x91, 0xA1, 0xB1, 0xC1, 0x09, 0x23, 0x33, 0x52, 0xF0,
+      0x15, 0x62, 0x72, 0xD1, 0x0A, 0x16, 0x24, 0x34, 0xE1, 0x25, 0xF1, 0x17, 0x18, 0x19, 0x1A, 0x26,
+      0x27, 0x28, 0x29, 0x2A, 0x35, 0x36, 0x37, 0x38, 0x39, 0x3A, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48,
+      0x49, 0x4A, 0x53, 0x54, 0x55, 0x56, 0x57, 0x58, 0x59, 0x5A, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68,
+      0x69, 0x6A, 0x73, 0x74, 0x75, 0x76, 0x77, 0x78, 0x79, 0x7A, 0x82, 0x83, 0x84, 0x85, 0x86, 0x87,
+      0x88, 0x89, 0x8A, 0x92, 0x93, 0x94, 0x95, 0x96, 0x97, 0x98, 0x99, 0x9A, 0xA2, 0xA3, 0xA4, 0xA5,
+      0xA6, 0xA7, 0xA8, 0xA9, 0xAA, 0xB2, 0xB3, 0xB4, 0xB5, 0xB6, 0xB7, 0xB8, 0xB9, 0xBA, 0xC2, 0xC3,
+      0xC4, 0xC5, 0xC6, 0xC7, 0xC8, 0xC9, 0xCA, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8, 0xD9, 0xDA,
+      0xE2, 0xE3, 0xE4, 0xE5, 0xE6, 0xE7, 0xE8, 0xE9, 0xEA, 0xF2, 0xF3, 0xF4, 0xF5, 0xF6, 0xF7, 0xF8,
+      0xF9, 0xFA,
+   ],
+)
+
+# symbol counts for one channel, split by table; lets a streaming encoder gather stats band by band
+def huffman_frequencies(zz) -> Tuple[np.ndarray, np.ndarray]:
+   is_ac, symbols, _, _ = huffman_symbols(zz)
+   return np.bincount(symbols[~is_ac], minlength=256), np.bincount(symbols[is_ac], minlength=256)
+
+# size the channels would take entropy coded with optimized tables (shared by all of them, like cb + cr):
+# every code length times its count plus the extra bits, rounded up to bytes, plus the two table definitions.
+# cheaper than encoding since nothing is packed; ignores per tile DC restarts and byte padding
+def estimate_huffman_bytes(channels) -> int:
+   dc_freq = np.zeros(256, dtype=np.int64)
+   ac_freq = np.zeros(256, dtype=np.int64)
+   bits = 0
+   for zz in channels:
+      is_ac, symbols, _, extra_lengths = huffman_symbols(zz)
+      dc_freq += np.bincount(symbols[~is_ac], minlength=256)
+      ac_freq += np.bincount(symbols[is_ac], minlength=256)
+      bits += int(np.sum(extra_lengths))
+   table_bytes = 0
+   for freq in (dc_freq, ac_freq):
+      _, lengths = huffman_codes(build_huffman_table(freq))
+      bits += int(np.sum(freq * lengths))
+      table_bytes += 16 + int(np.count_nonzero(freq))
+   return -(-bits // 8) + table_bytes
+
+# ---------------------------------------------------------------------------------------------
+# progressive scans (JPEG spectral selection, Annex G): a scan codes zigzag positions start..end of every block.
+# the DC scan (0..0) is the DC differences on their own; AC scans are (run, size) pairs inside the band plus
+# EOBn symbols, (n << 4) followed by n extra bits, which end the band for a run of 2^n + extra blocks at once,
+# so blocks with nothing in a band cost a few bits between them instead of a symbol each
+# ---------------------------------------------------------------------------------------------
+
+MAX_EOB_RUN = 32767 # EOB14 with all 14 extra bits set
+
+# turn one scan of an (N, 64) zigzag channel into its huffman symbols in write order
+# returns symbols, extra bit values and extra bit lengths; every scan has one table, so no is_ac
+def scan_symbols(zz, start: int, end: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+   zz = np.asarray(zz, dtype=np.int64).reshape(-1, 64)
+   if start == 0: # DC scan
+      dc_diff = np.diff(zz[:, 0], prepend=0)
+      dc_size = magnitude_sizes(dc_diff)
+      return dc_size, magnitude_bits(dc_diff, dc_size), dc_size
+
+   band = zz[:, start:end + 1]
+   block_ids, positions = np.nonzero(band)
+   values = band[block_ids, positions]
+   previous = np.empty_like(positions)
+   previous[1:] = positions[:-1]
+   first_in_block = np.ones(len(positions), dtype=bool)
+   first_in_block[1:] = block_ids[1:] != block_ids[:-1]
+   previous[first_in_block] = -1
+   runs = positions - previous - 1
+   sizes = magnitude_sizes(values)
+
+   # ZRLs in front of long runs, like huffman_symbols
+   zrl_count = runs // 16
+   zrl_owner = np.repeat(np.arange(len(runs)), zrl_count)
+   zrl_index = np.arange(len(zrl_owner)) - np.repeat(np.cumsum(zrl_count) - zrl_count, zrl_count)
+
+   # every block that doesnt end on the last band position needs an EOB. consecutive ones share a single EOBn
+   # as long as the blocks after the first have nothing in the band (anything coded in between starts a new
+   # run), and runs are cut at MAX_EOB_RUN; the EOBn goes where the first block of its run ends
+   last = last_nonzero(band)
+   eob_blocks = np.flatnonzero(last < band.shape[1] - 1)
+   starts = last[eob_blocks] != -1
+   starts[1:] |= eob_blocks[1:] != eob_blocks[:-1] + 1
+   starts[:1] = True
+   index = np.arange(len(eob_blocks))
+   run_first = np.maximum.accumulate(np.where(starts, index, 0))
+   starts |= (index - run_first) % MAX_EOB_RUN == 0
+   run_starts = np.flatnonzero(starts)
+   run_lengths = np.diff(run_starts, append=len(eob_blocks))
+   run_bits = np.frexp(run_lengths.astype(np.float64))[1].astype(np.int64) - 1 # floor(log2(length))
+
+   def key(block, position, slot):
+      return (block * 64 + position) * 4 + slot
+
+   keys = np.concatenate([
+      key(block_ids[zrl_owner], positions[zrl_owner], zrl_index),
+      key(block_ids, positions, 3),
+      key(eob_blocks[run_starts], 63, 3),
+   ])
+   symbols = np.concatenate([
+      np.full(len(zrl_owner), ZRL_SYMBOL),
+      ((runs % 16) << 4) | sizes,
+      run_bits << 4,
+   ])
+   extra_values = np.concatenate([
+      np.zeros(len(zrl_owner), dtype=np.int64),
+      magnitude_bits(values, sizes),
+      run_lengths - (np.int64(1) << run_bits),
+   ])
+   extra_lengths = np.concatenate([
+      np.zeros(len(zrl_owner), dtype=np.int64),
+      sizes,
+      run_bits,
+   ])
+
+   order = np.argsort(keys)
+   return symbols[order].astype(np.int64), extra_values[order], extra_lengths[order]
+
+# symbol counts of one scan of a channel
+def scan_frequencies(zz, start: int, end: int) -> np.ndarray:
+   symbols, _, _ = scan_symbols(zz, start, end)
+   return np.bincount(symbols, minlength=256)
+
+# huffman encode one scan of an (N, 64) zigzag channel with the scan's table
+def huffman_encode_scan(zz, start: int, end: int, table) -> bytes:
+   symbols, extra_values, extra_lengths = scan_symbols(zz, start, end)
+   codes, lengths = huffman_codes(table)
+   code_lengths = lengths[symbols]
+   if np.any(code_lengths == 0):
+      raise ValueError("Symbol missing from huffman table")
+   return pack_bits((codes[symbols] << extra_lengths) | extra_values, code_lengths + extra_lengths)
+
+# huffman decode one scan into zz (an (N, 64) zigzag tensor, filled in place so the scans add up) and return
+# how many blocks were read. partial=True is for a cut off payload: instead of failing it stops at the last
+# block that was read whole, and the blocks after it keep what they had
+def huffman_decode_scan(data, zz, start: int, end: int, table, partial: bool = False) -> int:
+   symbol_lut, length_lut = _huffman_lookup(table)
+   data = bytes(data) + b"\xff" * 4 # padding so a 32 bit window never runs off the end
+   bit_limit = (len(data) - 4) * 8
+   from_bytes = int.from_bytes
+
+   block_ids: List[int] = []
+   positions: List[int] = []
+   values: List[int] = []
+   pos = 0 # bit position
+   dc = 0
+   eob_run = 0
+   done = 0 # blocks read whole, and how many values they own
+   kept = 0
+
+   try:
+      for block in range(len(zz)):
+         if start == 0: # DC difference
+            byte = pos >> 3
+            window = from_bytes(data[byte:byte + 4], "big")
+            peek = (window >> (16 - (pos & 7))) & 0xFFFF
+            if not length_lut[peek]:
+               raise ValueError("Corrupt JPCS entropy data")
+            size = symbol_lut[peek]
+            pos += length_lut[peek]
+            if size:
+               byte = pos >> 3
+               window = from_bytes(data[byte:byte + 4], "big")
+               dc += _extend((window >> (32 - (pos & 7) - size)) & ((1 << size) - 1), size)
+               pos += size
+            if dc:
+               block_ids.append(block)
+               positions.append(0)
+               values.append(dc)
+         elif eob_run:
+            eob_run -= 1 # nothing in this band
+         else:
+            k = start
+            while k <= end:
+               byte = pos >> 3
+               window = from_bytes(data[byte:byte + 4], "big")
+               peek = (window >> (16 - (pos & 7))) & 0xFFFF
+               if not length_lut[peek]:
+                  raise ValueError("Corrupt JPCS entropy data")
+               symbol = symbol_lut[peek]
+               pos += length_lut[peek]
+               size = symbol & 15
+               run = symbol >> 4
+               if size == 0:
+                  if symbol == ZRL_SYMBOL:
+                     k += 16
+                     continue
+                  # EOBn: this block and 2^n + extra - 1 more are done with the band
+                  eob_run = 1 << run
+                  if run:
+                     byte = pos >> 3
+                     window = from_bytes(data[byte:byte + 4], "big")
+                     eob_run += (window >> (32 - (pos & 7) - run)) & ((1 << run) - 1)
+                     pos += run
+                  eob_run -= 1
+                  break
+               k += run
+               byte = pos >> 3
+               window = from_bytes(data[byte:byte + 4], "big")
+               value = _extend((window >> (32 - (pos & 7) - size)) & ((1 << size) - 1), size)
+               pos += size
+               if k <= end:
+                  block_ids.append(block)
+                  positions.append(k)
+                  values.append(value)
+               k += 1
+
+         if pos > bit_limit:
+            raise ValueError("Corrupt JPCS entropy data")
+         done = block + 1
+         kept = len(values)
+   except ValueError:
+      if not partial:
+         raise
+
+   zz[block_ids[:kept], positions[:kept]] = values[:kept]
+   return done
@@ -0,0 +1,138 @@
+# Opt-in instrumentation for encode / decode: per stage timers and per channel counters.
+#
+#    with instrumentation.collect() as stats:
+#       codec.encode(img)
+#    stats.as_dict()            # {"stages": {"dct": {"seconds": .., "calls": ..}, ..}, "counters": {"blocks": {"y": ..}, ..}}
+#    stats.to_prometheus()      # text exposition format
+#    collect(sink="stats.jsonl") appends one JSON line per collect block
+#
+# stages codec.py times (a path only shows the ones it runs through):
+#    encode       colour_convert, downsample, blockify, dct, quantize, zigzag (int_dct_quantize instead of dct /
+#                 quantize / zigzag for transform="int", transform_pool for all of them with workers), rle, then
+#                 in the writer rle_decode, huffman_tables, huffman_encode, pack and file_write
+#    decode       file_read, huffman_decode (v4+) or record_parse (v2 / v3), rle, then per channel rle_decode and
+#                 idct (unzigzag + dequantize + idct fused in one batched call; int_idct for transform="int",
+#                 scaled_idct for scale 2 / 4 / 8, inverse_transform_pool with workers), upsample, colour_convert
+#    totals       encode and decode (codec.encode / codec.decode), around everything above
+#
+# when nothing is collecting, stage() hands back one shared do nothing context manager and count() returns
+# straight away, so the hooks left in the pipeline cost one context variable lookup each. counters that
+# take work to compute are guarded with enabled().
+# timers only run in the thread that opened collect(); pool work is timed as a whole by the caller.
+
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Optional
+
+_active: ContextVar = ContextVar("jpc_stats", default=None)
+_disabled = nullcontext()
+
+class _Timer:
+   __slots__ = ("stats", "name", "start")
+
+   def __init__(self, stats, name):
+      self.stats = stats
+      self.name = name
+
+   def __enter__(self):
+      self.start = time.perf_counter()
+      return self
+
+   def __exit__(self, *exc):
+      self.stats.add_time(self.name, time.perf_counter() - self.start)
+      return False
+
+# timings and counters of one or more encodes / decodes
+# stages: name -> [seconds, calls]; counters: name -> {channel: value} ("" when it isnt per channel)
+# "encode" / "decode" are totals and include the stages inside them
+class Stats:
+   def __init__(self):
+      self.stages = {}
+      self.counters = {}
+
+   def stage(self, name: str) -> _Timer:
+      return _Timer(self, name)
+
+   def add_time(self, name: str, seconds: float, calls: int = 1) -> None:
+      entry = self.stages.get(name)
+      if entry is None:
+         self.stages[name] = [seconds, calls]
+      else:
+         entry[0] += seconds
+         entry[1] += calls
+
+   def count(self, name: str, value: int = 1, channel: str = "") -> None:
+      channels = self.counters.setdefault(name, {})
+      channels[channel] = channels.get(channel, 0) + int(value)
+
+   def merge(self, other: "Stats") -> None:
+      for name, (seconds, calls) in other.stages.items():
+         self.add_time(name, seconds, calls)
+      for name, channels in other.counters.items():
+         for channel, value in channels.items():
+            self.count(name, value, channel)
+
+   def as_dict(self) -> dict:
+      return {
+         "stages": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in self.stages.items()},
+         "counters": {name: dict(channels) for name, channels in self.counters.items()},
+      }
+
+   def to_json_line(self) -> str:
+      return json.dumps(self.as_dict(), separators=(",", ":"))
+
+   # prometheus text exposition format; stage times and calls plus one metric per counter
+   def to_prometheus(self, prefix: str = "jpc") -> str:
+      lines = [
+         f"# HELP {prefix}_stage_seconds_total Time spent in each pipeline stage.",
+         f"# TYPE {prefix}_stage_seconds_total counter",
+      ]
+      lines += [f'{prefix}_stage_seconds_total{{stage="{name}"}} {seconds:.9g}' for name, (seconds, _) in self.stages.items()]
+      lines += [f"# TYPE {prefix}_stage_calls_total counter"]
+      lines += [f'{prefix}_stage_calls_total{{stage="{name}"}} {calls}' for name, (_, calls) in self.stages.items()]
+      for name, channels in self.counters.items():
+         lines.append(f"# TYPE {prefix}_{name}_total counter")
+         for channel, value in channels.items():
+            labels = f'{{channel="{channel}"}}' if channel else ""
+            lines.append(f"{prefix}_{name}_total{labels} {value}")
+      return "\n".join(lines) + "\n"
+
+   # human readable table, slowest stage first
+   def report(self) -> str:
+      lines = [f"{'stage':20} {'ms':>10} {'calls':>6}"]
+      for name, (seconds, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0]):
+         lines.append(f"{name:20} {seconds * 1000:10.2f} {calls:6}")
+      for name, channels in self.counters.items():
+         lines.append(f"{name}: " + ", ".join(f"{channel or 'total'}={value}" for channel, value in channels.items()))
+      return "\n".join(lines)
+
+# collect stats for everything run inside the with block; sink is a path or text file that gets one JSON line
+@contextmanager
+def collect(stats: Optional[Stats] = None, sink=None):
+   stats = stats if stats is not None else Stats()
+   token = _active.set(stats)
+   try:
+      yield stats
+   finally:
+      _active.reset(token)
+      if sink is not None:
+         if isinstance(sink, str):
+            with open(sink, "a") as f:
+               f.write(stats.to_json_line() + "\n")
+         else:
+            sink.write(stats.to_json_line() + "\n")
+
+def enabled() -> bool:
+   return _active.get() is not None
+
+# time a stage if something is collecting
+def stage(name: str):
+   stats = _active.get()
+   return _disabled if stats is None else _Timer(stats, name)
+
+def count(name: str, value: int = 1, channel: str = "") -> None:
+   stats = _active.get()
+   if stats is not None:
+      stats.count(name, value, channel)
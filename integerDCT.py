@@ -0,0 +1,218 @@
+# Integer DCT / IDCT engine: the Arai-Agui-Nakajima (AAN) factorization in fixed point, on int32 block tensors.
+# an alternative to the float matrix DCT in twoDDCT.py, picked per call with transform="int" in codec.py.
+#
+# AAN gets an 8 point DCT out of 5 multiplies by leaving every output u scaled by AAN_SCALE[u]. those scales
+# never get undone on their own: on the way in they are folded into the quantizer (one multiply per
+# coefficient does both the post scaling and the division by the table), on the way out into the dequantizer.
+#
+# the transforms are integer math and every table is built from integer literals, so coefficients and pixels
+# are the same on every machine and numpy build (the folded quantize multiply is one float32 multiply and a
+# round, both exactly specified by IEEE 754). the coefficients mean the same as the float path's, so a file
+# written with one decodes with the other.
+
+import numpy as np
+from functools import lru_cache
+
+from entropyEncoding import ZIGZAG_FLAT, INVERSE_ZIGZAG_FLAT, last_nonzero
+
+CONST_BITS = 8        # fraction bits of the rotation constants
+PASS1_BITS = 2        # extra fraction bits the pixels carry through both passes
+DEQUANT_BITS = 12     # fraction bits of the folded dequantize multipliers
+CHUNK_BLOCKS = 2048   # blocks per pass; keeps the temporaries in cache, whole planes at once are 3x slower
+
+# AAN_SCALE[k] = cos(k pi / 16) * sqrt(2) (1 for k = 0) times 2^14; the same constants libjpeg uses
+AAN_SCALE_BITS = 14
+AAN_SCALE = (16384, 22725, 21407, 19266, 16384, 12873, 8867, 4520)
+
+# rotation constants times 2^CONST_BITS
+FIX_0_382683433 = 98
+FIX_0_541196100 = 139
+FIX_0_707106781 = 181
+FIX_1_082392200 = 277
+FIX_1_306562965 = 334
+FIX_1_414213562 = 362
+FIX_1_847759065 = 473
+FIX_2_613125930 = 669
+
+# x times a fixed point constant, rounded back to x's scale
+def _mul(x, constant):
+   return (x * constant + (1 << (CONST_BITS - 1))) >> CONST_BITS
+
+# a // b rounded to nearest, python ints
+def _round_div(a: int, b: int) -> int:
+   return (2 * a + b) // (2 * b)
+
+# 1D forward AAN along the first axis: d[k] is the k-th sample of every row at once
+# output u is the orthonormal DCT coefficient times sqrt(8) * AAN_SCALE[u] (in units of 2^14)
+def _fdct_1d(d):
+   tmp0 = d[0] + d[7]
+   tmp7 = d[0] - d[7]
+   tmp1 = d[1] + d[6]
+   tmp6 = d[1] - d[6]
+   tmp2 = d[2] + d[5]
+   tmp5 = d[2] - d[5]
+   tmp3 = d[3] + d[4]
+   tmp4 = d[3] - d[4]
+
+   # even part
+   tmp10 = tmp0 + tmp3
+   tmp13 = tmp0 - tmp3
+   tmp11 = tmp1 + tmp2
+   tmp12 = tmp1 - tmp2
+   z1 = _mul(tmp12 + tmp13, FIX_0_707106781)
+   out0 = tmp10 + tmp11
+   out4 = tmp10 - tmp11
+   out2 = tmp13 + z1
+   out6 = tmp13 - z1
+
+   # odd part
+   tmp10 = tmp4 + tmp5
+   tmp11 = tmp5 + tmp6
+   tmp12 = tmp6 + tmp7
+   z5 = _mul(tmp10 - tmp12, FIX_0_382683433)
+   z2 = _mul(tmp10, FIX_0_541196100) + z5
+   z4 = _mul(tmp12, FIX_1_306562965) + z5
+   z3 = _mul(tmp11, FIX_0_707106781)
+   z11 = tmp7 + z3
+   z13 = tmp7 - z3
+   return np.stack([out0, z11 + z4, out2, z13 - z2, out4, z13 + z2, out6, z11 - z4])
+
+# 1D inverse AAN along the first axis (inputs already carry the AAN scales, the dequantizer put them there)
+def _idct_1d(d):
+   # even part
+   tmp10 = d[0] + d[4]
+   tmp11 = d[0] - d[4]
+   tmp13 = d[2] + d[6]
+   tmp12 = _mul(d[2] - d[6], FIX_1_414213562) - tmp13
+   tmp0 = tmp10 + tmp13
+   tmp3 = tmp10 - tmp13
+   tmp1 = tmp11 + tmp12
+   tmp2 = tmp11 - tmp12
+
+   # odd part
+   z13 = d[5] + d[3]
+   z10 = d[5] - d[3]
+   z11 = d[1] + d[7]
+   z12 = d[1] - d[7]
+   tmp7 = z11 + z13
+   tmp11 = _mul(z11 - z13, FIX_1_414213562)
+   z5 = _mul(z10 + z12, FIX_1_847759065)
+   tmp10 = _mul(z12, FIX_1_082392200) - z5
+   tmp12 = z5 - _mul(z10, FIX_2_613125930)
+   tmp6 = tmp12 - tmp7
+   tmp5 = tmp11 - tmp6
+   tmp4 = tmp10 + tmp5
+   return np.stack([tmp0 + tmp7, tmp1 + tmp6, tmp2 + tmp5, tmp3 - tmp4,
+                    tmp3 + tmp4, tmp2 - tmp5, tmp1 - tmp6, tmp0 - tmp7])
+
+# the passes work on (8, 8, ...) tensors, component first, so every d[k] they touch is one contiguous slab
+# rows then columns
+def _fdct_2d(components):
+   return _fdct_1d(_fdct_1d(components.swapaxes(0, 1)).swapaxes(0, 1))
+
+def _idct_2d(components):
+   return _idct_1d(_idct_1d(components.swapaxes(0, 1)).swapaxes(0, 1))
+
+# quantize multipliers for a table: 1 / (q * both AAN scales * 8 * 2^PASS1_BITS) as float32
+# (the 8 and 2^PASS1_BITS are the gain of the two unnormalized passes and the input's extra bits); the
+# divisor is an exact python int and the one division is correctly rounded, so the table is the same everywhere
+@lru_cache(maxsize=None)
+def _quantize_multipliers(table: tuple) -> np.ndarray:
+   multipliers = np.array([[
+      (1 << 2 * AAN_SCALE_BITS) / (q * AAN_SCALE[u] * AAN_SCALE[v] << (3 + PASS1_BITS))
+      for v, q in enumerate(row)] for u, row in enumerate(table)], dtype=np.float32)
+   multipliers.setflags(write=False)
+   return multipliers
+
+# dequantize multipliers: q * both AAN scales in DEQUANT_BITS fixed point
+@lru_cache(maxsize=None)
+def _dequantize_multipliers(table: tuple) -> np.ndarray:
+   multipliers = np.array([[
+      _round_div(q * AAN_SCALE[u] * AAN_SCALE[v], 1 << (2 * AAN_SCALE_BITS - DEQUANT_BITS))
+      for v, q in enumerate(row)] for u, row in enumerate(table)], dtype=np.int32)
+   multipliers.setflags(write=False)
+   return multipliers
+
+def _table_key(q_matrix) -> tuple:
+   return tuple(tuple(int(q) for q in row) for row in np.asarray(q_matrix))
+
+def quantize_multipliers(q_matrix) -> np.ndarray:
+   return _quantize_multipliers(_table_key(q_matrix))
+
+def dequantize_multipliers(q_matrix) -> np.ndarray:
+   return _dequantize_multipliers(_table_key(q_matrix))
+
+# integer pixels; floats are rounded first (the only place rounding of the input happens)
+def _as_int32(values) -> np.ndarray:
+   values = np.asarray(values)
+   return np.rint(values) if values.dtype.kind == "f" else values
+
+# DCT + quantize of (8, 8, ...) component first pixels; the AAN scales, the pass gains and the table all sit in
+# one float32 multiplier per coefficient. the product of an int below 2^24 and a float32 is correctly rounded
+# under IEEE 754 and rint rounds half to even, so the result is still the same everywhere
+def _fdct_quantize(pixels, q_matrix) -> np.ndarray:
+   scaled = _fdct_2d(pixels << PASS1_BITS)
+   multipliers = quantize_multipliers(q_matrix).reshape(8, 8, *[1] * (scaled.ndim - 2))
+   return np.rint(scaled.astype(np.float32) * multipliers).astype(np.int32)
+
+# dequantize + inverse DCT of (8, 8, ...) component first quantized coefficients back to pixels
+def _dequantize_idct(coefficients, q_matrix) -> np.ndarray:
+   multipliers = dequantize_multipliers(q_matrix).reshape(8, 8, *[1] * (coefficients.ndim - 2))
+   shift = DEQUANT_BITS - PASS1_BITS # down to the PASS1_BITS scale the passes work in
+   pixels = _idct_2d((coefficients * multipliers + (1 << (shift - 1))) >> shift)
+   return (pixels + (1 << (PASS1_BITS + 2))) >> (PASS1_BITS + 3)
+
+# a padded (rows * 8, cols * 8) plane to (rows * cols, 64) quantized zigzag coefficients, blocks in raster
+# order; the same thing codec.transform_channel makes with the float DCT
+def fdct_quantize_plane(plane, q_matrix) -> np.ndarray:
+   plane = _as_int32(plane)
+   rows, cols = plane.shape[0] // 8, plane.shape[1] // 8
+   pixels = plane.reshape(rows, 8, cols, 8).transpose(1, 3, 0, 2).astype(np.int32, order="C").reshape(8, 8, -1)
+   out = np.empty((rows * cols, 64), dtype=np.int32)
+   for start in range(0, rows * cols, CHUNK_BLOCKS):
+      quantized = _fdct_quantize(pixels[..., start:start + CHUNK_BLOCKS], q_matrix)
+      out[start:start + CHUNK_BLOCKS] = quantized.reshape(64, -1)[ZIGZAG_FLAT].T
+   return out
+
+# pixel value of a block whose only coefficient is dc: both passes just carry the dequantized dc through
+def _dc_only_pixels(dc, q_matrix) -> np.ndarray:
+   shift = DEQUANT_BITS - PASS1_BITS
+   dc = (dc * dequantize_multipliers(q_matrix)[0, 0] + (1 << (shift - 1))) >> shift
+   return (dc + (1 << (PASS1_BITS + 2))) >> (PASS1_BITS + 3)
+
+# (rows * cols, 64) quantized zigzag coefficients back to a padded (rows * 8, cols * 8) float32 plane
+# (integer valued, not clipped), like codec.decompress_zigzag with the float IDCT. all zero and DC only
+# blocks are flat, so they are filled with their (exact) value and only the rest go through the passes
+def zigzag_dequantize_idct(zz, q_matrix, rows: int, cols: int) -> np.ndarray:
+   zz = np.asarray(zz)
+   pixels = np.empty((8, 8, rows * cols), dtype=np.int32) # (y, x, blocks)
+   last = last_nonzero(zz)
+   flat = np.flatnonzero(last <= 0)
+   pixels[..., flat] = _dc_only_pixels(zz[flat, 0].astype(np.int32), q_matrix)
+   busy = np.flatnonzero(last > 0)
+   for start in range(0, len(busy), CHUNK_BLOCKS):
+      chunk = busy[start:start + CHUNK_BLOCKS]
+      coefficients = zz[chunk].T[INVERSE_ZIGZAG_FLAT].astype(np.int32).reshape(8, 8, -1)
+      pixels[..., chunk] = _dequantize_idct(coefficients, q_matrix)
+   return pixels.reshape(8, 8, rows, cols).transpose(2, 0, 3, 1).astype(np.float32, order="C").reshape(rows * 8, cols * 8)
+
+# _fdct_quantize / _dequantize_idct over (8, 8, N) in chunks of blocks
+def _chunked(function, components, q_matrix) -> np.ndarray:
+   out = np.empty(components.shape, dtype=np.int32)
+   for start in range(0, components.shape[-1], CHUNK_BLOCKS):
+      out[..., start:start + CHUNK_BLOCKS] = function(components[..., start:start + CHUNK_BLOCKS], q_matrix)
+   return out
+
+# forward DCT + quantize of any (..., 8, 8) stack of pixel blocks; returns int32 quantized coefficients,
+# like quantize_blocks(dct_2d_blocks(blocks), q_matrix)
+def fdct_quantize_blocks(blocks, q_matrix) -> np.ndarray:
+   blocks = _as_int32(blocks)
+   pixels = np.moveaxis(blocks.reshape(-1, 8, 8), 0, -1).astype(np.int32, order="C")
+   return np.moveaxis(_chunked(_fdct_quantize, pixels, q_matrix), -1, 0).astype(np.int32, order="C").reshape(blocks.shape)
+
+# dequantize + inverse DCT of any (..., 8, 8) stack of quantized blocks; returns int32 pixel blocks,
+# like idct_2d_blocks(dequantize_blocks(blocks, q_matrix)) rounded (not clipped)
+def dequantize_idct_blocks(blocks, q_matrix) -> np.ndarray:
+   blocks = np.asarray(blocks)
+   coefficients = np.moveaxis(blocks.reshape(-1, 8, 8), 0, -1).astype(np.int32, order="C")
+   return np.moveaxis(_chunked(_dequantize_idct, coefficients, q_matrix), -1, 0).astype(np.int32, order="C").reshape(blocks.shape)
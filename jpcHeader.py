@@ -0,0 +1,21 @@
+# The fixed part at the start of every .jpc file, kept out of codec.py so tools that only look at files
+# (cli.py info) can read it without importing numpy, Pillow or the pipeline. codec.py has the rest of the format.
+
+import struct
+
+file_signature = b"JPCS"             # file signature at the start of each .jpc file
+# fixed header at the start of every .jpc file: signature, version, width, height, block size, 3 block counts
+header_struct = struct.Struct(">4sBIIBIII")
+
+# the fields of the fixed header at the start of data (only the first header_struct.size bytes are needed)
+def read_fixed_header(data) -> dict:
+   if len(data) < header_struct.size or bytes(data[:4]) != file_signature:
+      raise ValueError("Not a JPCS file")
+   _, version, width, height, block_size, y_count, cb_count, cr_count = header_struct.unpack_from(data, 0)
+   return {
+      "version": version,
+      "width": width,
+      "height": height,
+      "block_size": block_size,
+      "block_counts": (y_count, cb_count, cr_count),
+   }
@@ -0,0 +1,16 @@
+# The encode / decode option values and their defaults, kept out of codec.py (like jpcHeader.py) so cli.py,
+# viewer.py and server.py can offer and check them without importing numpy. every module that defaults or checks
+# one of them imports it from here, so there is one copy of each.
+
+DEFAULT_QUALITY = 50                        # 1 to 100; 50 leaves the standard quantization tables as they are
+SAMPLINGS = ("4:4:4", "4:2:2", "4:2:0")     # chroma sampling modes (chromaSubsampling.py)
+DEFAULT_SAMPLING = SAMPLINGS[0]
+TRANSFORMS = ("float", "int")               # float matrix DCT or the fixed point AAN one (integerDCT.py)
+DEFAULT_TRANSFORM = TRANSFORMS[0]
+
+# scaled decodes (libjpeg scale_denom): 1 is full size, 2 / 4 / 8 decode straight to 1/2, 1/4 or 1/8 size
+SCALES = (1, 2, 4, 8)
+
+# default tile edge in pixels; small enough that a crop decodes little extra, big enough that the per tile
+# lengths and index entries (16 bytes a tile) dont matter
+DEFAULT_TILE_SIZE = 256
@@ -0,0 +1,109 @@
+# Image quality metrics between an original and its decoded version: MSE, PSNR and SSIM, per Y / Cb / Cr
+# channel and combined. everything is numpy on arrays already in memory, nothing is read back from disk.
+#
+#    compressed = codec.compress_image(rgb, 50)
+#    metrics.evaluate(rgb, compressed)      # or .jpc bytes instead of the CompressedImage
+#    -> {"y": {"mse": .., "psnr": .., "ssim": ..}, "cb": {..}, "cr": {..}, "combined": {..}}
+#
+# SSIM uses the usual 1.5 sigma gaussian window, approximated by three box blurs (each one a cumulative sum
+# and a subtraction, per axis), so the cost doesnt grow with the window size and no scipy is needed.
+# combined is the MSE / PSNR over all three channels together and the mean of the channel SSIMs.
+
+import numpy as np
+
+from colorConversion import rgb_to_ycbcr_array
+from codec import to_rgb_array, parse_JPC, decompress_planes
+from compressedImage import CompressedImage
+
+CHANNELS = ("y", "cb", "cr")
+SSIM_SIGMA = 1.5
+BOX_PASSES = 3
+
+# mean squared error
+def mse(original, decoded) -> float:
+   difference = np.asarray(original, dtype=np.float64) - np.asarray(decoded, dtype=np.float64)
+   return float(np.mean(difference * difference))
+
+# peak signal to noise ratio in dB; inf for identical inputs
+def psnr(original, decoded, peak: float = 255.0) -> float:
+   return _psnr_from_mse(mse(original, decoded), peak)
+
+def _psnr_from_mse(error: float, peak: float = 255.0) -> float:
+   return float("inf") if error == 0 else float(10 * np.log10(peak * peak / error))
+
+# box radii whose passes add up to a gaussian of this sigma (the lower width for the first passes, the
+# next odd width for the rest, picked so the variances sum to sigma squared as closely as possible)
+def _box_radii(sigma: float, passes: int = BOX_PASSES):
+   ideal = np.sqrt(12 * sigma * sigma / passes + 1)
+   lower = int(ideal) - (1 - int(ideal) % 2) # largest odd width under the ideal one
+   low_passes = round((12 * sigma * sigma - passes * lower * lower - 4 * passes * lower - 3 * passes) / (-4 * lower - 4))
+   return [lower // 2] * low_passes + [lower // 2 + 1] * (passes - low_passes)
+
+# mean over a 2 radius + 1 window along axis 0, same size out (edges repeated)
+def _box_blur_rows(plane: np.ndarray, radius: int) -> np.ndarray:
+   width = 2 * radius + 1
+   padded = np.pad(plane, ((radius + 1, radius), (0, 0)), mode="edge")
+   sums = np.cumsum(padded, axis=0)
+   return (sums[width:] - sums[:-width]) / width
+
+# separable gaussian approximation: box blur the rows and the columns, a few passes each
+def gaussian_blur(plane, sigma: float = SSIM_SIGMA, passes: int = BOX_PASSES) -> np.ndarray:
+   plane = np.asarray(plane, dtype=np.float64)
+   for radius in _box_radii(sigma, passes):
+      plane = _box_blur_rows(plane, radius)
+      plane = _box_blur_rows(plane.T, radius).T
+   return plane
+
+# per pixel SSIM of two 2D planes
+def ssim_map(original, decoded, sigma: float = SSIM_SIGMA, peak: float = 255.0) -> np.ndarray:
+   a = np.asarray(original, dtype=np.float64)
+   b = np.asarray(decoded, dtype=np.float64)
+   c1 = (0.01 * peak) ** 2
+   c2 = (0.03 * peak) ** 2
+
+   mean_a, mean_b = gaussian_blur(a, sigma), gaussian_blur(b, sigma)
+   mean_aa, mean_bb, mean_ab = mean_a * mean_a, mean_b * mean_b, mean_a * mean_b
+   var_a = gaussian_blur(a * a, sigma) - mean_aa
+   var_b = gaussian_blur(b * b, sigma) - mean_bb
+   covariance = gaussian_blur(a * b, sigma) - mean_ab
+   return ((2 * mean_ab + c1) * (2 * covariance + c2)) / ((mean_aa + mean_bb + c1) * (var_a + var_b + c2))
+
+# structural similarity, 1.0 means identical; H x W x C images give the mean over the channels
+def ssim(original, decoded, sigma: float = SSIM_SIGMA, peak: float = 255.0) -> float:
+   a = np.asarray(original)
+   b = np.asarray(decoded)
+   if a.ndim == 3:
+      return float(np.mean([ssim(a[..., c], b[..., c], sigma, peak) for c in range(a.shape[2])]))
+   return float(np.mean(ssim_map(a, b, sigma, peak)))
+
+# mse / psnr / ssim of every pair of planes and of all of them together
+def compare_planes(original_planes, decoded_planes, names=CHANNELS, peak: float = 255.0) -> dict:
+   result = {}
+   for name, a, b in zip(names, original_planes, decoded_planes):
+      error = mse(a, b)
+      result[name] = {"mse": error, "psnr": _psnr_from_mse(error, peak), "ssim": ssim(a, b, peak=peak)}
+   channels = [result[name] for name in names]
+   error = float(np.mean([c["mse"] for c in channels])) # planes are the same size, so this is the overall mse
+   result["combined"] = {"mse": error, "psnr": _psnr_from_mse(error, peak), "ssim": float(np.mean([c["ssim"] for c in channels]))}
+   return result
+
+# two H x W x 3 rgb arrays compared on their Y, Cb, Cr planes
+def compare_images(original_rgb, decoded_rgb) -> dict:
+   original = rgb_to_ycbcr_array(np.asarray(original_rgb)[..., :3])
+   decoded = rgb_to_ycbcr_array(np.asarray(decoded_rgb)[..., :3])
+   return compare_planes(np.moveaxis(original, -1, 0), np.moveaxis(decoded, -1, 0))
+
+# the original (rgb array, pillow image or path) against what the decoder makes of compressed (the
+# CompressedImage (or old dict) compress_image returns, or .jpc bytes), on the decoded Y / Cb / Cr planes before they go back to rgb
+def evaluate(original, compressed, workers: int = 1, use_threads: bool = False) -> dict:
+   if not isinstance(compressed, (CompressedImage, dict)):
+      compressed = parse_JPC(compressed, workers, use_threads)
+   original_planes = np.moveaxis(rgb_to_ycbcr_array(to_rgb_array(original)), -1, 0)
+   decoded_planes = [np.clip(np.rint(plane), 0, 255) for plane in decompress_planes(compressed, workers, use_threads)]
+   return compare_planes(original_planes, decoded_planes)
+
+# small table of one evaluate / compare result, for printing
+def report(result: dict) -> str:
+   lines = [f"  {'channel':9} {'MSE':>10} {'PSNR dB':>9} {'SSIM':>7}"]
+   lines += [f"  {name:9} {c['mse']:10.3f} {c['psnr']:9.2f} {c['ssim']:7.4f}" for name, c in result.items()]
+   return "\n".join(lines)
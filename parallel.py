@@ -0,0 +1,239 @@
+# Parallel encode / decode: the work is split into independent units (one channel x one stripe of block rows)
+# and run on a concurrent.futures pool. Planes and coefficient tensors travel through shared memory
+# (multiprocessing.shared_memory) instead of being pickled; only names, shapes and row ranges are sent.
+# Every block goes through exactly the same math as the serial path, so the output is identical.
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Sequence, Tuple
+import numpy as np
+
+from entropyEncoding import zigzag_scan_blocks, huffman_decode_channel
+from twoDDCT import dct_2d_blocks, idct_zigzag_blocks
+from quantization import quantize_blocks
+from integerDCT import fdct_quantize_plane, zigzag_dequantize_idct
+
+# how many workers to use when the caller doesnt say
+def default_workers() -> int:
+   return os.cpu_count() or 1
+
+# a pool of worker processes (default) or threads; numpy drops the GIL in the heavy ops so threads help too
+def make_executor(workers: int, use_threads: bool = False):
+   if use_threads:
+      return ThreadPoolExecutor(max_workers=workers)
+   return ProcessPoolExecutor(max_workers=workers)
+
+# shared memory block holding an array; the parent creates it, workers attach by name
+class SharedArray:
+   def __init__(self, shape, dtype, name=None):
+      self.shape = tuple(shape)
+      self.dtype = np.dtype(dtype)
+      size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+      if name is None:
+         self.shm = shared_memory.SharedMemory(create=True, size=size)
+         self.owner = True
+      else:
+         self.shm = _attach(name)
+         self.owner = False
+      self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+   # what a worker needs to attach (small and cheap to pickle)
+   def spec(self):
+      return self.shm.name, self.shape, self.dtype.str
+
+   def close(self):
+      del self.array
+      self.shm.close()
+      if self.owner:
+         self.shm.unlink()
+
+# attach to an existing block; pool workers share the parent's resource tracker, so only the parent unlinks
+def _attach(name):
+   return shared_memory.SharedMemory(name=name)
+
+# workers get either a shared memory spec (processes) or the array itself (threads share memory already)
+def _open(source):
+   if isinstance(source, np.ndarray):
+      return source, None
+   name, shape, dtype = source
+   shared = SharedArray(shape, dtype, name=name)
+   return shared.array, shared
+
+def _close(handle):
+   if handle is not None:
+      handle.close()
+
+# split rows 0..row_count into stripes of stripe_rows
+def stripes(row_count: int, stripe_rows: int) -> List[Tuple[int, int]]:
+   return [(start, min(start + stripe_rows, row_count)) for start in range(0, row_count, stripe_rows)]
+
+# stripe height that gives every worker a few units to balance out uneven stripes
+def _stripe_rows(row_count: int, channel_count: int, workers: int) -> int:
+   units = workers * 4
+   return max(1, -(-row_count * channel_count // units))
+
+# one encode unit: block rows row_start..row_end of a padded float32 plane
+# DCT, quantize and zigzag, then write the (N, 64) coefficients into the shared output
+def _encode_stripe(plane_source, out_source, row_start, row_end, q_matrix, block_size, transform="float"):
+   plane, plane_handle = _open(plane_source)
+   out, out_handle = _open(out_source)
+   try:
+      cols = plane.shape[1] // block_size
+      stripe = plane[row_start * block_size:row_end * block_size]
+      if transform == "int":
+         out[row_start * cols:row_end * cols] = fdct_quantize_plane(stripe, q_matrix)
+         return
+      blocks = stripe.reshape(row_end - row_start, block_size, cols, block_size).swapaxes(1, 2)
+      dct_blocks = dct_2d_blocks(blocks).reshape(-1, block_size, block_size)
+      out[row_start * cols:row_end * cols] = zigzag_scan_blocks(quantize_blocks(dct_blocks, q_matrix))
+   finally:
+      del plane, out
+      _close(plane_handle)
+      _close(out_handle)
+
+# one decode unit: dezigzag, dequantize and inverse DCT block rows row_start..row_end into the shared padded plane
+# (the same per block fast paths as codec.decompress_zigzag)
+def _decode_stripe(zz_source, out_source, row_start, row_end, q_matrix, block_size, transform="float"):
+   zz, zz_handle = _open(zz_source)
+   out, out_handle = _open(out_source)
+   try:
+      cols = out.shape[1] // block_size
+      if transform == "int":
+         out[row_start * block_size:row_end * block_size] = zigzag_dequantize_idct(
+            zz[row_start * cols:row_end * cols], q_matrix, row_end - row_start, cols)
+         return
+      spatial = idct_zigzag_blocks(zz[row_start * cols:row_end * cols], q_matrix)
+      spatial = spatial.reshape(row_end - row_start, cols, block_size, block_size).swapaxes(1, 2)
+      out[row_start * block_size:row_end * block_size] = spatial.reshape(-1, cols * block_size)
+   finally:
+      del zz, out
+      _close(zz_handle)
+      _close(out_handle)
+
+# one entropy decode unit: a whole channel payload (channels are coded independently), bytes start..end of the
+# shared payload buffer
+def _decode_payload(payload_source, start, end, out_source, block_count, dc_table, ac_table, total_length=64):
+   payloads, payload_handle = _open(payload_source)
+   out, out_handle = _open(out_source)
+   try:
+      out[:] = huffman_decode_channel(payloads[start:end], block_count, dc_table, ac_table, total_length)
+   finally:
+      del payloads, out
+      _close(payload_handle)
+      _close(out_handle)
+
+# allocate an output for the pool: shared memory for processes, a plain array for threads
+def _output(shape, dtype, use_threads):
+   if use_threads:
+      array = np.zeros(shape, dtype=dtype)
+      return array, array, None
+   shared = SharedArray(shape, dtype)
+   return shared.array, shared.spec(), shared
+
+# DCT + quantize + zigzag every channel in parallel; channels are 2D planes, q_tables one table per channel
+# returns one (N, 64) int32 zigzag tensor per channel, blocks in raster order like compress_channel
+# transform is "float" or "int", like codec.transform_channel
+def encode_channels(channels: Sequence[np.ndarray], q_tables, block_size: int = 8, workers=None,
+                    use_threads: bool = False, stripe_rows=None, transform: str = "float") -> List[np.ndarray]:
+   workers = workers or default_workers()
+   shared = []
+   try:
+      jobs = []
+      outputs = []
+      for channel, q_matrix in zip(channels, q_tables):
+         h, w = channel.shape
+         rows = -(-h // block_size)
+         cols = -(-w // block_size)
+
+         # pad once straight into the shared plane (edge replicate, same as the serial encoder)
+         plane, plane_source, plane_shared = _output((rows * block_size, cols * block_size), np.float32, use_threads)
+         shared.append(plane_shared)
+         plane[:h, :w] = channel
+         plane[h:, :w] = plane[h - 1:h, :w]
+         plane[:, w:] = plane[:, w - 1:w]
+
+         out, out_source, out_shared = _output((rows * cols, 64), np.int32, use_threads)
+         shared.append(out_shared)
+         outputs.append(out)
+
+         step = stripe_rows or _stripe_rows(rows, len(channels), workers)
+         for row_start, row_end in stripes(rows, step):
+            jobs.append((plane_source, out_source, row_start, row_end, np.asarray(q_matrix), block_size, transform))
+
+      with make_executor(workers, use_threads) as pool:
+         for future in [pool.submit(_encode_stripe, *job) for job in jobs]:
+            future.result()
+      return [np.array(out) for out in outputs]
+   finally:
+      for handle in shared:
+         _close(handle)
+
+# dezigzag + dequantize + inverse DCT every channel in parallel
+# zz_channels: (N, 64) zigzag tensors, sizes: (height, width) per channel; returns float32 planes
+def decode_channels(zz_channels: Sequence[np.ndarray], q_tables, sizes, block_size: int = 8, workers=None,
+                    use_threads: bool = False, stripe_rows=None, transform: str = "float") -> List[np.ndarray]:
+   workers = workers or default_workers()
+   shared = []
+   try:
+      jobs = []
+      outputs = []
+      for zz, q_matrix, (h, w) in zip(zz_channels, q_tables, sizes):
+         rows = -(-h // block_size)
+         cols = -(-w // block_size)
+
+         zz_array, zz_source, zz_shared = _output(zz.shape, np.int32, use_threads)
+         shared.append(zz_shared)
+         zz_array[:] = zz
+
+         out, out_source, out_shared = _output((rows * block_size, cols * block_size), np.float32, use_threads)
+         shared.append(out_shared)
+         outputs.append((out, h, w))
+
+         step = stripe_rows or _stripe_rows(rows, len(zz_channels), workers)
+         for row_start, row_end in stripes(rows, step):
+            jobs.append((zz_source, out_source, row_start, row_end, np.asarray(q_matrix), block_size, transform))
+
+      with make_executor(workers, use_threads) as pool:
+         for future in [pool.submit(_decode_stripe, *job) for job in jobs]:
+            future.result()
+      return [np.array(out[:h, :w]) for out, h, w in outputs]
+   finally:
+      for handle in shared:
+         _close(handle)
+
+# huffman decode several channel payloads at once; jobs are (payload, block_count, dc_table, ac_table) with an
+# optional total_length (see huffman_decode_channel); returns one (N, 64) int32 zigzag tensor per job
+# the payloads go into one shared buffer (processes) or are read in place (threads), never pickled per job
+def huffman_decode_channels(jobs, workers=None, use_threads: bool = False) -> List[np.ndarray]:
+   workers = workers or default_workers()
+   jobs = list(jobs)
+   shared = []
+   try:
+      payloads = [np.frombuffer(job[0], dtype=np.uint8) for job in jobs]
+      if use_threads:
+         sources = [(payload, 0, len(payload)) for payload in payloads]
+      else:
+         ends = np.cumsum([len(payload) for payload in payloads], dtype=np.int64).tolist()
+         buffer = SharedArray((ends[-1] if ends else 0,), np.uint8)
+         shared.append(buffer)
+         sources = []
+         for payload, end in zip(payloads, ends):
+            buffer.array[end - len(payload):end] = payload
+            sources.append((buffer.spec(), end - len(payload), end))
+
+      outputs = []
+      submits = []
+      for (_, block_count, dc_table, ac_table, *total_length), source in zip(jobs, sources):
+         out, out_source, out_shared = _output((block_count, 64), np.int32, use_threads)
+         shared.append(out_shared)
+         outputs.append(out)
+         submits.append((*source, out_source, block_count, dc_table, ac_table, *total_length))
+
+      with make_executor(workers, use_threads) as pool:
+         for future in [pool.submit(_decode_payload, *job) for job in submits]:
+            future.result()
+      return [np.array(out) for out in outputs]
+   finally:
+      for handle in shared:
+         _close(handle)
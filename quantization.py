@@ -1,6 +1,10 @@
 # quantization and dequantization of an 8by 8 DCT block
 
-from typing import List # type hiunts
+from typing import List, Tuple # type hiunts
+from functools import lru_cache # cache the scaled tables per quality
+import numpy as np # whole block tensors at once
+
+from jpcOptions import DEFAULT_QUALITY # quality 50 leaves the standard tables as they are
 
 # standard JPEG-ish luminance quantization matrix (quality ~50)
 STANDARD_LUMA_Q: List[List[int]] = [
@@ -14,8 +18,44 @@ STANDARD_LUMA_Q: List[List[int]] = [
    [72, 92, 95, 98,112,100,103, 99],
 ]
 
-# for simplicity chroma channels use the same table
-STANDARD_CHROMA_Q = STANDARD_LUMA_Q
+# standard JPEG chrominance quantization matrix (quality ~50), chroma can be quantized a lot harder
+STANDARD_CHROMA_Q: List[List[int]] = [
+   [17, 18, 24, 47, 99, 99, 99, 99],
+   [18, 21, 26, 66, 99, 99, 99, 99],
+   [24, 26, 56, 99, 99, 99, 99, 99],
+   [47, 66, 99, 99, 99, 99, 99, 99],
+   [99, 99, 99, 99, 99, 99, 99, 99],
+   [99, 99, 99, 99, 99, 99, 99, 99],
+   [99, 99, 99, 99, 99, 99, 99, 99],
+   [99, 99, 99, 99, 99, 99, 99, 99],
+]
+
+# libjpeg style quality (1 to 100) to percentage scale factor
+# below 50 the tables grow quickly, above 50 they shrink linearly down to all 1s at 100
+def quality_scale(quality: int) -> int:
+   quality = min(max(int(quality), 1), 100)
+   if quality < 50:
+      return 5000 // quality
+   return 200 - quality * 2
+
+# scale a base table for the given quality; values stay in the 1 to 255 range (baseline JPEG limits)
+def scale_table(table: List[List[int]], quality: int) -> np.ndarray:
+   scale = quality_scale(quality)
+   scaled = (np.array(table, dtype=np.int32) * scale + 50) // 100
+   return np.clip(scaled, 1, 255)
+
+# luma and chroma tables for a quality, built once and shared (read only) after that
+@lru_cache(maxsize=None)
+def quality_tables(quality: int = DEFAULT_QUALITY) -> Tuple[np.ndarray, np.ndarray]:
+   luma = scale_table(STANDARD_LUMA_Q, quality)
+   chroma = scale_table(STANDARD_CHROMA_Q, quality)
+   luma.setflags(write=False)
+   chroma.setflags(write=False)
+   return luma, chroma
+
+# 1 / q for every table entry so quantizing is a multiply instead of a divide
+def reciprocal_table(q_matrix) -> np.ndarray:
+   return 1.0 / np.asarray(q_matrix, dtype=np.float32)
 
 # divide each DCT coefficient by corresponding quantization value + round up to nearest int
 # gets rid of high frequency detail and is the main reason jpeg is a lossy compression
@@ -36,3 +76,11 @@ def dequantize_block(block: List[List[int]], q_matrix: List[List[int]]) -> List[
       for x in range(n):
          out[y][x] = block[y][x] * q_matrix[y][x]
    return out
+
+# quantize a whole (..., 8, 8) tensor of DCT blocks in one numpy op; rint rounds half to even like round()
+def quantize_blocks(blocks, q_matrix) -> np.ndarray:
+   return np.rint(np.asarray(blocks, dtype=np.float32) * reciprocal_table(q_matrix)).astype(np.int32)
+
+# multiply a whole (..., 8, 8) tensor of quantized blocks back by the table
+def dequantize_blocks(blocks, q_matrix) -> np.ndarray:
+   return np.asarray(blocks, dtype=np.float32) * np.asarray(q_matrix, dtype=np.float32)
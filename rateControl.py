@@ -0,0 +1,154 @@
+# Rate control: encode to a byte budget (target_bytes) or a quality floor (target_psnr) instead of a fixed
+# quality. colour conversion, downsampling and the DCT run once and the coefficients are cached; every
+# trial of the binary search over quality only re-quantizes and estimates the coded size (or the error),
+# then the chosen quality is encoded for real and checked, stepping one quality at a time if the
+# estimate was a little off.
+#
+#    jpc_bytes, report = rateControl.encode_to_target("input.bmp", target_bytes=50_000)
+#    report -> {"quality": 23, "bytes": 49_812, "psnr": .., "psnr_y": .., "ssim": .., "metrics": {..}, "trials": 8, ..}
+#
+# target_psnr is the luma (Y) PSNR; the search estimates it straight from the coefficients (the DCT is
+# orthonormal, so the squared quantization error of the coefficients is the squared pixel error)
+
+import numpy as np
+
+from colorConversion import rgb_to_ycbcr_array
+from chromaSubsampling import downsample
+from entropyEncoding import zigzag_scan_blocks, rle_encode_blocks, estimate_huffman_bytes
+from quantization import quantize_blocks, dequantize_blocks, quality_tables
+from twoDDCT import blockify_view, dct_2d_blocks
+from compressedImage import CompressedImage
+from codec import (
+   block_size,
+   header_struct,
+   tables_struct,
+   tiles_struct,
+   tile_shape,
+   compressed_to_bytes,
+   decompress_planes,
+   parse_JPC,
+   to_rgb_array,
+)
+from jpcOptions import DEFAULT_SAMPLING, DEFAULT_TILE_SIZE
+import metrics
+
+MIN_QUALITY = 1
+MAX_QUALITY = 100
+
+# the DCT of every channel of one image, ready to be quantized at any quality
+class CoefficientCache:
+   def __init__(self, source, sampling: str = DEFAULT_SAMPLING, chroma_filter: str = "box"):
+      self.rgb = to_rgb_array(source)
+      self.height, self.width = self.rgb.shape[:2]
+      self.sampling = sampling
+
+      ycbcr = rgb_to_ycbcr_array(self.rgb)
+      self.luma = ycbcr[..., 0] # uint8 Y plane, the reference for the luma PSNR
+      channels = [ycbcr[..., 0], ycbcr[..., 1], ycbcr[..., 2]]
+      if sampling != "4:4:4":
+         channels[1:] = [downsample(c, sampling, chroma_filter) for c in channels[1:]]
+      # same steps as codec.transform_channel up to the quantizer
+      self.coefficients = [
+         dct_2d_blocks(blockify_view(np.asarray(c, dtype=np.float32), block_size, pad_mode="edge")).reshape(-1, block_size, block_size)
+         for c in channels
+      ]
+
+   # (N, 64) zigzag coefficients of y, cb, cr at this quality
+   def quantized(self, quality: int):
+      luma_q, chroma_q = quality_tables(quality)
+      return [zigzag_scan_blocks(quantize_blocks(c, q)) for c, q in zip(self.coefficients, (luma_q, chroma_q, chroma_q))]
+
+   # the CompressedImage compress_image(source, quality, sampling=...) would make, without redoing the DCT
+   def compress(self, quality: int) -> CompressedImage:
+      luma_q, chroma_q = quality_tables(quality)
+      y_blocks, cb_blocks, cr_blocks = [rle_encode_blocks(zz) for zz in self.quantized(quality)]
+      return CompressedImage(self.width, self.height, block_size, y_blocks, cb_blocks, cr_blocks, quality=quality,
+                             luma_q=luma_q, chroma_q=chroma_q, sampling=self.sampling)
+
+   # roughly the .jpc size at this quality: entropy coded size estimate plus header, index and tile lengths
+   def estimate_bytes(self, quality: int, tile_size=DEFAULT_TILE_SIZE) -> int:
+      y_zz, cb_zz, cr_zz = self.quantized(quality)
+      tile_width, tile_height = tile_shape(self.width, self.height, self.sampling, tile_size)
+      tiles = -(-self.width // tile_width) * -(-self.height // tile_height)
+      overhead = header_struct.size + tables_struct.size + tiles_struct.size + 4 * (tiles + 1) + 12 * tiles
+      return estimate_huffman_bytes([y_zz]) + estimate_huffman_bytes([cb_zz, cr_zz]) + overhead
+
+   # luma PSNR at this quality from the coefficient error alone (before rounding to 8 bits)
+   def estimate_psnr_y(self, quality: int) -> float:
+      luma_q, _ = quality_tables(quality)
+      coefficients = self.coefficients[0]
+      error = coefficients - dequantize_blocks(quantize_blocks(coefficients, luma_q), luma_q)
+      mse = float(np.mean(np.square(error, dtype=np.float64)))
+      return float("inf") if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+   # true luma PSNR of the decoded .jpc bytes
+   def psnr_y(self, jpc: bytes) -> float:
+      y_plane = decompress_planes(parse_JPC(jpc))[0]
+      return metrics.psnr(self.luma, np.clip(np.rint(y_plane), 0, 255))
+
+# smallest quality in lo..hi where good(quality) holds, hi if none; good must be monotone
+# size and PSNR are for natural images, an image already quantized with these tables can peak at that quality
+# and the search then lands on one of the crossings (still meeting the target, just maybe not the best one)
+def _search(good, lo: int, hi: int):
+   trials = 0
+   while lo < hi:
+      mid = (lo + hi) // 2
+      trials += 1
+      if good(mid):
+         hi = mid
+      else:
+         lo = mid + 1
+   return lo, trials
+
+# encode to at most target_bytes (largest quality that fits) or to at least target_psnr luma PSNR (smallest
+# quality that gets there); returns the .jpc bytes and a report with the chosen quality and what it achieved
+# if the target cant be met the closest end of the quality range is used and report["met"] is False
+def encode_to_target(source, target_bytes=None, target_psnr=None, sampling: str = DEFAULT_SAMPLING,
+                     tile_size=DEFAULT_TILE_SIZE, cache: CoefficientCache = None):
+   if (target_bytes is None) == (target_psnr is None):
+      raise ValueError("Give exactly one of target_bytes and target_psnr")
+   cache = cache or CoefficientCache(source, sampling)
+   encoded = {}
+
+   def encode_at(quality):
+      if quality not in encoded:
+         encoded[quality] = bytes(compressed_to_bytes(cache.compress(quality), tile_size))
+      return encoded[quality]
+
+   if target_bytes is not None:
+      # first quality whose estimate is over budget, one below it is the candidate
+      over, trials = _search(lambda q: cache.estimate_bytes(q, tile_size) > target_bytes, MIN_QUALITY, MAX_QUALITY + 1)
+      quality = max(over - 1, MIN_QUALITY)
+      fits = lambda q: len(encode_at(q)) <= target_bytes
+      # the estimate can be off by a little either way; settle it on real sizes
+      while quality > MIN_QUALITY and not fits(quality):
+         quality -= 1
+      while quality < MAX_QUALITY and fits(quality + 1):
+         quality += 1
+      met = fits(quality)
+   else:
+      quality, trials = _search(lambda q: cache.estimate_psnr_y(q) >= target_psnr, MIN_QUALITY, MAX_QUALITY)
+      reaches = {}
+      good = lambda q: reaches.setdefault(q, cache.psnr_y(encode_at(q)) >= target_psnr)
+      while quality < MAX_QUALITY and not good(quality):
+         quality += 1
+      while quality > MIN_QUALITY and good(quality - 1):
+         quality -= 1
+      met = good(quality)
+
+   jpc = encode_at(quality)
+   quality_metrics = metrics.evaluate(cache.rgb, cache.compress(quality))
+   report = {
+      "quality": quality,
+      "bytes": len(jpc),
+      "met": met,
+      "target_bytes": target_bytes,
+      "target_psnr": target_psnr,
+      "psnr": quality_metrics["combined"]["psnr"],
+      "psnr_y": quality_metrics["y"]["psnr"],
+      "ssim": quality_metrics["combined"]["ssim"],
+      "metrics": quality_metrics, # per channel, see metrics.evaluate
+      "trials": trials,
+      "encodes": len(encoded),
+   }
+   return jpc, report
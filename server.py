@@ -0,0 +1,354 @@
+# Local HTTP service around the codec. the serving side is stdlib only (asyncio streams and a small HTTP/1.1
+# parser); the CPU heavy encodes / decodes run on a process pool, so nothing is spawned or written to disk per
+# request and numpy / the pipeline are imported once per worker.
+#
+#    python3 server.py [--port 8080 | --unix /tmp/jpc.sock] [-j workers] [--queue 16]
+#    curl --data-binary @photo.png "localhost:8080/encode?quality=75&sampling=4:2:0" > photo.jpc
+#    curl --data-binary @photo.jpc "localhost:8080/decode?scale=2" > view.png      # format=raw for rgb bytes
+#    curl localhost:8080/stats          # requests, rejections and latency percentiles per route
+#
+# backpressure: at most workers + queue requests are in the pool at once (running or waiting for a worker);
+# past that a request gets 503 with Retry-After straight away instead of piling up behind the others.
+# latency is from the request being read to its response being written, over the last LATENCY_WINDOW
+# successful requests of each route.
+# size limits: bodies over --max-body MB and images over --max-pixels megapixels (from the .jpc header, or the
+# image header for encodes, checked before anything is decoded) get 413, so a 26 byte file claiming a huge
+# image cant make a worker allocate gigabytes. a worker that dies anyway gets the pool replaced.
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, parse_qs
+
+from jpcOptions import DEFAULT_QUALITY, SAMPLINGS, TRANSFORMS, SCALES
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_QUEUE = 16                # requests allowed to wait for a worker
+DEFAULT_MAX_BODY = 64 << 20       # bytes
+DEFAULT_MAX_PIXELS = 50_000_000   # width x height of an image to encode or decode, about 8k x 6k
+LATENCY_WINDOW = 10000
+PERCENTILES = (50, 90, 99)
+ROUTES = ("/encode", "/decode", "/stats", "/health") # anything else is counted under "other"
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class HTTPError(Exception):
+   def __init__(self, status: int, message: str):
+      super().__init__(message)
+      self.status = status
+
+# raised by the jobs for images over the pixel limit (and when a worker runs out of memory anyway); a 413.
+# a ValueError with only a message, so it comes back from the pool as itself
+class ImageTooLarge(ValueError):
+   pass
+
+def _check_pixels(width: int, height: int, max_pixels: int) -> None:
+   if width * height > max_pixels:
+      raise ImageTooLarge(f"image is {width} x {height}, over the {max_pixels} pixel limit")
+
+# ---------------------------------------------------------------------------------------------
+# pool side; module level so the worker processes can import them
+# ---------------------------------------------------------------------------------------------
+
+# load the codec when a worker starts, not on its first request
+def _warm_worker() -> None:
+   import codec # noqa: F401
+
+# image bytes (anything Pillow opens) to .jpc bytes; bad input comes back as ValueError (a 400), too big as
+# ImageTooLarge (a 413). Image.open only reads the header, so the size is known before any pixels are
+def encode_job(data: bytes, quality: int, sampling: str, transform: str, progressive: bool,
+               max_pixels: int = DEFAULT_MAX_PIXELS) -> bytes:
+   import io
+   from PIL import Image
+   import codec
+   try:
+      image = Image.open(io.BytesIO(data))
+      _check_pixels(*image.size, max_pixels)
+      return codec.encode(image, quality, sampling=sampling, transform=transform, progressive=progressive)
+   except ImageTooLarge:
+      raise
+   except (MemoryError, Image.DecompressionBombError): # Pillow's own limit can trip at open, before ours
+      raise ImageTooLarge("image too large to encode") from None
+   except (OSError, ValueError) as error:
+      raise ValueError(f"cant encode: {error}") from None
+
+# .jpc bytes to a png, or to raw rgb bytes; returns the body, its content type and the image size
+# the header is read and the full size checked against max_pixels first (the coefficients are full size whatever
+# the scale), so a file that claims a huge image is turned away before anything is allocated for it
+def decode_job(data: bytes, scale: int, transform: str, output: str, max_pixels: int = DEFAULT_MAX_PIXELS):
+   import io
+   from PIL import Image
+   import codec
+   try:
+      header = codec.read_header(data)
+      _check_pixels(header["width"], header["height"], max_pixels)
+      rgb = codec.decode(data, scale=scale, transform=transform)
+   except ImageTooLarge:
+      raise
+   except MemoryError:
+      raise ImageTooLarge("not enough memory to decode this image") from None
+   except (OSError, ValueError) as error:
+      raise ValueError(f"cant decode: {error}") from None
+   height, width = rgb.shape[:2]
+   if output == "raw":
+      return rgb.tobytes(), "application/octet-stream", (width, height)
+   buffer = io.BytesIO()
+   Image.fromarray(rgb).save(buffer, format="PNG", compress_level=1)
+   return buffer.getvalue(), "image/png", (width, height)
+
+# ---------------------------------------------------------------------------------------------
+# http
+# ---------------------------------------------------------------------------------------------
+
+# read one request; None when the client closed the connection between requests
+async def read_request(reader: asyncio.StreamReader, max_body: int):
+   try:
+      head = await reader.readuntil(b"\r\n\r\n")
+   except asyncio.IncompleteReadError as error:
+      if not error.partial:
+         return None
+      raise HTTPError(400, "incomplete request")
+   except asyncio.LimitOverrunError:
+      raise HTTPError(400, "request head too large")
+
+   lines = head.decode("latin-1").split("\r\n")
+   try:
+      method, target, version = lines[0].split(" ", 2)
+   except ValueError:
+      raise HTTPError(400, "bad request line")
+   headers = {}
+   for line in lines[1:]:
+      if line:
+         name, _, value = line.partition(":")
+         headers[name.strip().lower()] = value.strip()
+
+   if "chunked" in headers.get("transfer-encoding", "").lower():
+      raise HTTPError(411, "send a content-length, chunked bodies arent supported")
+   try:
+      length = int(headers.get("content-length", 0))
+   except ValueError:
+      raise HTTPError(400, "bad content-length")
+   if length < 0:
+      raise HTTPError(400, "bad content-length")
+   if length > max_body:
+      raise HTTPError(413, f"body over {max_body} bytes")
+   try:
+      body = await reader.readexactly(length)
+   except asyncio.IncompleteReadError:
+      raise HTTPError(400, "incomplete body")
+   return method.upper(), target, version, headers, body
+
+def response_bytes(status: int, body: bytes, content_type: str, keep_alive: bool, headers=None) -> bytes:
+   lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}", "Connection: " + ("keep-alive" if keep_alive else "close")]
+   lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+   return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+def _json(value) -> bytes:
+   return json.dumps(value, indent=1).encode()
+
+# nearest rank percentile of an already sorted list
+def percentile(values, p: float) -> float:
+   return values[max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))]
+
+# query parameter helpers; bad values are the client's fault (400)
+def _choice(query: dict, name: str, choices, default):
+   value = query.get(name, [default])[-1]
+   if isinstance(default, int) and not isinstance(default, bool):
+      try:
+         value = int(value)
+      except ValueError:
+         raise HTTPError(400, f"{name} must be a number")
+   if choices is not None and value not in choices:
+      raise HTTPError(400, f"bad {name}: {value!r}")
+   return value
+
+def _flag(query: dict, name: str) -> bool:
+   return query.get(name, ["0"])[-1].lower() in ("1", "true", "yes")
+
+# ---------------------------------------------------------------------------------------------
+# server
+# ---------------------------------------------------------------------------------------------
+
+# request count, failures and recent latencies of one route
+class RouteStats:
+   def __init__(self):
+      self.requests = 0
+      self.errors = 0
+      self.rejected = 0
+      self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+   def as_dict(self) -> dict:
+      result = {"requests": self.requests, "errors": self.errors, "rejected": self.rejected}
+      latencies = sorted(self.latencies)
+      if latencies:
+         for p in PERCENTILES:
+            result[f"p{p}_ms"] = round(percentile(latencies, p) * 1000, 2)
+         result["max_ms"] = round(latencies[-1] * 1000, 2)
+      return result
+
+class CodecServer:
+   def __init__(self, workers=None, queue: int = DEFAULT_QUEUE, max_body: int = DEFAULT_MAX_BODY, executor=None,
+                max_pixels: int = DEFAULT_MAX_PIXELS):
+      self.workers = workers or os.cpu_count() or 1
+      self.limit = self.workers + queue
+      self.max_body = max_body
+      self.max_pixels = max_pixels
+      self.executor = executor or self.make_executor()
+      self.pending = 0 # requests in the pool, running or queued
+      self.routes = {}
+
+   def route_stats(self, path: str) -> RouteStats:
+      path = path if path in ROUTES else "other"
+      stats = self.routes.get(path)
+      if stats is None:
+         stats = self.routes[path] = RouteStats()
+      return stats
+
+   def make_executor(self):
+      return ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+
+   # hand a job to the pool unless it is full; the check and the increment happen without an await in
+   # between, so the limit holds with any number of connections. a worker that died (killed for memory, say)
+   # breaks the whole pool, so the first request to see that starts a new one and the rest just retry
+   async def run_in_pool(self, function, *args):
+      if self.pending >= self.limit:
+         raise HTTPError(503, "busy, try again")
+      self.pending += 1
+      executor = self.executor
+      try:
+         return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+      except BrokenProcessPool:
+         if self.executor is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = self.make_executor()
+         raise HTTPError(503, "worker crashed, try again")
+      finally:
+         self.pending -= 1
+
+   # (status, body, content type, extra headers) for one request
+   async def respond(self, method: str, path: str, query: dict, body: bytes):
+      if path == "/health":
+         return 200, b"ok\n", "text/plain", None
+      if path == "/stats":
+         return 200, _json(self.stats()), "application/json", None
+      if path not in ("/encode", "/decode"):
+         raise HTTPError(404, f"no route {path}")
+      if method != "POST":
+         raise HTTPError(405, f"{path} takes POST")
+
+      transform = _choice(query, "transform", TRANSFORMS, TRANSFORMS[0])
+      if path == "/encode":
+         quality = _choice(query, "quality", range(1, 101), DEFAULT_QUALITY)
+         sampling = _choice(query, "sampling", SAMPLINGS, SAMPLINGS[0])
+         data = await self.run_in_pool(encode_job, body, quality, sampling, transform, _flag(query, "progressive"),
+                                       self.max_pixels)
+         return 200, data, "application/octet-stream", None
+      scale = _choice(query, "scale", SCALES, 1)
+      output = _choice(query, "format", ("png", "raw"), "png")
+      data, content_type, (width, height) = await self.run_in_pool(decode_job, body, scale, transform, output,
+                                                                   self.max_pixels)
+      return 200, data, content_type, {"X-Width": width, "X-Height": height}
+
+   # one connection; HTTP/1.1 keep-alive unless the client says close
+   async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+      try:
+         while True:
+            keep_alive = True
+            path = None
+            try:
+               request = await read_request(reader, self.max_body)
+               if request is None:
+                  break
+               start = time.perf_counter()
+               method, target, version, headers, body = request
+               connection = headers.get("connection", "").lower()
+               keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+               url = urlsplit(target)
+               path = url.path
+               status, data, content_type, extra = await self.respond(method, path, parse_qs(url.query), body)
+            except HTTPError as error:
+               status, data, content_type = error.status, _json({"error": str(error)}), "application/json"
+               extra = {"Retry-After": 1} if error.status == 503 else None
+               keep_alive = keep_alive and path is not None # a request that didnt parse leaves the stream unusable
+            except (ImageTooLarge, MemoryError) as error: # from the pool: over the pixel limit, or out of memory
+               status, data, content_type, extra = 413, _json({"error": str(error) or "out of memory"}), \
+                  "application/json", None
+            except ValueError as error: # from the pool: input the codec couldnt take
+               status, data, content_type, extra = 400, _json({"error": str(error)}), "application/json", None
+            except Exception as error:
+               status, data, content_type, extra = 500, _json({"error": repr(error)}), "application/json", None
+
+            writer.write(response_bytes(status, data, content_type, keep_alive, extra))
+            await writer.drain()
+            if path is not None:
+               stats = self.route_stats(path)
+               stats.requests += 1
+               if status == 200:
+                  stats.latencies.append(time.perf_counter() - start)
+               elif status == 503:
+                  stats.rejected += 1
+               else:
+                  stats.errors += 1
+            if not keep_alive:
+               break
+      except (ConnectionError, asyncio.IncompleteReadError):
+         pass
+      except asyncio.CancelledError: # server shutting down with the connection idle; nothing left to answer
+         pass
+      finally:
+         writer.close()
+
+   def stats(self) -> dict:
+      return {
+         "workers": self.workers,
+         "limit": self.limit,
+         "pending": self.pending,
+         "routes": {path: stats.as_dict() for path, stats in sorted(self.routes.items())},
+      }
+
+   async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix=None) -> None:
+      if unix:
+         server = await asyncio.start_unix_server(self.handle, path=unix)
+         print(f"serving on {unix} ({self.workers} workers, {self.limit} in flight at most)", flush=True)
+      else:
+         server = await asyncio.start_server(self.handle, host, port)
+         print(f"serving on http://{host}:{port} ({self.workers} workers, {self.limit} in flight at most)", flush=True)
+      async with server:
+         await server.serve_forever()
+
+   def close(self) -> None:
+      self.executor.shutdown(cancel_futures=True)
+
+def main(argv=None) -> int:
+   parser = argparse.ArgumentParser(description="Serve .jpc encode / decode over HTTP.")
+   parser.add_argument("--host", default=DEFAULT_HOST)
+   parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+   parser.add_argument("--unix", metavar="PATH", help="listen on a unix socket instead of tcp")
+   parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default one per core)")
+   parser.add_argument("--queue", type=int, default=DEFAULT_QUEUE,
+                       help="requests that may wait for a worker before new ones get 503 (default %(default)s)")
+   parser.add_argument("--max-body", type=int, default=DEFAULT_MAX_BODY >> 20, help="largest body in MB (default %(default)s)")
+   parser.add_argument("--max-pixels", type=float, default=DEFAULT_MAX_PIXELS / 1e6,
+                       help="largest image to encode or decode, in megapixels (default %(default)s)")
+   args = parser.parse_args(argv)
+
+   server = CodecServer(args.workers, args.queue, args.max_body << 20, max_pixels=int(args.max_pixels * 1e6))
+   try:
+      asyncio.run(server.serve(args.host, args.port, args.unix))
+   except KeyboardInterrupt:
+      pass
+   finally:
+      server.close()
+   return 0
+
+if __name__ == "__main__":
+   sys.exit(main())
@@ -0,0 +1,204 @@
+# Streaming, bounded memory encoder: the source is read in bands of MCU rows (one MCU row by default),
+# each band is colour converted, transformed and entropy coded, and its bytes are written out before the
+# next band is read. Peak memory is a few bands, not the image, so there is no need to shrink big scans.
+#
+# Uncompressed BMPs are read straight from disk a band at a time. Other formats go through Pillow, which
+# decodes the whole file once; arrays (including np.memmap) are sliced band by band.
+#
+# Every band is one row of tiles (full width unless tile_width is given). The tile index in the header is
+# written as zeros first and filled in once all tiles are out, so the output file has to be seekable.
+
+import os
+import struct
+from typing import BinaryIO, Iterator, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+from colorConversion import rgb_to_ycbcr_array
+from chromaSubsampling import downsample, sampling_factors
+from entropyEncoding import (
+   huffman_encode_channel,
+   huffman_frequencies,
+   build_huffman_table,
+   STANDARD_LUMA_DC,
+   STANDARD_LUMA_AC,
+   STANDARD_CHROMA_DC,
+   STANDARD_CHROMA_AC,
+)
+from quantization import quality_tables
+from jpcOptions import DEFAULT_QUALITY, DEFAULT_SAMPLING, DEFAULT_TRANSFORM
+from codec import (
+   block_size,
+   header_bytes,
+   mcu_size,
+   channel_grids,
+   tile_blocks,
+   split_tiles,
+   transform_channel,
+   to_rgb_array,
+)
+
+# default band height for 4:4:4; one row of 8 by 8 blocks (with subsampling the default is one MCU row)
+DEFAULT_BAND_ROWS = 8
+
+# reads an uncompressed 24 / 32 bit BMP a band of rows at a time; None if the file is anything else
+def _bmp_bands(path: str, band_rows: int):
+   with open(path, "rb") as f:
+      header = f.read(54)
+   if len(header) < 54 or header[:2] != b"BM":
+      return None
+   pixel_offset = struct.unpack_from("<I", header, 10)[0]
+   width, height = struct.unpack_from("<ii", header, 18)
+   bits, compression = struct.unpack_from("<HI", header, 28)
+   if bits not in (24, 32) or compression != 0 or width <= 0 or height == 0:
+      return None
+
+   top_down = height < 0 # negative height means rows are stored top to bottom
+   height = abs(height)
+   channels = bits // 8
+   stride = (width * bits + 31) // 32 * 4 # rows are padded to 4 bytes
+
+   def bands():
+      with open(path, "rb") as f:
+         for start in range(0, height, band_rows):
+            end = min(start + band_rows, height)
+            # the band's rows are contiguous in the file either way, bottom up files just store them flipped
+            first_row = start if top_down else height - end
+            f.seek(pixel_offset + first_row * stride)
+            raw = np.frombuffer(f.read((end - start) * stride), dtype=np.uint8)
+            rows = raw.reshape(end - start, stride)[:, :width * channels].reshape(end - start, width, channels)
+            if not top_down:
+               rows = rows[::-1]
+            yield rows[..., 2::-1] # BGR(A) to RGB
+
+   return width, height, bands
+
+# (width, height, band generator factory) for any source; the factory can be called again for a second pass
+def open_bands(source, band_rows: int = DEFAULT_BAND_ROWS):
+   if isinstance(source, (str, os.PathLike)):
+      bmp = _bmp_bands(os.fspath(source), band_rows)
+      if bmp is not None:
+         return bmp
+      with Image.open(source) as img:
+         source = img.convert("RGB") # pillow can only hand over whole images for most formats
+
+   rgb = to_rgb_array(source)
+   height, width = rgb.shape[:2]
+
+   def bands():
+      for start in range(0, height, band_rows):
+         yield rgb[start:start + band_rows]
+
+   return width, height, bands
+
+# (N, 64) coefficients of the three channels of every band
+# chroma is downsampled band by band, bands start on an MCU boundary so the box filter gives the same planes
+# as downsampling the whole image. the triangle filter reaches one row past each row pair, so with vertical
+# halving every band is downsampled with the last 2 rows of the band above and the first 2 of the band below
+# and the extra output rows are dropped again; same planes as the whole image that way too
+def _band_coefficients(bands, luma_q, chroma_q, sampling: str = DEFAULT_SAMPLING, chroma_filter: str = "box",
+                       transform: str = DEFAULT_TRANSFORM) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+   context = sampling_factors(sampling)[1] == 2 and chroma_filter != "box"
+   ycbcr_bands = (rgb_to_ycbcr_array(rgb) for rgb in bands())
+   above = None
+   ycbcr = next(ycbcr_bands, None)
+   while ycbcr is not None:
+      below = next(ycbcr_bands, None) if context else None
+      cb, cr = ycbcr[..., 1], ycbcr[..., 2]
+      if sampling != "4:4:4":
+         if context:
+            rows = [part for part in (above, ycbcr, None if below is None else below[:2]) if part is not None]
+            chroma = np.concatenate(rows)[..., 1:]
+            first = 0 if above is None else 1
+            last = first + -(-len(ycbcr) // 2)
+            cb = downsample(chroma[..., 0], sampling, chroma_filter)[first:last]
+            cr = downsample(chroma[..., 1], sampling, chroma_filter)[first:last]
+            above = ycbcr[-2:]
+         else:
+            cb = downsample(cb, sampling, chroma_filter)
+            cr = downsample(cr, sampling, chroma_filter)
+      yield (
+         transform_channel(ycbcr[..., 0], luma_q, transform),
+         transform_channel(cb, chroma_q, transform),
+         transform_channel(cr, chroma_q, transform),
+      )
+      ycbcr = below if context else next(ycbcr_bands, None)
+
+# compress source (path, pillow image or array) into file band by band; returns the number of bytes written
+# band_rows must be a multiple of the MCU height (8 rows, 16 for 4:2:0), None means one MCU row.
+# tile_width (a multiple of the MCU width) splits every band into tiles for region decodes, None keeps
+# bands whole. optimize_tables reads and transforms the source twice (still one band at a time) to build
+# per image huffman tables; otherwise the standard tables are used. transform is "float" or "int" and chroma_filter
+# "box" or "triangle", like codec.encode
+def encode_stream(source, file: BinaryIO, quality: int = DEFAULT_QUALITY, band_rows: Optional[int] = None,
+                  optimize_tables: bool = False, sampling: str = DEFAULT_SAMPLING,
+                  tile_width: Optional[int] = None, transform: str = DEFAULT_TRANSFORM,
+                  chroma_filter: str = "box") -> int:
+   mcu_width, mcu_height = mcu_size(sampling)
+   if band_rows is None:
+      band_rows = mcu_height
+   if band_rows <= 0 or band_rows % mcu_height:
+      raise ValueError(f"band_rows must be a multiple of {mcu_height} for {sampling}")
+   if tile_width is not None and (tile_width <= 0 or tile_width % mcu_width):
+      raise ValueError(f"tile_width must be a multiple of {mcu_width} for {sampling}")
+   if not file.seekable():
+      raise ValueError("encode_stream needs a seekable file to fill in the tile index")
+
+   width, height, bands = open_bands(source, band_rows)
+   luma_q, chroma_q = quality_tables(quality)
+   if tile_width is None:
+      tile_width = -(-width // mcu_width) * mcu_width
+   grids = channel_grids(width, height, sampling)
+   tile_shapes = [(grid[1],) + tile_blocks(grid, tile_width, band_rows) for grid in grids]
+
+   # one band of coefficients cut into its tiles, as (y, cb, cr) per tile
+   def band_tiles():
+      for channels in _band_coefficients(bands, luma_q, chroma_q, sampling, chroma_filter, transform):
+         yield from zip(*[split_tiles(zz, *shape) for zz, shape in zip(channels, tile_shapes)])
+
+   if optimize_tables:
+      # first pass only counts symbols
+      frequencies = [np.zeros(256, dtype=np.int64) for _ in range(4)] # luma DC, luma AC, chroma DC, chroma AC
+      for y_zz, cb_zz, cr_zz in band_tiles():
+         for zz, first in ((y_zz, 0), (cb_zz, 2), (cr_zz, 2)):
+            dc_counts, ac_counts = huffman_frequencies(zz)
+            frequencies[first] += dc_counts
+            frequencies[first + 1] += ac_counts
+      luma_dc, luma_ac, chroma_dc, chroma_ac = [build_huffman_table(f) for f in frequencies]
+   else:
+      luma_dc, luma_ac, chroma_dc, chroma_ac = STANDARD_LUMA_DC, STANDARD_LUMA_AC, STANDARD_CHROMA_DC, STANDARD_CHROMA_AC
+
+   # header with the tile index reserved
+   tile_count = -(-width // tile_width) * -(-height // band_rows)
+   block_counts = [rows * cols for rows, cols, _, _ in grids]
+   header = header_bytes(width, height, block_size, block_counts, quality, luma_q, chroma_q,
+                         (luma_dc, luma_ac, chroma_dc, chroma_ac), tile_width, band_rows, sampling,
+                         [0] * (tile_count + 1))
+   start = file.tell()
+   written = file.write(header)
+
+   offsets = [0]
+   for y_zz, cb_zz, cr_zz in band_tiles():
+      tile = bytearray()
+      for zz, dc_table, ac_table in ((y_zz, luma_dc, luma_ac), (cb_zz, chroma_dc, chroma_ac), (cr_zz, chroma_dc, chroma_ac)):
+         payload = huffman_encode_channel(zz, dc_table, ac_table)
+         tile += struct.pack(">I", len(payload))
+         tile += payload
+      written += file.write(tile)
+      offsets.append(offsets[-1] + len(tile))
+
+   # go back and fill in the index
+   end = file.tell()
+   file.seek(start + len(header) - 4 * len(offsets))
+   file.write(np.asarray(offsets, dtype=">u4").tobytes())
+   file.seek(end)
+   return written
+
+# compress an image file to a .jpc file band by band
+def encode_file(input_path: str, output_path: str, quality: int = DEFAULT_QUALITY,
+                band_rows: Optional[int] = None, optimize_tables: bool = False,
+                sampling: str = DEFAULT_SAMPLING, tile_width: Optional[int] = None,
+                transform: str = DEFAULT_TRANSFORM, chroma_filter: str = "box") -> int:
+   with open(output_path, "wb") as file:
+      return encode_stream(input_path, file, quality, band_rows, optimize_tables, sampling, tile_width, transform,
+                           chroma_filter)
@@ -0,0 +1,5 @@
+# the modules live flat in the repo root; make them importable however pytest is started
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,23 @@
+# whole image colour conversion against the per pixel reference functions; must be bit identical
+import numpy as np
+import pytest
+
+from colorConversion import rgb_to_ycbcr_pixel, ycbcr_to_rgb_pixel, rgb_to_ycbcr_array, ycbcr_to_rgb_array
+
+def _random_image(dtype, seed: int = 0) -> np.ndarray:
+   rng = np.random.default_rng(seed)
+   return rng.integers(0, 256, size=(17, 23, 3)).astype(dtype)
+
+def test_rgb_to_ycbcr_matches_pixel_reference():
+   rgb = _random_image(np.uint8)
+   expected = np.array([[rgb_to_ycbcr_pixel(*map(int, pixel)) for pixel in row] for row in rgb], dtype=np.uint8)
+   np.testing.assert_array_equal(rgb_to_ycbcr_array(rgb), expected)
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.float32])
+def test_ycbcr_to_rgb_matches_pixel_reference(dtype):
+   ycbcr = _random_image(dtype, seed=1)
+   # the decoder hands over float32 planes, so float pixels go in as numpy float32 scalars (python ints otherwise,
+   # uint8 scalars would wrap around in cb - 128)
+   pixels = ycbcr if dtype == np.float32 else ycbcr.astype(object)
+   expected = np.array([[ycbcr_to_rgb_pixel(*pixel) for pixel in row] for row in pixels], dtype=np.uint8)
+   np.testing.assert_array_equal(ycbcr_to_rgb_array(ycbcr), expected)
@@ -0,0 +1,82 @@
+# RLEChannel and CompressedImage (the array form of the compressed image) against the per block pair lists
+# they replaced
+import numpy as np
+import pytest
+
+import codec
+from compressedImage import CompressedImage, CHANNEL_KEYS
+from entropyEncoding import RLEChannel, rle_encode, rle_decode
+from quantization import STANDARD_LUMA_Q
+
+def _vecs(count: int = 50, seed: int = 0) -> np.ndarray:
+   rng = np.random.default_rng(seed)
+   vecs = rng.integers(-50, 51, size=(count, 64)) * (rng.random((count, 64)) < 0.2)
+   vecs[0] = 0
+   vecs[1] = rng.integers(1, 5, 64)
+   return vecs
+
+def _pairs(vecs):
+   return [rle_encode(vec.tolist()) for vec in vecs]
+
+def test_channel_matches_pair_lists():
+   vecs = _vecs()
+   channel = RLEChannel.from_blocks(vecs)
+   assert channel == RLEChannel.from_pairs(_pairs(vecs))
+   assert channel.to_pairs() == _pairs(vecs)
+   np.testing.assert_array_equal(channel.decode(), vecs)
+   assert len(channel) == len(vecs)
+   assert channel.nbytes == 3 * len(channel.runs) + 4 * (len(vecs) + 1)
+
+def test_channel_indexing_and_slicing():
+   vecs = _vecs(seed=1)
+   channel = RLEChannel.from_blocks(vecs)
+   for i, (runs, values) in enumerate(channel):
+      assert list(zip(runs.tolist(), values.tolist())) == rle_encode(vecs[i].tolist())
+   runs, values = channel[-1]
+   assert rle_decode(list(zip(runs.tolist(), values.tolist()))) == vecs[-1].tolist()
+   for start, stop in [(0, 50), (3, 17), (49, 50), (10, 10), (40, 99)]:
+      part = channel[start:stop]
+      assert part == RLEChannel.from_blocks(vecs[start:stop])
+      assert part.offsets[0] == 0
+   with pytest.raises(IndexError):
+      channel[50]
+   with pytest.raises(ValueError):
+      channel[::2]
+
+def test_channel_rejects_inconsistent_arrays():
+   runs, values, offsets = RLEChannel.from_blocks(_vecs()).arrays()
+   with pytest.raises(ValueError):
+      RLEChannel(runs, values, offsets[:-1])
+   with pytest.raises(ValueError):
+      RLEChannel(runs[:-1], values, offsets)
+
+@pytest.mark.parametrize("sampling", ["4:4:4", "4:2:0"])
+def test_compressed_image_dict_conversions(sampling):
+   rng = np.random.default_rng(2)
+   compressed = codec.compress_image(rng.integers(0, 256, (37, 45, 3), dtype=np.uint8), 60, sampling=sampling)
+   assert isinstance(compressed, CompressedImage)
+
+   legacy = compressed.to_dict(legacy=True)
+   for key, channel in zip(CHANNEL_KEYS, compressed.channels):
+      assert legacy[key] == _pairs(channel.decode())
+      assert compressed[key] is channel
+   assert CompressedImage.from_dict(legacy) == compressed
+   assert CompressedImage.from_dict(compressed.to_dict()) == compressed
+   assert CompressedImage.from_dict(compressed) is compressed
+   assert len(compressed) == sum(len(channel) for channel in compressed.channels)
+   assert compressed["width"] == 45 and compressed.get("missing", 7) == 7 and "sampling" in compressed
+
+   # the decoder and the writer take the old dict as well, with the same result
+   np.testing.assert_array_equal(codec.decompress_array(legacy), codec.decompress_array(compressed))
+   assert codec.compressed_to_bytes(legacy) == codec.compressed_to_bytes(compressed)
+   assert codec.parse_JPC(codec.compressed_to_bytes(compressed)) == compressed
+
+# dicts from before the quantization tables were stored: every channel used the luma table
+def test_old_dict_defaults():
+   vecs = _vecs(12)
+   old = {"width": 16, "height": 24, "block_size": 8,
+          "y_blocks": _pairs(vecs[:6]), "cb_blocks": _pairs(vecs[6:12]), "cr_blocks": _pairs(vecs[:6])}
+   compressed = CompressedImage.from_dict(old)
+   assert compressed.sampling == "4:4:4" and compressed.quality == 50
+   np.testing.assert_array_equal(compressed.chroma_q, STANDARD_LUMA_Q)
+   np.testing.assert_array_equal(compressed.cb.decode(), vecs[6:12])
@@ -0,0 +1,84 @@
+# batched matrix DCT / IDCT against the per block reference loops in twoDDCT.py, and the integer AAN path
+# of integerDCT.py against the float one
+import numpy as np
+import pytest
+
+from twoDDCT import dct_2d, idct_2d, dct_2d_blocks, idct_2d_blocks
+from integerDCT import fdct_quantize_blocks, dequantize_idct_blocks, zigzag_dequantize_idct
+from quantization import quality_tables, quantize_blocks, dequantize_blocks
+
+# float32 carries ~7 digits; coefficients and pixels go up to ~1000 / 255
+TOLERANCES = {np.float32: 1e-3, np.float64: 1e-9}
+
+def _random_blocks(count: int = 12, seed: int = 0) -> np.ndarray:
+   rng = np.random.default_rng(seed)
+   return rng.uniform(-128, 127, size=(count, 8, 8))
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_dct_2d_blocks_matches_reference(dtype):
+   blocks = _random_blocks()
+   expected = np.stack([dct_2d(block) for block in blocks])
+   result = dct_2d_blocks(blocks, dtype)
+   assert result.dtype == dtype
+   np.testing.assert_allclose(result, expected, rtol=0, atol=TOLERANCES[dtype])
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_idct_2d_blocks_matches_reference(dtype):
+   coefficients = _random_blocks(seed=1) * 8
+   expected = np.stack([idct_2d(block) for block in coefficients])
+   result = idct_2d_blocks(coefficients, dtype)
+   assert result.dtype == dtype
+   np.testing.assert_allclose(result, expected, rtol=0, atol=TOLERANCES[dtype])
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_batched_round_trip_and_any_leading_shape(dtype):
+   blocks = _random_blocks(24, seed=2).reshape(2, 3, 4, 8, 8)
+   coefficients = dct_2d_blocks(blocks, dtype)
+   assert coefficients.shape == blocks.shape
+   np.testing.assert_allclose(idct_2d_blocks(coefficients, dtype), blocks, rtol=0, atol=TOLERANCES[dtype])
+
+# fixed point AAN path (integerDCT.py, quantizer folded in) against the float path; the 8 bit constants leave it
+# at most a level or two off, more only with the all 1s table of quality 100 (nothing left to absorb the error)
+COEFFICIENT_BOUNDS = {10: 1, 50: 1, 90: 1, 100: 3}
+PIXEL_BOUND = 2
+
+def _pixel_blocks(count: int = 20000, seed: int = 3) -> np.ndarray:
+   rng = np.random.default_rng(seed)
+   blocks = rng.integers(-128, 128, size=(count, 8, 8))
+   blocks[:count // 2] = np.clip(np.cumsum(rng.integers(-12, 13, size=(count // 2, 8, 8)), axis=2), -128, 127)
+   return blocks
+
+@pytest.mark.parametrize("quality", sorted(COEFFICIENT_BOUNDS))
+def test_integer_dct_stays_near_float(quality):
+   blocks = _pixel_blocks()
+   for q_matrix in quality_tables(quality):
+      expected = quantize_blocks(dct_2d_blocks(blocks, np.float64), q_matrix)
+      result = fdct_quantize_blocks(blocks, q_matrix)
+      assert np.abs(result - expected).max() <= COEFFICIENT_BOUNDS[quality]
+
+      pixels = np.rint(idct_2d_blocks(dequantize_blocks(expected, q_matrix), np.float64))
+      assert np.abs(dequantize_idct_blocks(expected, q_matrix) - pixels).max() <= PIXEL_BOUND
+
+# flat blocks are DC only and go through both ways exactly: DC = rint(8 v / q), pixels = floor(dc q / 8 + 1/2),
+# the same from the DC only fast path of zigzag_dequantize_idct; with q[0, 0] = 1 that is the block itself
+@pytest.mark.parametrize("quality", [10, 50, 90, 100])
+def test_integer_dct_dc_only_exact(quality):
+   values = np.arange(-128, 128)
+   flat = np.broadcast_to(values[:, None, None], (len(values), 8, 8))
+   for q_matrix in quality_tables(quality):
+      coefficients = fdct_quantize_blocks(flat, q_matrix)
+      np.testing.assert_array_equal(coefficients, quantize_blocks(dct_2d_blocks(flat, np.float64), q_matrix))
+      assert not coefficients.reshape(-1, 64)[:, 1:].any()
+
+      limit = 1024 // int(q_matrix[0, 0]) + 1 # every DC an 8 bit block can quantize to
+      dc = np.arange(-limit, limit + 1)
+      blocks = np.zeros((len(dc), 8, 8), dtype=np.int64)
+      blocks[:, 0, 0] = dc
+      expected = np.floor(dc * int(q_matrix[0, 0]) / 8 + 0.5)[:, None, None]
+      np.testing.assert_array_equal(dequantize_idct_blocks(blocks, q_matrix), np.broadcast_to(expected, blocks.shape))
+      zz = np.zeros((len(dc), 64), dtype=np.int64)
+      zz[:, 0] = dc
+      plane = zigzag_dequantize_idct(zz, q_matrix, 1, len(dc))
+      np.testing.assert_array_equal(plane.reshape(8, len(dc), 8).transpose(1, 0, 2), np.broadcast_to(expected, blocks.shape))
+      if q_matrix[0, 0] == 1:
+         np.testing.assert_array_equal(dequantize_idct_blocks(coefficients, q_matrix), flat)
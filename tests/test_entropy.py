@@ -0,0 +1,100 @@
+# huffman stage of entropyEncoding.py: tables, bit packing and the channel round trip
+import numpy as np
+import pytest
+
+from entropyEncoding import build_huffman_table, huffman_codes, pack_bits, huffman_encode_channel, \
+   huffman_decode_channel, optimized_huffman_tables, zigzag_corner_length, STANDARD_LUMA_DC, STANDARD_LUMA_AC, \
+   STANDARD_CHROMA_DC, STANDARD_CHROMA_AC
+
+# quantized looking blocks: DC wandering around, sparse small AC, plus the blocks the coder special cases
+def _blocks(count: int = 300, seed: int = 0) -> np.ndarray:
+   rng = np.random.default_rng(seed)
+   zz = rng.integers(-60, 61, size=(count, 64)) * (rng.random((count, 64)) < 0.12)
+   zz[:, 0] = rng.integers(-120, 121, count)
+   zz[0] = 0                         # all zero block: DC 0 and a lone EOB
+   zz[1] = rng.integers(1, 9, 64)    # all 64 coefficients set, so no EOB
+   zz[2, 1:] = 0
+   zz[2, 63] = 5                     # 62 zeros (3 ZRLs) then the 64th coefficient, no EOB either
+   zz[3] = 0
+   zz[3, 0] = -1023                  # biggest DC size the standard tables have a code for
+   zz[4, 1:] = 0
+   zz[4, 1] = 1023                   # biggest AC size
+   return zz
+
+def _tables(kind: str, zz):
+   if kind == "standard":
+      return (STANDARD_LUMA_DC, STANDARD_LUMA_AC), (STANDARD_CHROMA_DC, STANDARD_CHROMA_AC)
+   tables = optimized_huffman_tables([zz])
+   return tables, tables
+
+@pytest.mark.parametrize("kind", ["standard", "optimized"])
+def test_channel_round_trip(kind):
+   zz = _blocks()
+   for dc_table, ac_table in _tables(kind, zz):
+      payload = huffman_encode_channel(zz, dc_table, ac_table)
+      np.testing.assert_array_equal(huffman_decode_channel(payload, len(zz), dc_table, ac_table), zz)
+
+@pytest.mark.parametrize("block", [0, 1, 2])
+def test_single_block_edge_cases(block):
+   zz = _blocks()[block:block + 1]
+   dc_table, ac_table = optimized_huffman_tables([zz])
+   payload = huffman_encode_channel(zz, dc_table, ac_table)
+   np.testing.assert_array_equal(huffman_decode_channel(payload, 1, dc_table, ac_table), zz)
+
+@pytest.mark.parametrize("k", [1, 2, 4])
+def test_decode_prefix_only(k):
+   zz = _blocks(seed=1)
+   dc_table, ac_table = optimized_huffman_tables([zz])
+   payload = huffman_encode_channel(zz, dc_table, ac_table)
+   length = zigzag_corner_length(k)
+   expected = zz.copy()
+   expected[:, length:] = 0
+   result = huffman_decode_channel(payload, len(zz), dc_table, ac_table, total_length=length)
+   np.testing.assert_array_equal(result, expected)
+
+@pytest.mark.parametrize("kind", ["standard", "optimized"])
+def test_truncated_payload_raises(kind):
+   zz = _blocks(seed=2)
+   dc_table, ac_table = _tables(kind, zz)[0]
+   payload = huffman_encode_channel(zz, dc_table, ac_table)
+   for cut in (0, 1, len(payload) // 2, len(payload) - 1):
+      with pytest.raises(ValueError):
+         huffman_decode_channel(payload[:cut], len(zz), dc_table, ac_table)
+
+def test_symbol_missing_from_table_raises():
+   zz = np.zeros((1, 64), dtype=np.int64)
+   zz[0, 0] = 5
+   dc_table, ac_table = optimized_huffman_tables([np.zeros((1, 64), dtype=np.int64)])
+   with pytest.raises(ValueError):
+      huffman_encode_channel(zz, dc_table, ac_table)
+
+# fibonacci counts make the unlimited code 20+ bits deep, so the Annex K.3 length limiting has to kick in
+@pytest.mark.parametrize("frequencies", [
+   {0: 10},
+   {0: 1, 7: 1},
+   {symbol: 1 for symbol in range(256)},
+   dict(enumerate([1, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377, 610, 987, 1597, 2584, 4181, 6765, 10946,
+                   17711, 28657, 46368])),
+])
+def test_build_huffman_table_is_a_prefix_code(frequencies):
+   freq = np.zeros(256, dtype=np.int64)
+   for symbol, count in frequencies.items():
+      freq[symbol] = count
+   bits, huffval = build_huffman_table(freq)
+   assert len(bits) == 16 and sorted(huffval) == sorted(frequencies)
+   _, lengths = huffman_codes((bits, huffval))
+   used = lengths[huffval]
+   assert used.min() >= 1 and used.max() <= 16
+   # kraft sum strictly under 1: the all 1s code stays free, so 0xFF padding never decodes as a symbol
+   assert sum(2.0 ** -int(length) for length in used) < 1
+   # more frequent symbols never get longer codes
+   assert all(lengths[a] <= lengths[b] for a in huffval for b in huffval if freq[a] > freq[b])
+
+def test_pack_bits_matches_bit_strings():
+   rng = np.random.default_rng(3)
+   lengths = rng.integers(0, 32, 500)
+   values = np.array([int(rng.integers(0, 1 << int(n))) if n else 0 for n in lengths])
+   bit_string = "".join(format(int(v), f"0{n}b") if n else "" for v, n in zip(values, lengths))
+   bit_string += "1" * (-len(bit_string) % 8) # JPEG style 1 padding
+   expected = bytes(int(bit_string[i:i + 8], 2) for i in range(0, len(bit_string), 8))
+   assert pack_bits(values, lengths) == expected
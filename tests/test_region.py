@@ -0,0 +1,42 @@
+# region decodes (tile index for v7 files, block rows of a parsed image) against cropping a full decode
+import numpy as np
+import pytest
+
+import codec
+
+# odd sized so the last tile row / column and the chroma planes are partial
+def _image(width: int = 83, height: int = 61, seed: int = 0) -> np.ndarray:
+   rng = np.random.default_rng(seed)
+   y, x = np.mgrid[:height, :width]
+   smooth = np.stack([x * 3, y * 4, (x + y) * 2], axis=-1)
+   return np.clip(smooth + rng.integers(-30, 31, (height, width, 3)), 0, 255).astype(np.uint8)
+
+def _regions(width: int, height: int, seed: int = 1):
+   rng = np.random.default_rng(seed)
+   regions = [(0, 0, width, height), (0, 0, 1, 1), (width - 1, height - 1, 1, 1), (15, 15, 2, 2), (16, 7, 17, 33)]
+   for _ in range(6):
+      x, y = int(rng.integers(width)), int(rng.integers(height))
+      regions.append((x, y, int(rng.integers(1, width - x + 1)), int(rng.integers(1, height - y + 1))))
+   return regions
+
+@pytest.mark.parametrize("transform", ["float", "int"])
+@pytest.mark.parametrize("layout", [{"tile_size": 16}, {"tile_size": 32}, {"tile_size": 256}, {"tile_size": None},
+                                    {"progressive": True}])
+@pytest.mark.parametrize("sampling", ["4:4:4", "4:2:2", "4:2:0"])
+def test_region_matches_full_decode(sampling, layout, transform):
+   rgb = _image()
+   data = codec.encode(rgb, quality=70, sampling=sampling, transform=transform, **layout)
+   full = codec.decode(data, transform=transform)
+   compressed = codec.parse_JPC(data)
+   for x, y, w, h in _regions(rgb.shape[1], rgb.shape[0]):
+      expected = full[y:y + h, x:x + w]
+      np.testing.assert_array_equal(codec.decode_region(data, x, y, w, h, transform=transform), expected)
+      np.testing.assert_array_equal(codec.decompress_region(compressed, x, y, w, h, transform), expected)
+
+@pytest.mark.parametrize("region", [(0, 0, 0, 1), (-1, 0, 2, 2), (80, 0, 4, 1), (0, 60, 1, 2)])
+def test_region_outside_image_raises(region):
+   data = codec.encode(_image())
+   with pytest.raises(ValueError):
+      codec.decode_region(data, *region)
+   with pytest.raises(ValueError):
+      codec.decompress_region(codec.parse_JPC(data), *region)
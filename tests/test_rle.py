@@ -0,0 +1,49 @@
+# batched rle over (N, 64) zigzag vectors against the per block rle_encode / rle_decode in entropyEncoding.py
+import numpy as np
+import pytest
+
+from entropyEncoding import rle_encode, rle_decode, rle_encode_blocks, rle_decode_blocks, rle_arrays_to_pairs, \
+   last_nonzero
+
+# quantized looking blocks: mostly 0, a few small values, plus the edge cases every channel has somewhere
+def _blocks(count: int = 200, seed: int = 0) -> np.ndarray:
+   rng = np.random.default_rng(seed)
+   vecs = rng.integers(-40, 41, size=(count, 64)) * (rng.random((count, 64)) < 0.15)
+   vecs[0] = 0                        # all zero block, one (0, 0) pair
+   vecs[1] = rng.integers(1, 5, 64)   # every coefficient set, no trailing zeros
+   vecs[2] = 0
+   vecs[2, 63] = -7                   # a run of 63 zeros up to the last position
+   vecs[3] = 0
+   vecs[3, 0] = 1000                  # DC only
+   vecs[4] = 0
+   vecs[4, [20, 40]] = (-1, 1)        # runs of more than 15 (huffman splits those, rle doesnt)
+   return vecs
+
+def _pairs(vecs):
+   return [rle_encode(vec.tolist()) for vec in vecs]
+
+def test_rle_encode_blocks_matches_reference():
+   vecs = _blocks()
+   runs, values, offsets = rle_encode_blocks(vecs)
+   assert (runs.dtype, values.dtype, offsets.dtype) == (np.uint8, np.int16, np.int32)
+   assert len(offsets) == len(vecs) + 1 and offsets[-1] == len(runs)
+   assert rle_arrays_to_pairs(runs, values, offsets) == _pairs(vecs)
+
+@pytest.mark.parametrize("total_length", [64, 10, 1])
+def test_rle_decode_blocks_matches_reference(total_length):
+   vecs = _blocks(seed=1)
+   expected = np.array([rle_decode(pairs, total_length) for pairs in _pairs(vecs)])
+   result = rle_decode_blocks(*rle_encode_blocks(vecs), total_length)
+   np.testing.assert_array_equal(result, expected)
+   if total_length == 64:
+      np.testing.assert_array_equal(result, vecs)
+
+def test_empty_channel():
+   runs, values, offsets = rle_encode_blocks(np.zeros((0, 64), dtype=np.int32))
+   assert len(runs) == len(values) == 0 and offsets.tolist() == [0]
+   assert rle_decode_blocks([], [], [0]).shape == (0, 64)
+
+def test_last_nonzero_matches_loop():
+   vecs = _blocks(seed=2)
+   expected = [max([i for i, value in enumerate(vec) if value] or [-1]) for vec in vecs.tolist()]
+   assert last_nonzero(vecs).tolist() == expected
@@ -0,0 +1,118 @@
+# progressive scans (entropyEncoding.scan_symbols / huffman_decode_scan) against a per block reference coder
+import numpy as np
+import pytest
+
+from entropyEncoding import scan_symbols, scan_frequencies, build_huffman_table, huffman_encode_scan, \
+   huffman_decode_scan, MAX_EOB_RUN, ZRL_SYMBOL
+from codec import PROGRESSIVE_SCANS
+
+# straight from Annex G: one block at a time, pending EOBs counted up and written as EOBn once something
+# else has to be coded (or the run is full)
+def _reference_scan_symbols(zz, start: int, end: int):
+   symbols = []
+   if start == 0:
+      previous = 0
+      for dc in zz[:, 0].tolist():
+         size = abs(dc - previous).bit_length()
+         diff = dc - previous
+         symbols.append((size, diff if diff >= 0 else diff + (1 << size) - 1, size))
+         previous = dc
+      return symbols
+
+   eob_run = 0
+   def flush():
+      nonlocal eob_run
+      if eob_run:
+         bits = eob_run.bit_length() - 1
+         symbols.append((bits << 4, eob_run - (1 << bits), bits))
+         eob_run = 0
+
+   for block in zz.tolist():
+      band = block[start:end + 1]
+      coded = [k for k, value in enumerate(band) if value]
+      if coded:
+         flush()
+         run = 0
+         for value in band[:coded[-1] + 1]:
+            if not value:
+               run += 1
+               continue
+            while run >= 16:
+               symbols.append((ZRL_SYMBOL, 0, 0))
+               run -= 16
+            size = abs(value).bit_length()
+            symbols.append(((run << 4) | size, value if value >= 0 else value + (1 << size) - 1, size))
+            run = 0
+      if not coded or coded[-1] < len(band) - 1:
+         eob_run += 1
+         if eob_run == MAX_EOB_RUN:
+            flush()
+   flush()
+   return symbols
+
+# sparse blocks with the awkward stretches: empty runs, bands that end on their last position, long zero runs
+def _blocks(count: int = 400, seed: int = 0) -> np.ndarray:
+   rng = np.random.default_rng(seed)
+   zz = rng.integers(-30, 31, size=(count, 64)) * (rng.random((count, 64)) < 0.1)
+   zz[:, 0] = rng.integers(-100, 101, count)
+   zz[10:60, 1:] = 0                         # 50 blocks with nothing in any AC band
+   zz[60, 1:] = 0
+   zz[60, 5] = 3                             # band 1..5 ends on its last position: no EOB for this block
+   zz[61, 1:] = 0
+   zz[61, 63] = -2                           # 41 zeros then the last coefficient of band 21..63 (2 ZRLs)
+   zz[62] = rng.integers(1, 5, 64)           # every position set
+   return zz
+
+def _as_tuples(symbols, extra_values, extra_lengths):
+   return list(zip(np.asarray(symbols).tolist(), np.asarray(extra_values).tolist(), np.asarray(extra_lengths).tolist()))
+
+@pytest.mark.parametrize("scan", PROGRESSIVE_SCANS + ((1, 63), (7, 7)))
+def test_scan_symbols_match_reference(scan):
+   zz = _blocks()
+   assert _as_tuples(*scan_symbols(zz, *scan)) == _reference_scan_symbols(zz, *scan)
+
+def test_eob_runs_are_split_at_the_maximum():
+   zz = np.zeros((2 * MAX_EOB_RUN + 5, 64), dtype=np.int64)
+   zz[MAX_EOB_RUN + 1, 3] = 1
+   symbols = _as_tuples(*scan_symbols(zz, 1, 5))
+   assert symbols == _reference_scan_symbols(zz, 1, 5)
+   assert symbols[0] == (14 << 4, MAX_EOB_RUN - (1 << 14), 14) # EOB14, all bits set
+
+def _encode_scans(zz):
+   payloads = []
+   for start, end in PROGRESSIVE_SCANS:
+      table = build_huffman_table(scan_frequencies(zz, start, end))
+      payloads.append((start, end, table, huffman_encode_scan(zz, start, end, table)))
+   return payloads
+
+# one full block, the mixed blocks, and stretches of empty bands longer than one EOB run can hold
+def _round_trip_blocks(kind: str) -> np.ndarray:
+   if kind == "single":
+      return _blocks()[62:63]
+   if kind == "mixed":
+      return _blocks()
+   zz = np.zeros((2 * MAX_EOB_RUN + 10, 64), dtype=np.int64)
+   zz[MAX_EOB_RUN + 3, 2] = 7
+   return zz
+
+@pytest.mark.parametrize("kind", ["single", "mixed", "long_eob_runs"])
+def test_scans_round_trip(kind):
+   zz = _round_trip_blocks(kind)
+   result = np.zeros_like(zz)
+   for start, end, table, payload in _encode_scans(zz):
+      assert huffman_decode_scan(payload, result, start, end, table) == len(zz)
+   np.testing.assert_array_equal(result, zz)
+
+def test_truncated_scan_raises_or_stops_at_whole_blocks():
+   zz = _blocks(seed=1)
+   for start, end, table, payload in _encode_scans(zz):
+      cut = payload[:len(payload) // 2]
+      with pytest.raises(ValueError):
+         huffman_decode_scan(cut, np.zeros_like(zz), start, end, table)
+
+      result = np.zeros_like(zz)
+      done = huffman_decode_scan(cut, result, start, end, table, partial=True)
+      assert 0 <= done < len(zz)
+      expected = np.zeros_like(zz)
+      expected[:done, start:end + 1] = zz[:done, start:end + 1]
+      np.testing.assert_array_equal(result, expected)
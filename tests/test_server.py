@@ -0,0 +1,80 @@
+# server.py size limits and error statuses; jobs run on a thread pool here, the http side is the real one
+import asyncio
+import io
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from PIL import Image
+
+import codec
+import server
+from entropyEncoding import STANDARD_LUMA_DC, STANDARD_LUMA_AC, STANDARD_CHROMA_DC, STANDARD_CHROMA_AC
+from quantization import quality_tables
+
+# a v7 header for a 40000 x 40000 image with a single empty tile; decoding it would need ~6 GiB of coefficients
+def _huge_jpc() -> bytes:
+   luma, chroma = quality_tables(50)
+   count = 5000 * 5000
+   return bytes(codec.header_bytes(40000, 40000, 8, (count, count, count), 50, luma, chroma,
+                                   [STANDARD_LUMA_DC, STANDARD_LUMA_AC, STANDARD_CHROMA_DC, STANDARD_CHROMA_AC],
+                                   40000, 40000, "4:4:4", [0, 0]))
+
+def _png(width: int, height: int) -> bytes:
+   buffer = io.BytesIO()
+   Image.new("RGB", (width, height)).save(buffer, format="PNG")
+   return buffer.getvalue()
+
+def test_decode_job_checks_the_header_first():
+   with pytest.raises(server.ImageTooLarge):
+      server.decode_job(_huge_jpc(), 1, "float", "raw")
+   # v2 header claiming 2**31 - 1 blocks: a 400, not an allocation
+   lying = struct.pack(">4sBIIBIII", b"JPCS", 2, 800, 533, 8, 2 ** 31 - 1, 0, 0)
+   with pytest.raises(ValueError) as error:
+      server.decode_job(lying, 1, "float", "raw")
+   assert not isinstance(error.value, server.ImageTooLarge)
+
+def test_encode_job_checks_the_image_size():
+   with pytest.raises(server.ImageTooLarge):
+      server.encode_job(_png(100, 100), 50, "4:4:4", "float", False, max_pixels=5000)
+   assert server.encode_job(_png(100, 100), 50, "4:4:4", "float", False)[:4] == b"JPCS"
+
+# status of one POST through CodecServer.handle
+async def _post(codec_server, path: str, body: bytes) -> int:
+   listener = await asyncio.start_server(codec_server.handle, "127.0.0.1", 0)
+   async with listener:
+      port = listener.sockets[0].getsockname()[1]
+      reader, writer = await asyncio.open_connection("127.0.0.1", port)
+      writer.write(f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                   + body)
+      await writer.drain()
+      status_line = await reader.readline()
+      await reader.read()
+      writer.close()
+   return int(status_line.split()[1])
+
+def _failing(error):
+   def job(*args):
+      raise error
+   return job
+
+def test_statuses(monkeypatch):
+   codec_server = server.CodecServer(workers=1, executor=ThreadPoolExecutor(1))
+   try:
+      assert asyncio.run(_post(codec_server, "/decode", _huge_jpc())) == 413
+      assert asyncio.run(_post(codec_server, "/decode", b"JPCS nonsense")) == 400
+      monkeypatch.setattr(server, "decode_job", _failing(MemoryError()))
+      assert asyncio.run(_post(codec_server, "/decode", b"")) == 413
+   finally:
+      codec_server.close()
+
+def test_broken_pool_is_replaced(monkeypatch):
+   codec_server = server.CodecServer(workers=1, executor=ThreadPoolExecutor(1))
+   broken = codec_server.executor
+   monkeypatch.setattr(server, "decode_job", _failing(BrokenProcessPool()))
+   try:
+      assert asyncio.run(_post(codec_server, "/decode", b"")) == 503
+      assert codec_server.executor is not broken
+   finally:
+      codec_server.close()
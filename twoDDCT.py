@@ -1,49 +1,58 @@
 import numpy as np
 import math
+from functools import lru_cache
 
-# splits a 2D channel into 8×8 blocks
-def blockify(channel, block_size=8):
-    h, w = channel.shape
-    blocks = []
+from entropyEncoding import ZIGZAG_FLAT, last_nonzero
 
-    for i in range(0, h, block_size):
-        for j in range(0, w, block_size):
-            
-            # extract an 8x8 region
-            block = channel[i:i+block_size, j:j+block_size]
+# decoder block classes, by the zigzag index of the last nonzero coefficient
+BLOCK_CLASSES = ("zero", "dc_only", "sparse", "dense")
+ZERO_BLOCK, DC_ONLY_BLOCK, SPARSE_BLOCK, DENSE_BLOCK = range(4)
+# blocks with nothing at or past this zigzag index are sparse
+SPARSE_LENGTH = 16
 
-            #  if the block is smaller, pad with zeros
-            if block.shape != (block_size, block_size):
-                block = np.pad(
-                    block,
-                    (
-                        (0, block_size - block.shape[0]),
-                        (0, block_size - block.shape[1])
-                    ),
-                    mode='constant'
-                )
+# pads a 2D channel once so both sides are a multiple of block_size
+# pad_mode "constant" pads with zeros, "edge" repeats the last row / column
+# (edge padding avoids the ringing a hard drop to 0 causes on the right and bottom blocks)
+def pad_channel(channel, block_size=8, pad_mode="constant"):
+    h, w = channel.shape
+    pad_h = -h % block_size
+    pad_w = -w % block_size
+    if pad_h == 0 and pad_w == 0:
+        return channel
+    return np.pad(channel, ((0, pad_h), (0, pad_w)), mode=pad_mode)
+
+
+# splits a 2D channel into a (rows, cols, 8, 8) block tensor
+# this is a strided view of the (padded) channel, no block is copied
+def blockify_view(channel, block_size=8, pad_mode="constant"):
+    padded = pad_channel(np.asarray(channel), block_size, pad_mode)
+    rows = padded.shape[0] // block_size
+    cols = padded.shape[1] // block_size
+    return padded.reshape(rows, block_size, cols, block_size).swapaxes(1, 2)
+
+
+# folds a (rows, cols, 8, 8) or (rows*cols, 8, 8) block tensor back into a height x width channel
+def unblockify_view(blocks, height, width):
+    block_size = blocks.shape[-1]
+    rows = (height + block_size - 1) // block_size
+    cols = (width + block_size - 1) // block_size
+
+    blocks = blocks.reshape(rows, cols, block_size, block_size)
+    rebuilt = blocks.swapaxes(1, 2).reshape(rows * block_size, cols * block_size)
+    # remove padded edges if needed
+    return rebuilt[:height, :width]
 
-            blocks.append(block.astype(np.float32))
 
-    return blocks
+# splits a 2D channel into a list of 8×8 blocks (zero padded at the edges)
+def blockify(channel, block_size=8):
+    blocks = blockify_view(np.asarray(channel, dtype=np.float32), block_size)
+    return list(blocks.reshape(-1, block_size, block_size))
 
 
-# merges blocks back into 2D channels
+# merges a list of blocks back into 2D channels
 def unblockify(blocks, height, width, block_size=8):
-    # compute padded dimensions
-    padded_height = ((height + block_size - 1) // block_size) * block_size
-    padded_width  = ((width  + block_size - 1) // block_size) * block_size
-
-    rebuilt = np.zeros((padded_height, padded_width), dtype=np.float32)
-    idx = 0
-
-    # place each block back to its original position
-    for i in range(0, height, block_size):
-        for j in range(0, width, block_size):
-            rebuilt[i:i+block_size, j:j+block_size] = blocks[idx]
-            idx += 1
-    # remove padded edges if needed
-    return rebuilt[:height, :width]
+    blocks = np.asarray(blocks, dtype=np.float32).reshape(-1, block_size, block_size)
+    return unblockify_view(blocks, height, width)
 
 
 # normalization constant
@@ -93,3 +102,78 @@ def idct_2d(block):
             result[x, y] = 0.25 * sum_val
 
     return result
+
+
+# cosine basis matrix C with C[u, x] = 0.5 * alpha(u) * cos((2x+1) u pi / 2N), so dct_2d(B) == C @ B @ C.T
+# built once per (size, dtype) and shared read-only by every call
+@lru_cache(maxsize=None)
+def _dct_matrix(N, dtype):
+    C = np.zeros((N, N), dtype=np.float64)
+    for u in range(N):
+        for x in range(N):
+            C[u, x] = math.sqrt(2 / N) * _alpha(u) * math.cos((2*x+1)*u*math.pi/(2*N))
+    C = C.astype(dtype)
+    C.setflags(write=False)
+    return C
+
+
+def dct_matrix(N=8, dtype=np.float32):
+    return _dct_matrix(N, np.dtype(dtype))
+
+
+# batched 2D DCT: takes any (..., N, N) stack of blocks, e.g. (num_blocks, 8, 8)
+# or a padded channel reshaped to (rows, cols, 8, 8), and transforms every block in one matmul
+# dtype picks the float32 or float64 variant
+def dct_2d_blocks(blocks, dtype=np.float32):
+    blocks = np.asarray(blocks, dtype=dtype)
+    C = dct_matrix(blocks.shape[-1], dtype)
+    return C @ blocks @ C.T
+
+
+# batched inverse of dct_2d_blocks: C.T @ F @ C for every block
+def idct_2d_blocks(blocks, dtype=np.float32):
+    blocks = np.asarray(blocks, dtype=dtype)
+    C = dct_matrix(blocks.shape[-1], dtype)
+    return C.T @ blocks @ C
+
+
+# reduced inverse DCT for scaled decodes: the low k x k corner of (..., N, N) coefficient blocks back to
+# (..., k, k) pixel blocks, each pixel roughly the mean of an N/k x N/k patch of the full size block
+# k = 1 is just DC / N, so a 1/8 decode never does a transform at all
+def idct_2d_reduced(blocks, k, block_size=8, dtype=np.float32):
+    corner = np.asarray(blocks, dtype=dtype)[..., :k, :k]
+    C = dct_matrix(k, dtype)
+    return (C.T @ corner @ C) * (k / block_size)
+
+
+# pixel block of every zigzag position: row i is the flattened 8x8 basis image of zigzag coefficient i
+@lru_cache(maxsize=None)
+def _zigzag_basis(dtype):
+    C = _dct_matrix(8, np.dtype(np.float64))
+    basis = np.einsum("ux,vy->uvxy", C, C).reshape(64, 64)[ZIGZAG_FLAT].astype(dtype)
+    basis.setflags(write=False)
+    return basis
+
+
+# class of every (N, 64) zigzag block: 0 zero, 1 DC only, 2 sparse, 3 dense (see BLOCK_CLASSES)
+def classify_blocks(zz, sparse_length=SPARSE_LENGTH):
+    return np.digitize(last_nonzero(zz), [0, 1, sparse_length])
+
+
+# dequantize + inverse DCT of (N, 64) zigzag coefficients to (N, 8, 8) pixel blocks, doing only the work each
+# block needs: all zero blocks stay 0, DC only blocks are filled with DC / 8, sparse blocks sum just their first
+# SPARSE_LENGTH basis images and dense blocks all 64, each group in one matrix product straight from zigzag order
+def idct_zigzag_blocks(zz, q_matrix, dtype=np.float32):
+    zz = np.asarray(zz)
+    q_zz = np.asarray(q_matrix, dtype=dtype).reshape(64)[ZIGZAG_FLAT]
+    basis = _zigzag_basis(np.dtype(dtype))
+    classes = classify_blocks(zz)
+    out = np.zeros((len(zz), 64), dtype=dtype)
+
+    dc_only = np.flatnonzero(classes == DC_ONLY_BLOCK)
+    out[dc_only] = zz[dc_only, :1].astype(dtype) * (q_zz[0] / 8)
+    for block_class, length in ((SPARSE_BLOCK, SPARSE_LENGTH), (DENSE_BLOCK, 64)):
+        rows = np.flatnonzero(classes == block_class)
+        if len(rows):
+            out[rows] = (zz[rows, :length].astype(dtype) * q_zz[:length]) @ basis[:length]
+    return out.reshape(-1, 8, 8)